@@ -0,0 +1,172 @@
+"""Débit du tunnel pendant des téléchargements simultanés sur l'interface d'administration.
+
+Un VPNHost (backend fake) et un client relié par TLS, comme bench_tunnel ; des
+processus de charge (--load-processes x --load-threads connexions HTTP
+persistantes) téléchargent /download/<user>/cert pendant la mesure du débit
+montant, à --rate requêtes/s au total (0: sans pause, ce qui sature le CPU sur
+une machine à un cœur quel que soit le mode). Modes d'administration :
+  - idle     : pas de charge (référence du débit du tunnel) ;
+  - werkzeug : serveur threadé de Werkzeug dans un thread de l'hôte (comme avant) ;
+  - waitress : waitress (--threads) dans un thread de l'hôte ;
+  - process  : waitress dans un processus séparé (start_admin_process), même base d'utilisateurs.
+Les processus de charge sont hors du processus de l'hôte dans tous les modes.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from common import free_port, make_pki
+from bench_tunnel import Receiver, Testbed, percentile, run_phase, send_upstream
+from vpn import AdminInterface, CertificateManager, UserManager
+from vpn.admin import start_admin_process
+
+
+def load_worker(url, threads, interval, stop, results):
+    """Processus de charge: `threads` connexions qui téléchargent (une requête par `interval` s) jusqu'à `stop`"""
+    counts, latencies, errors = [0] * threads, [], [0]
+    lock = threading.Lock()
+
+    def loop(index):
+        session = requests.Session()
+        local = []
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            if interval:
+                # Charge ouverte: le rythme ne dépend pas du temps de réponse
+                next_at += interval
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+            t0 = time.perf_counter()
+            try:
+                response = session.get(url, timeout=10)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                counts[index] += 1
+                local.append(time.perf_counter() - t0)
+            else:
+                errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=loop, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((sum(counts), errors[0], latencies))
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Administration injoignable: {url}")
+
+
+def measure(mode, args):
+    bed = Testbed(1, 32 * 1024, 0.0, 'threads')
+    admin = admin_process = None
+    load = []
+    try:
+        if mode in ('werkzeug', 'waitress'):
+            admin = AdminInterface(port=free_port(), user_manager=UserManager(), cert_manager=CertificateManager(),
+                                   server=mode, threads=args.threads)
+            threading.Thread(target=admin.run, daemon=True).start()
+            port = admin.port
+        elif mode == 'process':
+            port = free_port()
+            admin_process = start_admin_process(port=port, server='waitress', threads=args.threads, log_level=None)
+        url = None if mode == 'idle' else f"http://127.0.0.1:{port}/download/bench0/cert"
+
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        if url:
+            wait_for(url)
+            interval = args.load_processes * args.load_threads / args.rate if args.rate else 0
+            load = [multiprocessing.Process(target=load_worker, args=(url, args.load_threads, interval, stop, results))
+                    for _ in range(args.load_processes)]
+            for process in load:
+                process.start()
+            time.sleep(args.warmup)
+
+        receiver = Receiver([bed.host.packet_io.peer])
+        load_start = time.perf_counter()
+        expected, elapsed, _ = run_phase(bed, receiver, send_upstream, args.packets, args.size, 0)
+        received = receiver.received
+        receiver.stop()
+        stop.set()
+        load_elapsed = time.perf_counter() - load_start + (args.warmup if url else 0)
+        requests_done, errors, latencies = 0, 0, []
+        for _ in load:
+            count, failed, values = results.get(timeout=60)
+            requests_done += count
+            errors += failed
+            latencies.extend(values)
+        for process in load:
+            process.join()
+    finally:
+        bed.close()
+        if admin is not None:
+            admin.stop()
+        if admin_process is not None:
+            admin_process.terminate()
+            admin_process.join(10)
+    return {
+        'pps': received / elapsed if elapsed > 0 else 0,
+        'lost': expected - received,
+        'rps': requests_done / load_elapsed if load else None,
+        'errors': errors,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du tunnel pendant des téléchargements sur l'administration")
+    parser.add_argument('--modes', nargs='+', choices=['idle', 'werkzeug', 'waitress', 'process'],
+                        default=['idle', 'werkzeug', 'waitress', 'process'])
+    parser.add_argument('--threads', type=int, default=8, help='Threads de waitress')
+    parser.add_argument('--load-processes', type=int, default=2)
+    parser.add_argument('--load-threads', type=int, default=16, help='Connexions HTTP simultanées par processus de charge')
+    parser.add_argument('--rate', type=float, default=200, help='Requêtes/s au total (0: sans pause)')
+    parser.add_argument('--packets', type=int, default=50000, help='Paquets montants pour la mesure de débit')
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--warmup', type=float, default=1.0, help='Secondes de charge avant la mesure')
+    args = parser.parse_args()
+
+    # Une ligne de journal par requête du serveur Werkzeug: pas d'écriture sur la console pendant la mesure
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)  # « Task queue depth » quand tous les threads sont pris
+    make_pki(['bench0'])
+    print(f"{os.cpu_count()} cœur(s), {args.load_processes}x{args.load_threads} connexions HTTP, "
+          f"{args.rate or 'max'} requêtes/s, "
+          f"{args.packets} paquets de {args.size} o")
+    reference = None
+    for mode in args.modes:
+        result = measure(mode, args)
+        reference = reference or (result['pps'] if mode == 'idle' else None)
+        line = f"{mode:>9}: tunnel {result['pps']:9.0f} pps"
+        if reference:
+            line += f" ({result['pps'] / reference:6.1%} de idle)"
+        line += f", perdus={result['lost']}"
+        if result['p50'] is not None:
+            line += (f" | admin {result['rps']:7.0f} req/s, erreurs={result['errors']}, "
+                     f"p50={result['p50'] * 1e3:.1f} ms p99={result['p99'] * 1e3:.1f} ms")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
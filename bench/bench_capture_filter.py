@@ -0,0 +1,115 @@
+"""Paquets remontés du noyau vers Python par la capture du client, avec et sans le filtre BPF.
+
+Un générateur émet sur l'interface réelle un mélange de trafic synthétique :
+le flux TLS du tunnel lui-même (TCP vers l'hôte VPN), de la diffusion et du
+multicast, et du trafic utilisateur à tunneler (UDP). Deux captures tournent en
+parallèle sur le même trafic : l'ancien filtre "ip" et client_capture_filter().
+Nécessite root et libpcap (compilation des filtres par scapy).
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scapy.all import IP, TCP, UDP, raw
+from vpn.packet_io import ScapyPacketIO, client_capture_filter, route_source_address
+
+USER_PORT = 6000  # Port destination du trafic utilisateur, reconnaissable à la capture
+
+
+class Capture:
+    """Compte les paquets livrés par un backend scapy, et parmi eux le trafic utilisateur"""
+
+    def __init__(self, capture_filter):
+        self.packet_io = ScapyPacketIO(capture_filter=capture_filter)
+        self.packet_io.open()
+        self.captured = 0
+        self.user_packets = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            data = self.packet_io.read_packet(timeout=0.2)
+            if data is None:
+                continue
+            self.captured += 1
+            if data[9] == 17 and int.from_bytes(data[22:24], 'big') == USER_PORT:
+                self.user_packets += 1
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.packet_io.close()
+
+
+def build_mix(local_ip, server_ip, server_port, target_ip, self_ratio, noise_ratio, size):
+    """Un cycle de 100 paquets dans les proportions demandées"""
+    self_count = int(100 * self_ratio)
+    noise_count = int(100 * noise_ratio)
+    user_count = 100 - self_count - noise_count
+    padding = b'x' * max(0, size - 40)
+    tunnel = raw(IP(src=local_ip, dst=server_ip) / TCP(sport=50000, dport=server_port, flags='PA') / padding)
+    broadcast = raw(IP(src=local_ip, dst='255.255.255.255') / UDP(sport=68, dport=67) / padding)
+    multicast = raw(IP(src=local_ip, dst='224.0.0.251') / UDP(sport=5353, dport=5353) / padding)
+    user = raw(IP(src=local_ip, dst=target_ip) / UDP(sport=40000, dport=USER_PORT) / padding)
+    mix = [tunnel] * self_count + [user] * user_count
+    mix += [broadcast if i % 2 else multicast for i in range(noise_count)]
+    return mix, user_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture client avec et sans filtre BPF (root, libpcap)')
+    parser.add_argument('--server', default='198.51.100.1', help="Adresse de l'hôte VPN simulé")
+    parser.add_argument('--server-port', type=int, default=1194)
+    parser.add_argument('--target', default='203.0.113.1', help='Destination du trafic utilisateur')
+    parser.add_argument('--self-ratio', type=float, default=0.8, help='Part du trafic du tunnel lui-même')
+    parser.add_argument('--noise-ratio', type=float, default=0.1, help='Part de diffusion et de multicast')
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    local_ip = route_source_address(args.server)
+    if local_ip is None:
+        sys.exit(f"Pas de route vers {args.server}")
+    client_filter = client_capture_filter(args.server, args.server_port, local_ip)
+    print(f"Filtre client: {client_filter}")
+
+    mix, user_per_cycle = build_mix(local_ip, args.server, args.server_port, args.target,
+                                    args.self_ratio, args.noise_ratio, args.size)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    captures = {'ip': Capture('ip'), 'client': Capture(client_filter)}
+    time.sleep(0.5)
+    sent = user_sent = 0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        for packet in mix:
+            sender.sendto(packet, (socket.inet_ntoa(packet[16:20]), 0))
+        sent += len(mix)
+        user_sent += user_per_cycle
+    elapsed = time.perf_counter() - start
+    time.sleep(0.5)
+    for capture in captures.values():
+        capture.stop()
+    cpu = time.process_time() - cpu_start
+    sender.close()
+
+    print(f"Émis: {sent} paquets ({sent / elapsed:.0f}/s), dont {user_sent} à tunneler; CPU du processus {cpu:.2f} s")
+    for name, capture in captures.items():
+        print(f"{name:>7}: {capture.captured:>9} paquets remontés ({capture.captured / elapsed:>9.0f}/s), "
+              f"trafic utilisateur {capture.user_packets}/{user_sent}")
+    baseline = captures['ip'].captured
+    if baseline:
+        print(f"Réduction des paquets remontés: {1 - captures['client'].captured / baseline:.1%}")
+
+
+if __name__ == '__main__':
+    main()
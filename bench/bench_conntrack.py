@@ -0,0 +1,57 @@
+"""Microbenchmark du suivi de connexions: insertions et recherches sur N flux"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vpn.conntrack import ConnTrack, PROTO_UDP
+
+
+def flow_tuple(i):
+    # Clients et correspondants variés pour obtenir N 5-tuples distincts
+    src = f"10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}"
+    dst = f"93.184.{(i >> 8) & 0xFF}.{i & 0xFF}"
+    return src, 1024 + (i % 50000), dst, 53 + (i % 7)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du suivi de connexions')
+    parser.add_argument('--flows', type=int, default=1_000_000, help='Nombre de flux')
+    args = parser.parse_args()
+
+    n = args.flows
+    conntrack = ConnTrack('203.0.113.1', max_entries=n)
+    session = object()
+    tuples = [flow_tuple(i) for i in range(n)]
+    now = time.monotonic()
+
+    start = time.perf_counter()
+    nat_ports = []
+    for src, sport, dst, dport in tuples:
+        nat_ports.append(conntrack.track_outbound(session, PROTO_UDP, src, sport, dst, dport, now=now).nat_port)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for (src, sport, dst, dport), nat_port in zip(tuples, nat_ports):
+        conntrack.lookup_inbound(PROTO_UDP, dst, dport, nat_port, now=now)
+    lookup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for src, sport, dst, dport in tuples:
+        conntrack.track_outbound(session, PROTO_UDP, src, sport, dst, dport, now=now)
+    refresh_time = time.perf_counter() - start
+
+    print(f"Flux: {len(conntrack)}")
+    print(f"Insertions:      {n / insert_time:12.0f} /s")
+    print(f"Recherches:      {n / lookup_time:12.0f} /s")
+    print(f"Rafraîchissements: {n / refresh_time:10.0f} /s")
+
+    start = time.perf_counter()
+    expired = conntrack.expire(now=now + 3600)
+    print(f"Expiration de {expired} flux en {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Paquets/s du NAT rapide (fastpath) face à la version scapy.
+
+L'égalité octet par octet des deux versions est vérifiée par tests/test_fastpath.py.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scapy.all import IP, TCP, UDP, ICMP, Raw
+from vpn.conntrack import ConnTrack
+from vpn.nat import translate_outbound, translate_outbound_scapy
+
+PUBLIC_IP = '203.0.113.1'
+
+
+def build_corpus(count, seed):
+    """Paquets clients variés (TCP avec options, UDP avec ou sans somme, ICMP, fragments)"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        ip = IP(src=f"10.8.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+                dst=f"198.51.100.{rng.randrange(1, 255)}",
+                ttl=rng.randrange(1, 255), id=rng.randrange(65536))
+        payload = Raw(bytes(rng.randrange(256) for _ in range(rng.choice([0, 1, 17, 512, 1400]))))
+        kind = i % 5
+        if kind == 0:
+            pkt = ip / TCP(sport=rng.randrange(1, 65536), dport=rng.choice([80, 443, 22]),
+                           flags=rng.choice(['S', 'A', 'PA', 'FA', 'R']), seq=rng.randrange(2 ** 32),
+                           options=[('MSS', 1460), ('NOP', None), ('WScale', 7)]) / payload
+        elif kind == 1:
+            pkt = ip / TCP(sport=rng.randrange(1, 65536), dport=443, flags='PA') / payload
+        elif kind == 2:
+            pkt = ip / UDP(sport=rng.randrange(1, 65536), dport=53) / payload
+        elif kind == 3:
+            # UDP sans somme de contrôle
+            pkt = IP(bytes(ip / UDP(sport=rng.randrange(1, 65536), dport=123, chksum=0) / payload))
+        else:
+            pkt = ip / ICMP(type=8, id=rng.randrange(65536), seq=i & 0xFFFF) / payload
+        corpus.append(bytes(pkt))
+    # Fragment non initial: seule l'adresse source est traduite
+    corpus.append(bytes(IP(src='10.8.0.9', dst='198.51.100.7', proto=17, frag=185) / Raw(b'x' * 64)))
+    return corpus
+
+
+def measure(translate, corpus, repeat):
+    conntrack = ConnTrack(PUBLIC_IP, max_entries=len(corpus) * 2)
+    session = object()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for packet in corpus:
+            translate(conntrack, session, packet)
+    return len(corpus) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du NAT rapide')
+    parser.add_argument('--packets', type=int, default=2000, help='Taille du corpus')
+    parser.add_argument('--repeat', type=int, default=5, help='Passes pour le benchmark du fastpath')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.packets, args.seed)
+    fast_pps = measure(translate_outbound, corpus, args.repeat)
+    scapy_pps = measure(translate_outbound_scapy, corpus, 1)
+    print(f"fastpath: {fast_pps:10.0f} paquets/s")
+    print(f"scapy:    {scapy_pps:10.0f} paquets/s")
+    print(f"Gain:     {fast_pps / scapy_pps:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Poignées de main TLS par seconde contre un hôte local: complètes ou reprises (ticket de session)"""
+import argparse
+import io
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from vpn import AsyncVPNHost
+
+
+def fetch_session(context, port):
+    """Connexion complète, puis attente des tickets de session (envoyés après la poignée de main en TLS 1.3)"""
+    with socket.create_connection(('127.0.0.1', port)) as raw:
+        with context.wrap_socket(raw) as sock:
+            sock.settimeout(0.2)
+            try:
+                sock.recv(1)
+            except socket.timeout:
+                pass
+            return sock.session
+
+
+def handshakes(context, port, count, session=None):
+    """Enchaîne `count` connexions; retourne (poignées de main/s, connexions reprises)"""
+    reused = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        with socket.create_connection(('127.0.0.1', port)) as raw:
+            with context.wrap_socket(raw, session=session) as sock:
+                reused += sock.session_reused
+    return count / (time.perf_counter() - start), reused
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poignées de main TLS complètes vs reprises')
+    parser.add_argument('--count', type=int, default=300)
+    parser.add_argument('--key-type', choices=['rsa', 'ecdsa'], default='rsa', help='Profil des certificats générés')
+    args = parser.parse_args()
+
+    make_pki(['bench'], key_type=args.key_type)
+    port = free_port()
+    # Les messages de l'hôte (une ligne par connexion) ne sont pas affichés
+    out = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        host = AsyncVPNHost(host='127.0.0.1', port=port, packet_backend='null')
+        threading.Thread(target=host.start, daemon=True).start()
+        time.sleep(0.5)
+        context = client_context('bench')
+        full_rate, _ = handshakes(context, port, args.count)
+        session = fetch_session(context, port)
+        resumed_rate, reused = handshakes(context, port, args.count, session)
+        host.stop()
+    finally:
+        sys.stdout = out
+
+    print(f"Certificats: {args.key_type}")
+    print(f"Poignées de main complètes: {full_rate:.0f} /s")
+    print(f"Poignées de main reprises:  {resumed_rate:.0f} /s ({reused}/{args.count} reprises, x{resumed_rate / full_rate:.1f})")
+
+
+if __name__ == '__main__':
+    main()
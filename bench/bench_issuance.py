@@ -0,0 +1,97 @@
+"""Utilisateurs créés par seconde via l'interface d'administration, avant et après le pool de délivrance.
+
+  - before : chemin d'origine de /create_user, reproduit tel quel (CA relue et
+    reparsée depuis le disque, clé RSA générée dans le thread de la requête) ;
+  - single : POST /create_user l'un après l'autre (CA en mémoire, clé du pool de processus) ;
+  - reserve: idem, avec une réserve de clés générées d'avance (--reserve) ;
+  - bulk   : un seul POST /bulk_create, suivi de /jobs/<id> jusqu'à la fin.
+Pendant la création en masse, la page d'accueil est chargée en boucle pour
+mesurer la réactivité de l'interface.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import make_pki
+from bench_tunnel import percentile
+from vpn import AdminInterface, CertificateManager, UserManager
+
+
+def before(count, prefix):
+    """Création d'origine: un CertificateManager sans cache et une clé générée sur place par utilisateur"""
+    user_manager = UserManager()
+    start = time.perf_counter()
+    for index in range(count):
+        username = f"{prefix}{index}"
+        cert_manager = CertificateManager()  # Rien n'est gardé d'une requête à l'autre
+        ca_key, ca_cert = cert_manager.generate_ca_cert()
+        cert_manager.generate_user_cert(username, ca_key, ca_cert)
+        folder = f"users/{username}"
+        user_manager.add_user(username, folder, f"{folder}/{username}.crt", f"{folder}/{username}.key")
+    return count / (time.perf_counter() - start)
+
+
+def sequential(client, count, prefix):
+    start = time.perf_counter()
+    for index in range(count):
+        response = client.post('/create_user', data={'username': f"{prefix}{index}"})
+        assert response.status_code == 302, response.data
+    return count / (time.perf_counter() - start)
+
+
+def bulk(client, count, prefix):
+    """Création en masse; retourne (utilisateurs/s, latences de la page d'accueil pendant la tâche)"""
+    start = time.perf_counter()
+    response = client.post('/bulk_create', json={'usernames': [f"{prefix}{index}" for index in range(count)]})
+    job = response.get_json()['job']
+    latencies = []
+    while True:
+        t0 = time.perf_counter()
+        client.get('/')
+        latencies.append(time.perf_counter() - t0)
+        status = client.get(f'/jobs/{job}').get_json()
+        if status['state'] == 'done':
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    if status['failed']:
+        print(f"  échecs: {status['failed']} ({next(iter(status['errors'].values()))})")
+    return status['issued'] / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Création d\'utilisateurs par seconde (administration)')
+    parser.add_argument('--count', type=int, default=50, help='Utilisateurs créés par mode')
+    parser.add_argument('--reserve', type=int, default=50, help='Taille de la réserve de clés du mode reserve')
+    parser.add_argument('--key-type', choices=['rsa', 'ecdsa'], default='rsa')
+    args = parser.parse_args()
+
+    make_pki([], key_type=args.key_type)
+    print(f"{os.cpu_count()} cœur(s), clés {args.key_type}, {args.count} utilisateurs par mode")
+    print(f" before: {before(args.count, 'before'):8.1f} utilisateurs/s")
+
+    admin = AdminInterface(user_manager=UserManager(), cert_manager=CertificateManager(key_type=args.key_type))
+    client = admin.app.test_client()
+    client.post('/create_user', data={'username': 'warmup'})  # Démarrage des processus du pool
+    print(f" single: {sequential(client, args.count, 'single'):8.1f} utilisateurs/s")
+    rate, latencies = bulk(client, args.count, 'bulk')
+    print(f"   bulk: {rate:8.1f} utilisateurs/s, page d'accueil pendant la tâche: "
+          f"p50={percentile(latencies, 0.5) * 1e3:.1f} ms p99={percentile(latencies, 0.99) * 1e3:.1f} ms")
+    admin.key_pool.close()
+
+    admin = AdminInterface(user_manager=UserManager(), cert_manager=CertificateManager(key_type=args.key_type),
+                           key_pool_size=args.reserve)
+    client = admin.app.test_client()
+    deadline = time.monotonic() + 600
+    while len(admin.key_pool.keys) < args.reserve and time.monotonic() < deadline:
+        time.sleep(0.1)
+    print(f"reserve: {sequential(client, args.count, 'reserve'):8.1f} utilisateurs/s "
+          f"({admin.key_pool.stats()['served_from_reserve']} clés prises dans la réserve)")
+    admin.key_pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Débit utile du tunnel sous perte de paquets : flux TLS contre transport datagramme (UDP chiffré).
+
+Un relais sur localhost se place entre le client et l'hôte (backend 'fake') :
+  - UDP : chaque datagramme est perdu avec la probabilité --loss ;
+  - TCP : la perte d'un segment ne se voit pas comme une perte mais comme un
+    arrêt du flux entier le temps de la retransmission (blocage en tête de
+    file). Le relais lit le flux par segments de --mss octets et, avec la
+    probabilité --loss, attend --stall secondes (RTO minimal de Linux par
+    défaut) avant de le transmettre, avec tout ce qui le suit.
+C'est un modèle : sans la réduction de la fenêtre de congestion, il est même
+favorable au flux TLS. Avec --netem (root et module sch_netem), la perte est
+appliquée par le noyau sur l'interface loopback et les relais ne perdent rien.
+
+Le client émet à débit constant (--rate paquets/s) pendant --duration
+secondes ; on mesure les paquets livrés côté réseau, le débit utile et la latence.
+"""
+import argparse
+import os
+import random
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from bench_tunnel import BASE_PORT, REMOTE_IP, REMOTE_PORT, Receiver, percentile, udp_packet
+from vpn import VPNHost, VpnTunnel
+from vpn.packet_io import SocketPairPacketIO
+
+
+class TcpRelay:
+    """Relais TCP qui bloque le flux montant le temps d'une « retransmission » (chaque connexion séparément)"""
+
+    def __init__(self, target, loss, stall, mss):
+        self.target = target
+        self.loss = loss
+        self.stall = stall
+        self.mss = mss
+        self.stalls = 0
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.pump, args=(client, upstream, True), daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, client, False), daemon=True).start()
+
+    def pump(self, source, sink, lossy):
+        while True:
+            try:
+                data = source.recv(self.mss)
+                if not data:
+                    break
+                if lossy and random.random() < self.loss:
+                    self.stalls += 1
+                    time.sleep(self.stall)
+                sink.sendall(data)
+            except OSError:
+                break
+        for sock in (source, sink):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class UdpRelay:
+    """Relais UDP qui perd une fraction des datagrammes, dans les deux sens"""
+
+    def __init__(self, target, loss):
+        self.target = target
+        self.loss = loss
+        self.dropped = 0
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.front.bind(('127.0.0.1', 0))
+        self.port = self.front.getsockname()[1]
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.back.connect(target)
+        self.client = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            ready, _, _ = select.select([self.front, self.back], [], [])
+            for sock in ready:
+                if sock is self.front:
+                    data, self.client = self.front.recvfrom(65535)
+                    out = lambda d: self.back.send(d)
+                else:
+                    data = self.back.recv(65535)
+                    if self.client is None:
+                        continue
+                    out = lambda d: self.front.sendto(d, self.client)
+                if random.random() < self.loss:
+                    self.dropped += 1
+                    continue
+                out(data)
+
+
+def netem(loss):
+    """Applique (ou retire, loss=None) une perte aléatoire sur l'interface loopback"""
+    subprocess.run(['tc', 'qdisc', 'del', 'dev', 'lo', 'root'], stderr=subprocess.DEVNULL)
+    if loss:
+        subprocess.run(['tc', 'qdisc', 'add', 'dev', 'lo', 'root', 'netem', 'loss', f'{loss * 100}%'], check=True)
+
+
+def measure(transport, loss, args):
+    relay_loss = 0 if args.netem else loss
+    port = free_port()
+    host = VPNHost(host='127.0.0.1', port=port, packet_backend='fake', udp_port=0, batch_delay=0)
+    udp_relay = UdpRelay(('127.0.0.1', host.datagram_server.port), relay_loss)
+    host.datagram_server.public_port = udp_relay.port
+    threading.Thread(target=host.start, daemon=True).start()
+    time.sleep(0.3)
+    tcp_relay = TcpRelay(('127.0.0.1', port), relay_loss, args.stall, args.mss)
+    if args.netem:
+        netem(loss)
+
+    sock = client_context('bench0').wrap_socket(socket.create_connection(('127.0.0.1', tcp_relay.port)))
+    packet_io = SocketPairPacketIO()
+    tunnel = VpnTunnel(sock, is_client=True, server_ip='127.0.0.1', packet_io=packet_io, batch_delay=0,
+                       datagram=transport == 'udp')
+    tunnel.start_tunnel()
+    deadline = time.monotonic() + 5
+    while transport == 'udp' and tunnel.datagram is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+    receiver = Receiver([host.packet_io.peer])
+    src = bytes([10, 8, 0, 2])
+    count = int(args.rate * args.duration)
+    start = time.perf_counter()
+    for seq in range(count):
+        packet_io.peer.send(udp_packet(src, REMOTE_IP, BASE_PORT, REMOTE_PORT, args.size, 0, seq))
+        # Débit constant, sans dériver si un envoi a pris du retard
+        delay = start + (seq + 1) / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    receiver.wait(count, idle=max(2.0, 3 * args.stall))
+    elapsed = (receiver.last_arrival or time.perf_counter()) - start
+    receiver.stop()
+    if args.netem:
+        netem(None)
+    tunnel.stop_tunnel()
+
+    p50, p99 = percentile(receiver.latencies, 0.5), percentile(receiver.latencies, 0.99)
+    return {
+        'transport': transport,
+        'loss': loss,
+        'sent': count,
+        'delivered': receiver.received,
+        'goodput_mbps': round(receiver.bytes * 8 / elapsed / 1e6, 2) if elapsed > 0 else 0,
+        'latency_p50_ms': round(p50 * 1e3, 2) if p50 is not None else None,
+        'latency_p99_ms': round(p99 * 1e3, 2) if p99 is not None else None,
+        'send_queue_dropped': tunnel.send_queue.dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Débit utile sous perte: flux TLS vs datagrammes UDP chiffrés')
+    parser.add_argument('--losses', type=float, nargs='+', default=[0.0, 0.01, 0.02, 0.05])
+    parser.add_argument('--transports', nargs='+', choices=['tls', 'udp'], default=['tls', 'udp'])
+    parser.add_argument('--rate', type=int, default=2000, help='Paquets par seconde émis par le client')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--stall', type=float, default=0.2, help='Arrêt du flux TCP par segment perdu (secondes)')
+    parser.add_argument('--mss', type=int, default=1448)
+    parser.add_argument('--netem', action='store_true', help='Perte réelle sur lo via tc netem (root)')
+    args = parser.parse_args()
+
+    make_pki(['bench0'])
+    for loss in args.losses:
+        for transport in args.transports:
+            r = measure(transport, loss, args)
+            print(f"{transport:>4} perte={loss:>5.1%}: livrés {r['delivered']:>6}/{r['sent']} "
+                  f"débit utile {r['goodput_mbps']:>6.2f} Mbit/s p50={r['latency_p50_ms']} ms "
+                  f"p99={r['latency_p99_ms']} ms rejetés (file)={r['send_queue_dropped']}")
+
+
+if __name__ == '__main__':
+    main()
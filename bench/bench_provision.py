@@ -0,0 +1,71 @@
+"""Provisionnement de N utilisateurs: boucle d'origine de generate_certs.py contre provision().
+
+  - legacy : generate_user_cert l'un après l'autre sur un cœur, puis un add_user
+    par utilisateur qui réécrit tout users.json (indent=4), comme avant ;
+  - pool   : vpn.issuance.provision (pool de processus, dossiers écrits
+    atomiquement, une seule écriture du journal à la fin).
+Chaque mode part d'un dossier vide avec la même CA. Octets écrits pour la base
+d'utilisateurs: somme des réécritures pour legacy, journal et instantané pour pool.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import make_pki
+from vpn import CertificateManager, UserManager
+from vpn.issuance import provision
+
+
+def legacy(usernames, cert_manager):
+    ca_key, ca_cert = cert_manager.generate_ca_cert()
+    users = {}
+    written = 0
+    for username in usernames:
+        cert_manager.generate_user_cert(username, ca_key, ca_cert)
+        folder = f"users/{username}"
+        users[username] = {'folder': folder, 'cert_file': f"{folder}/{username}.crt", 'key_file': f"{folder}/{username}.key"}
+        with open('users-legacy.json', 'w') as f:
+            json.dump(users, f, indent=4)
+            written += f.tell()
+    return written
+
+
+def run(mode, count, key_type, workers):
+    workdir = make_pki([], workdir=tempfile.mkdtemp(prefix=f'vpn-provision-{mode}-'), key_type=key_type)
+    cert_manager = CertificateManager(key_type=key_type)
+    usernames = [f"user{index:05d}" for index in range(count)]
+    start = time.perf_counter()
+    if mode == 'legacy':
+        written = legacy(usernames, cert_manager)
+    else:
+        result = provision(usernames, cert_manager, UserManager(), workers=workers)
+        assert result['created'] == count, result['failed']
+        written = sum(os.path.getsize(name) for name in ('users.json', 'users.json.journal'))
+    elapsed = time.perf_counter() - start
+    files = sum(len(names) for _, _, names in os.walk(os.path.join(workdir, 'users')))
+    return elapsed, written, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provisionnement en masse: boucle d\'origine vs pool de processus')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--key-type', choices=['rsa', 'ecdsa'], default='ecdsa',
+                        help='ecdsa par défaut: 10k clés RSA prennent ~15 min par cœur')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--modes', nargs='+', choices=['legacy', 'pool'], default=['legacy', 'pool'])
+    args = parser.parse_args()
+
+    print(f"{args.count} utilisateurs, clés {args.key_type}, {os.cpu_count()} cœur(s)")
+    for mode in args.modes:
+        elapsed, written, files = run(mode, args.count, args.key_type, args.workers)
+        print(f"{mode:>6}: {elapsed:7.1f} s ({args.count / elapsed:7.1f} utilisateurs/s), "
+              f"base d'utilisateurs: {written / 1e6:8.1f} Mo écrits, {files} fichiers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Débit du tunnel selon le nombre K de connexions TLS parallèles, pour un flux unique et pour de nombreux flux.
+
+Comme bench_loss, un relais TCP sur localhost modélise la perte d'un segment
+par un arrêt de la connexion le temps de la retransmission (--stall) : chaque
+connexion TLS se bloque indépendamment des autres. Le client ouvre une
+connexion principale qui demande K connexions, puis K-1 connexions qui
+rejoignent le groupe avec le jeton reçu (comme VPNClient.open_streams).
+
+Deux charges à débit constant (--rate paquets/s) :
+  - single : un seul 5-tuple, toujours sur la même connexion ;
+  - many   : --flows ports source différents, répartis par hachage.
+Un flux unique ne profite pas des connexions parallèles (il garde son ordre) ;
+de nombreux flux ne subissent plus que les arrêts de leur propre connexion.
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from bench_loss import TcpRelay
+from bench_tunnel import BASE_PORT, REMOTE_IP, REMOTE_PORT, Receiver, percentile, udp_packet
+from vpn import VPNHost, VpnTunnel
+from vpn.packet_io import SocketPairPacketIO
+
+
+def connect_streams(port, streams, username='bench0'):
+    """Connexion principale et connexions parallèles d'un client; retourne la liste des tunnels"""
+    context = client_context(username)
+    ssl_socket = context.wrap_socket(socket.create_connection(('127.0.0.1', port)))
+    primary = VpnTunnel(ssl_socket, is_client=True, server_ip='127.0.0.1', packet_io=SocketPairPacketIO(),
+                        batch_delay=0, streams=streams)
+    primary.start_tunnel()
+    tunnels = [primary]
+    if streams > 1:
+        if not primary.stream_reply.wait(5) or not primary.stream_token:
+            raise RuntimeError("Connexions parallèles refusées par l'hôte")
+        for _ in range(streams - 1):
+            sock = context.wrap_socket(socket.create_connection(('127.0.0.1', port)), session=ssl_socket.session)
+            tunnel = VpnTunnel(sock, is_client=True, server_ip='127.0.0.1', packet_io=primary.packet_io,
+                               batch_delay=0, join_token=primary.stream_token, capture=False)
+            tunnel.start_tunnel()
+            if not tunnel.stream_reply.wait(5) or not tunnel.stream_joined:
+                raise RuntimeError("Connexion parallèle refusée par l'hôte")
+            tunnels.append(tunnel)
+        primary.stripes = tunnels
+    return tunnels
+
+
+def measure(streams, workload, loss, args):
+    port = free_port()
+    host = VPNHost(host='127.0.0.1', port=port, packet_backend='fake', batch_delay=0)
+    threading.Thread(target=host.start, daemon=True).start()
+    time.sleep(0.3)
+    relay = TcpRelay(('127.0.0.1', port), loss, args.stall, args.mss)
+    tunnels = connect_streams(relay.port, streams)
+    time.sleep(0.2)
+
+    receiver = Receiver([host.packet_io.peer])
+    peer = tunnels[0].packet_io.peer
+    src = bytes([10, 8, 0, 2])
+    flows = 1 if workload == 'single' else args.flows
+    count = int(args.rate * args.duration)
+    start = time.perf_counter()
+    for seq in range(count):
+        peer.send(udp_packet(src, REMOTE_IP, BASE_PORT + seq % flows, REMOTE_PORT, args.size, 0, seq))
+        delay = start + (seq + 1) / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    receiver.wait(count, idle=max(2.0, 3 * args.stall))
+    elapsed = (receiver.last_arrival or time.perf_counter()) - start
+    receiver.stop()
+    for tunnel in reversed(tunnels):
+        tunnel.stop_tunnel()
+
+    p50, p99 = percentile(receiver.latencies, 0.5), percentile(receiver.latencies, 0.99)
+    return {
+        'streams': streams,
+        'workload': workload,
+        'loss': loss,
+        'sent': count,
+        'delivered': receiver.received,
+        'goodput_mbps': round(receiver.bytes * 8 / elapsed / 1e6, 2) if elapsed > 0 else 0,
+        'latency_p50_ms': round(p50 * 1e3, 2) if p50 is not None else None,
+        'latency_p99_ms': round(p99 * 1e3, 2) if p99 is not None else None,
+        'stalls': relay.stalls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Débit selon le nombre de connexions TLS parallèles')
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workloads', nargs='+', choices=['single', 'many'], default=['single', 'many'])
+    parser.add_argument('--losses', type=float, nargs='+', default=[0.0, 0.02])
+    parser.add_argument('--flows', type=int, default=64, help='Nombre de flux de la charge many')
+    parser.add_argument('--rate', type=int, default=2000, help='Paquets par seconde émis par le client')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--stall', type=float, default=0.2, help='Arrêt d\'une connexion par segment perdu (secondes)')
+    parser.add_argument('--mss', type=int, default=1448)
+    args = parser.parse_args()
+
+    make_pki(['bench0'])
+    for loss in args.losses:
+        for workload in args.workloads:
+            for streams in args.streams:
+                r = measure(streams, workload, loss, args)
+                print(f"K={streams:<2} {workload:>6} perte={loss:>5.1%}: livrés {r['delivered']:>6}/{r['sent']} "
+                      f"débit utile {r['goodput_mbps']:>6.2f} Mbit/s p50={r['latency_p50_ms']} ms "
+                      f"p99={r['latency_p99_ms']} ms arrêts={r['stalls']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Débit et latence du tunnel de bout en bout, sur localhost et sans droits root.
+
+Un VPNHost et N tunnels clients (VpnTunnel) sont reliés par TLS ; les
+backends de paquets sont des socketpairs (backend 'fake'). Deux chemins sont
+mesurés :
+  - aller  : application cliente -> client_tunnel -> TLS -> server_tunnel -> NAT -> réseau
+  - retour : réseau -> capture (reverse NAT) -> TLS -> client_receive -> application cliente
+Chaque paquet porte un numéro et un horodatage ; le même processus émet et
+reçoit, la latence est donc mesurée sur une seule horloge. Le temps CPU par
+paquet est celui du processus entier (hôte, clients et générateur).
+
+Avec --compression, les clients négocient la compression des trames ; le
+bourrage des paquets est soit compressible (texte répété), soit aléatoire
+(--payload random, comme un flux déjà chiffré).
+
+Les résultats sont écrits en JSON ; --compare signale les régressions de
+débit par rapport à un fichier de résultats précédent.
+"""
+import argparse
+import json
+import os
+import platform
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from vpn import AsyncVPNHost, VPNHost, VpnTunnel
+from vpn.packet_io import SocketPairPacketIO
+
+PAYLOAD = struct.Struct('!IId')  # client, numéro, horodatage d'envoi
+IP_UDP_HEADER = 28
+REMOTE_IP = socket.inet_aton('192.0.2.1')
+REMOTE_PORT = 53
+BASE_PORT = 40000  # Ports source des clients, dans la plage NAT (conservés par le NAT)
+
+
+def ip_checksum(header):
+    total = sum(struct.unpack('!10H', header))
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+TEXT_PADDING = b'GET /api/v1/items?page=1 HTTP/1.1\r\nHost: example.com\r\nAccept: application/json\r\n\r\n' * 40
+padding = TEXT_PADDING * 8
+
+
+def udp_packet(src, dst, sport, dport, size, client, seq):
+    """Paquet IPv4/UDP de `size` octets (somme UDP absente) portant (client, numéro, horodatage)"""
+    header = bytearray(struct.pack('!BBHHHBBH4s4s', 0x45, 0, size, seq & 0xFFFF, 0, 64, 17, 0, src, dst))
+    struct.pack_into('!H', header, 10, ip_checksum(header))
+    payload = PAYLOAD.pack(client, seq, time.perf_counter())
+    udp = struct.pack('!HHHH', sport, dport, size - 20, 0)
+    length = size - IP_UDP_HEADER - PAYLOAD.size
+    offset = seq * 997 % (len(padding) - length)  # Contenu différent d'un paquet à l'autre
+    return bytes(header) + udp + payload + padding[offset:offset + length]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Receiver:
+    """Lit les paquets livrés sur des sockets « réseau » et enregistre leur latence"""
+
+    def __init__(self, socks):
+        self.socks = socks
+        self.received = 0
+        self.bytes = 0
+        self.latencies = []
+        self.last_arrival = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            ready, _, _ = select.select(self.socks, [], [], 0.1)
+            for sock in ready:
+                data = sock.recv(65535)
+                now = time.perf_counter()
+                _, _, sent_at = PAYLOAD.unpack_from(data, IP_UDP_HEADER)
+                self.latencies.append(now - sent_at)
+                self.received += 1
+                self.bytes += len(data)
+                self.last_arrival = now
+
+    def wait(self, expected, idle=1.0):
+        """Attend `expected` paquets, ou `idle` secondes sans nouvelle arrivée"""
+        last_count, last_change = -1, time.perf_counter()
+        while self.received < expected:
+            time.sleep(0.005)
+            if self.received != last_count:
+                last_count, last_change = self.received, time.perf_counter()
+            elif time.perf_counter() - last_change > idle:
+                break
+
+    def reset(self):
+        self.received = 0
+        self.bytes = 0
+        self.latencies = []
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class Testbed:
+    """Un hôte et ses clients, reliés par TLS sur localhost"""
+
+    def __init__(self, clients, batch_bytes, batch_delay, host_mode, compression=None):
+        port = free_port()
+        host_class = AsyncVPNHost if host_mode == 'asyncio' else VPNHost
+        self.host = host_class(host='127.0.0.1', port=port, packet_backend='fake',
+                               batch_bytes=batch_bytes, batch_delay=batch_delay, compression=compression)
+        threading.Thread(target=self.host.start, daemon=True).start()
+        time.sleep(0.3)
+        self.public_ip = socket.inet_aton(self.host.server_ip)
+        self.tunnels = []
+        for index in range(clients):
+            username = f"bench{index}"
+            sock = client_context(username).wrap_socket(socket.create_connection(('127.0.0.1', port)))
+            packet_io = SocketPairPacketIO()
+            tunnel = VpnTunnel(sock, is_client=True, server_ip='127.0.0.1', packet_io=packet_io,
+                               batch_bytes=batch_bytes, batch_delay=batch_delay, compression=compression)
+            tunnel.start_tunnel()
+            self.tunnels.append(tunnel)
+        # Attendre que l'hôte ait enregistré toutes les sessions
+        deadline = time.monotonic() + 5
+        while len(self.host.sessions) < clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def client_address(self, index):
+        return bytes([10, 8, index // 250, index % 250 + 2])
+
+    def close(self):
+        for tunnel in self.tunnels:
+            tunnel.stop_tunnel()
+        if hasattr(self.host, 'stop'):
+            self.host.stop()
+
+
+def send_upstream(bed, index, count, size, pace):
+    """L'application du client `index` émet `count` paquets vers le réseau"""
+    peer = bed.tunnels[index].packet_io.peer
+    src = bed.client_address(index)
+    for seq in range(count):
+        peer.send(udp_packet(src, REMOTE_IP, BASE_PORT + index, REMOTE_PORT, size, index, seq))
+        if pace:
+            time.sleep(pace)
+
+
+def send_downstream(bed, index, count, size, pace):
+    """Le réseau répond au flux du client `index` (adressé à l'IP publique et au port NAT)"""
+    network = bed.host.packet_io.peer
+    for seq in range(count):
+        network.send(udp_packet(REMOTE_IP, bed.public_ip, REMOTE_PORT, BASE_PORT + index, size, index, seq))
+        if pace:
+            time.sleep(pace)
+
+
+def run_phase(bed, receiver, sender, count, size, pace):
+    receiver.reset()
+    threads = [threading.Thread(target=sender, args=(bed, index, count, size, pace))
+               for index in range(len(bed.tunnels))]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = count * len(bed.tunnels)
+    receiver.wait(expected)
+    elapsed = (receiver.last_arrival or time.perf_counter()) - start
+    cpu = time.process_time() - cpu_start
+    return expected, elapsed, cpu
+
+
+def compression_totals(bed):
+    """Octets économisés et CPU de compression, des deux côtés du tunnel"""
+    saved = cpu = 0
+    sessions = list(bed.tunnels) + list(bed.host.sessions)
+    for session in sessions:
+        stats = session.compression_stats()
+        if stats is not None:
+            saved += stats['bytes_saved']
+            cpu += stats['cpu_seconds']
+    return saved, cpu
+
+
+def measure(direction, clients, size, batch_bytes, batch_delay, count, latency_count, host_mode, compression=None):
+    bed = Testbed(clients, batch_bytes, batch_delay, host_mode, compression)
+    try:
+        if direction == 'upstream':
+            receiver = Receiver([bed.host.packet_io.peer])
+            sender = send_upstream
+        else:
+            receiver = Receiver([tunnel.packet_io.peer for tunnel in bed.tunnels])
+            sender = send_downstream
+            # Créer les flux NAT que le réseau va utiliser pour répondre
+            warmup = Receiver([bed.host.packet_io.peer])
+            run_phase(bed, warmup, send_upstream, 1, size, 0)
+            warmup.stop()
+
+        # Débit: envoi en rafale
+        expected, elapsed, cpu = run_phase(bed, receiver, sender, count, size, 0)
+        received, received_bytes = receiver.received, receiver.bytes
+        saved, compression_cpu = compression_totals(bed)
+        # Latence: envoi espacé, hors saturation des files
+        run_phase(bed, receiver, sender, latency_count, size, 0.001)
+        latencies = receiver.latencies
+        receiver.stop()
+    finally:
+        bed.close()
+
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    return {
+        'direction': direction,
+        'host_mode': host_mode,
+        'clients': clients,
+        'size': size,
+        'batch_bytes': batch_bytes,
+        'batch_delay': batch_delay,
+        'compression': compression,
+        'packets': expected,
+        'received': received,
+        'lost': expected - received,
+        'pps': round(received / elapsed, 1) if elapsed > 0 else 0,
+        'mbps': round(received_bytes * 8 / elapsed / 1e6, 2) if elapsed > 0 else 0,
+        'cpu_us_per_packet': round(cpu / received * 1e6, 2) if received else None,
+        'latency_p50_us': round(p50 * 1e6, 1) if p50 is not None else None,
+        'latency_p99_us': round(p99 * 1e6, 1) if p99 is not None else None,
+        'compression_saved_bytes': saved,
+        'compression_cpu_us_per_packet': round(compression_cpu / received * 1e6, 2) if received else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def result_key(result):
+    return (result['direction'], result['host_mode'], result['clients'], result['size'],
+            result['batch_bytes'], result['batch_delay'], result.get('compression'))
+
+
+def compare(results, baseline_file, tolerance):
+    """Affiche les écarts de débit avec un fichier précédent; retourne le nombre de régressions"""
+    with open(baseline_file) as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get(result_key(result))
+        if not old or not old['pps']:
+            continue
+        ratio = result['pps'] / old['pps']
+        flag = ''
+        if ratio < 1 - tolerance:
+            regressions += 1
+            flag = '  <-- régression'
+        print(f"{result['direction']:>9} {result['size']:>5} B x{result['clients']} "
+              f"delay={result['batch_delay']}: {old['pps']:>10.0f} -> {result['pps']:>10.0f} pps ({ratio - 1:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Débit et latence du tunnel (localhost, backend fake)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 512, 1500])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--batch-delays', type=float, nargs='+', default=[0.0, 0.002])
+    parser.add_argument('--batch-bytes', type=int, default=32 * 1024)
+    parser.add_argument('--directions', nargs='+', choices=['upstream', 'downstream'], default=['upstream', 'downstream'])
+    parser.add_argument('--host-mode', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--compression', choices=['auto', 'zlib', 'lz4'], help='Compression des trames négociée par les clients')
+    parser.add_argument('--payload', choices=['text', 'random'], default='text', help='Bourrage des paquets: compressible ou non')
+    parser.add_argument('--packets', type=int, default=20000, help='Paquets par client pour la mesure de débit')
+    parser.add_argument('--latency-packets', type=int, default=500, help='Paquets par client pour la mesure de latence')
+    parser.add_argument('--output', default='bench_tunnel.json')
+    parser.add_argument('--compare', help='Fichier JSON de référence')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Baisse de débit tolérée avant de signaler une régression')
+    args = parser.parse_args()
+
+    global padding
+    # Aléatoire: une réserve assez grande pour qu'aucune trame ne contienne deux fois le même bourrage
+    padding = TEXT_PADDING * 8 if args.payload == 'text' else os.urandom(1 << 22)
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    make_pki([f"bench{i}" for i in range(max(args.clients))])
+
+    results = []
+    for direction in args.directions:
+        for clients in args.clients:
+            for size in args.sizes:
+                for delay in args.batch_delays:
+                    result = measure(direction, clients, size, args.batch_bytes, delay,
+                                     args.packets, args.latency_packets, args.host_mode, args.compression)
+                    results.append(result)
+                    print(f"{direction:>9} {size:>5} B x{clients} delay={delay}: "
+                          f"{result['pps']:>9.0f} pps {result['mbps']:>8.1f} Mbit/s "
+                          f"p50={result['latency_p50_us']} us p99={result['latency_p99_us']} us "
+                          f"cpu={result['cpu_us_per_packet']} us/paquet perdus={result['lost']}"
+                          + (f" économisés={result['compression_saved_bytes']} o" if args.compression else ''))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'packets': args.packets,
+            'latency_packets': args.latency_packets,
+        },
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Résultats écrits dans {output}")
+
+    if baseline and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
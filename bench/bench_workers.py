@@ -0,0 +1,91 @@
+"""Débit agrégé du chemin aller (TLS + NAT) avec 1, 2, 4... processus workers"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from vpn import WorkerSupervisor
+from vpn.framing import encode_frame
+
+
+def udp_packet(src_port):
+    """Paquet IPv4/UDP de 100 octets de 10.8.0.2 vers 192.0.2.1 (sommes de contrôle à zéro)"""
+    payload = b'x' * 72
+    header = bytes([0x45, 0, 0, 100, 0, 0, 0, 0, 64, 17, 0, 0, 10, 8, 0, 2, 192, 0, 2, 1])
+    udp = src_port.to_bytes(2, 'big') + (53).to_bytes(2, 'big') + (80).to_bytes(2, 'big') + b'\0\0'
+    return header + udp + payload
+
+
+def client(port, duration, batch, results):
+    """Envoie des trames de paquets UDP pendant `duration` secondes"""
+    context = client_context('bench')
+    frame = encode_frame([udp_packet(40000 + i % 64) for i in range(batch)])
+    for _ in range(50):
+        try:
+            raw = socket.create_connection(('127.0.0.1', port))
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    sock = context.wrap_socket(raw)
+    sent = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        sock.sendall(frame)
+        sent += batch
+    sock.close()
+    results.put(sent)
+
+
+def measure(workers, clients, duration, batch, use_asyncio):
+    port = free_port()
+    supervisor = WorkerSupervisor(workers, use_asyncio=use_asyncio, host='127.0.0.1', port=port,
+                                  packet_backend='null')
+    devnull = open(os.devnull, 'w')
+    out = sys.stdout
+    # Les messages des workers (hérités à la création du processus) ne sont pas affichés
+    sys.stdout = devnull
+    try:
+        supervisor.start()
+    finally:
+        sys.stdout = out
+    time.sleep(1.0)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(port, duration, batch, results))
+                 for _ in range(clients)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    supervisor.stop()
+    devnull.close()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mise à l\'échelle multi-processus du VPNHost')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--batch', type=int, default=64, help='Paquets par trame')
+    parser.add_argument('--asyncio', action='store_true')
+    args = parser.parse_args()
+
+    make_pki(['bench'])
+    print(f"CPU disponibles: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        pps = measure(workers, args.clients, args.duration, args.batch, args.asyncio)
+        baseline = baseline or pps
+        print(f"{workers} worker(s): {pps:,.0f} paquets/s (x{pps / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
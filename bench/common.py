@@ -0,0 +1,41 @@
+"""Outils partagés par les benchmarks: PKI temporaire et hôte VPN local"""
+import os
+import socket
+import ssl
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vpn import CertificateManager, UserManager
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_pki(usernames, workdir=None, key_type='rsa'):
+    """Crée CA, certificat serveur et utilisateurs dans un dossier temporaire (qui devient le dossier courant)"""
+    workdir = workdir or tempfile.mkdtemp(prefix='vpn-bench-')
+    os.chdir(workdir)
+    cert_manager = CertificateManager(key_type=key_type)
+    ca_key, ca_cert = cert_manager.generate_ca_cert()
+    cert_manager.generate_server_cert(ca_key, ca_cert)
+    user_manager = UserManager()
+    for username in usernames:
+        cert_manager.generate_user_cert(username, ca_key, ca_cert)
+        folder = f"users/{username}"
+        user_manager.add_user(username, folder, f"{folder}/{username}.crt", f"{folder}/{username}.key")
+    return workdir
+
+
+def client_context(username):
+    """Contexte TLS client, configuré comme celui de VPNClient"""
+    context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    context.load_cert_chain(certfile=f"users/{username}/{username}.crt", keyfile=f"users/{username}/{username}.key")
+    context.load_verify_locations(cafile=f"users/{username}/ca.crt")
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
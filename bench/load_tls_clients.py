@@ -0,0 +1,77 @@
+"""Test de charge: N clients TLS simultanés contre un hôte VPN local (asyncio ou threads)"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import client_context, free_port, make_pki
+from vpn import AsyncVPNHost, VPNHost
+from vpn.framing import encode_frame
+
+
+async def run_clients(port, count, hold, context):
+    opened = []
+    failures = 0
+    start = time.perf_counter()
+
+    async def connect():
+        nonlocal failures
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port, ssl=context, server_hostname=None)
+            opened.append((reader, writer))
+        except (OSError, asyncio.TimeoutError):
+            failures += 1
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    connect_time = time.perf_counter() - start
+
+    # Sessions inactives maintenues ouvertes
+    await asyncio.sleep(hold)
+    host_threads = threading.active_count()
+
+    # Une trame (vide) par client, puis fermeture
+    for reader, writer in opened:
+        writer.write(encode_frame([]))
+        writer.close()
+    await asyncio.gather(*(w.wait_closed() for _, w in opened), return_exceptions=True)
+    return len(opened), failures, connect_time, host_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de charge TLS du VPNHost')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--hold', type=float, default=2.0, help='Durée (s) pendant laquelle les sessions restent ouvertes')
+    parser.add_argument('--mode', choices=['asyncio', 'threads'], default='asyncio')
+    parser.add_argument('--max-handshakes', type=int, default=64)
+    args = parser.parse_args()
+
+    make_pki(['bench'])
+    port = free_port()
+    # Les messages de l'hôte (une ligne par connexion) ne sont pas affichés
+    out = sys.stdout
+    sys.stdout = io.StringIO()
+    if args.mode == 'asyncio':
+        host = AsyncVPNHost(host='127.0.0.1', port=port, packet_backend='fake', max_handshakes=args.max_handshakes)
+    else:
+        host = VPNHost(host='127.0.0.1', port=port, packet_backend='fake')
+    baseline_threads = threading.active_count()
+    threading.Thread(target=host.start, daemon=True).start()
+    time.sleep(0.5)
+
+    try:
+        opened, failures, connect_time, threads = asyncio.run(run_clients(port, args.clients, args.hold, client_context('bench')))
+    finally:
+        sys.stdout = out
+    print(f"Mode: {args.mode}")
+    print(f"Sessions ouvertes: {opened} / {args.clients} ({failures} échecs)")
+    print(f"Poignées de main: {opened / connect_time:.0f} /s ({connect_time:.2f} s au total)")
+    print(f"Threads pendant le maintien: {threads} (avant démarrage de l'hôte: {baseline_threads})")
+
+
+if __name__ == '__main__':
+    main()
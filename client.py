@@ -57,7 +57,9 @@ def check_and_install_npcap():
     return True
 
 from vpn import VPNClient
+from vpn.log import setup_logging
 import argparse
+import logging
 import time
 import sys
 import os
@@ -104,9 +106,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='VPN Client')
     parser.add_argument('username', nargs='?', default='lea', help='Nom d\'utilisateur')
     parser.add_argument('--host', default='192.168.1.8', help='Adresse du serveur VPN')
+    parser.add_argument('--backend', default='scapy', choices=['scapy', 'tun'], help='Backend de capture/injection des paquets (tun: Linux uniquement)')
+    parser.add_argument('--compress', choices=['auto', 'zlib', 'lz4'], help="Compression des trames (négociée avec l'hôte; coupée automatiquement pour le trafic incompressible)")
+    parser.add_argument('--transport', default='tls', choices=['tls', 'udp'], help="udp: paquets en datagrammes chiffrés si l'hôte le propose (--udp-port), évite TCP dans TCP")
+    parser.add_argument('--streams', type=int, default=1, help='Connexions TLS parallèles vers l\'hôte (liens à fort produit débit-délai)')
+    parser.add_argument('--bundle', help="Paquet d'identifiants <username>.pem téléchargé depuis l'administration (certificat, clé et CA)")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='DEBUG: une ligne par paquet (lent)')
     args = parser.parse_args()
+    setup_logging(getattr(logging, args.log_level))
     
-    client = VPNClient(host=args.host, username=args.username)
+    client = VPNClient(host=args.host, username=args.username, packet_backend=args.backend, compression=args.compress,
+                       transport=args.transport, streams=args.streams, bundle_file=args.bundle)
     client.connect()
     
     print("VPN tunneling actif. Tout le trafic réseau passe par la connexion VPN.")
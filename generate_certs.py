@@ -1,20 +1,26 @@
 import os
 import json
+import argparse
 from vpn import CertificateManager, UserManager
+from vpn.certs import file_fingerprint
+from vpn.issuance import user_record
 
 def create_users_json(users_list, user_manager):
-    """Crée le fichier users.json avec la liste des utilisateurs"""
-    for username in users_list:
-        folder = f"users/{username}"
-        cert_file = f"{folder}/{username}.crt"
-        key_file = f"{folder}/{username}.key"
-        user_manager.add_user(username, folder, cert_file, key_file)
+    """Crée le fichier users.json avec la liste des utilisateurs (en une seule écriture)"""
+    user_manager.add_users({
+        username: user_record(username, fingerprint=file_fingerprint(f"users/{username}/{username}.crt"), bundle=False)
+        for username in users_list
+    })
 
 if __name__ == "__main__":
     # Liste des utilisateurs à créer
     users_list = ["root", "invite"]  # Modifiez cette liste selon vos besoins
     
-    cert_manager = CertificateManager()
+    parser = argparse.ArgumentParser(description='Génération des certificats')
+    parser.add_argument('--key-type', choices=['rsa', 'ecdsa'], default='rsa', help='RSA-2048 ou ECDSA P-256 (poignées de main plus rapides)')
+    args = parser.parse_args()
+    
+    cert_manager = CertificateManager(key_type=args.key_type)
     user_manager = UserManager()
     
     print("Génération du certificat CA...")
@@ -1,17 +1,75 @@
-from vpn import VPNHost, AdminInterface, UserManager, CertificateManager
+from vpn import VPNHost, AsyncVPNHost, AdminInterface, UserManager, CertificateManager, WorkerSupervisor
+from vpn.admin import ADMIN_THREADS, SERVERS, start_admin_process
+import argparse
+import logging
 import threading
+from vpn.log import setup_logging
+from vpn.profiling import PROFILER
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='VPN Host')
+    parser.add_argument('--asyncio', action='store_true', help='Sessions et poignées de main TLS en asyncio (sans thread par client)')
+    parser.add_argument('--max-handshakes', type=int, default=64, help='Poignées de main TLS simultanées (mode asyncio)')
+    parser.add_argument('--workers', type=int, default=1, help='Nombre de processus workers (SO_REUSEPORT, Linux)')
+    parser.add_argument('--udp-port', type=int, help='Transport datagramme (UDP chiffré) sur ce port; avec --workers, un port par worker à partir de celui-ci')
+    parser.add_argument('--key-pool', type=int, default=0, help="Clés utilisateurs générées d'avance pour l'administration (0: à la demande)")
+    parser.add_argument('--admin-server', default='waitress', choices=SERVERS,
+                        help="Serveur WSGI de l'administration (werkzeug: serveur de développement)")
+    parser.add_argument('--admin-threads', type=int, default=ADMIN_THREADS, help="Requêtes de l'administration servies en parallèle (waitress)")
+    parser.add_argument('--admin-process', action='store_true', help="Administration dans un processus séparé (même base d'utilisateurs; métriques et profilage de l'hôte non visibles)")
+    parser.add_argument('--max-streams', type=int, default=16, help='Connexions TLS parallèles acceptées par client (1: désactivé)')
+    parser.add_argument('--no-compression', action='store_true', help='Refuser la compression des trames demandée par les clients')
+    parser.add_argument('--no-adaptive', action='store_true', help='Compresser toutes les trames, sans coupure pour le trafic incompressible')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='DEBUG: une ligne par paquet (lent)')
+    parser.add_argument('--profile', action='store_true', help="Profiler dès le démarrage (résultats sur /profile/stages et /profile/stacks de l'admin)")
+    parser.add_argument('--profile-rate', type=int, default=100, help='Échantillons de piles par seconde avec --profile')
+    args = parser.parse_args()
+    log_level = getattr(logging, args.log_level)
+    compression = None if args.no_compression else 'auto'
+    transport_kwargs = {'compression': compression, 'adaptive_compression': not args.no_adaptive,
+                        'udp_port': args.udp_port, 'max_streams': args.max_streams}
+    setup_logging(log_level)
+    if args.profile:
+        if args.workers > 1:
+            # Le profileur ne voit que les threads de son propre processus
+            parser.error("--profile n'est pas disponible avec --workers")
+        PROFILER.start(args.profile_rate)
+
     # Initialiser les gestionnaires
     user_manager = UserManager()
     cert_manager = CertificateManager()
     
-    # Lancer l'interface d'administration dans un thread séparé
-    admin = AdminInterface(port=80, user_manager=user_manager, cert_manager=cert_manager)
-    admin_thread = threading.Thread(target=admin.run)
-    admin_thread.daemon = True
-    admin_thread.start()
+    admin_kwargs = {'key_pool_size': args.key_pool, 'server': args.admin_server, 'threads': args.admin_threads}
+    admin_process = None
+    if args.admin_process:
+        # Base d'utilisateurs partagée par les fichiers (journal relu à chaud des deux côtés)
+        admin_process = start_admin_process(port=80, users_file=user_manager.users_file,
+                                            key_type=cert_manager.key_type, log_level=log_level, **admin_kwargs)
+    else:
+        # Lancer l'interface d'administration dans un thread séparé
+        admin = AdminInterface(port=80, user_manager=user_manager, cert_manager=cert_manager, **admin_kwargs)
+        admin_thread = threading.Thread(target=admin.run)
+        admin_thread.daemon = True
+        admin_thread.start()
     
     # Lancer l'hôte VPN
-    host = VPNHost()
-    host.start()
\ No newline at end of file
+    try:
+        if args.workers > 1:
+            # Sans --admin-process, l'administration reste dans le processus superviseur
+            host_kwargs = {'max_handshakes': args.max_handshakes} if args.asyncio else {}
+            host_kwargs.update(transport_kwargs)
+            supervisor = WorkerSupervisor(args.workers, use_asyncio=args.asyncio, log_level=log_level, **host_kwargs)
+            supervisor.run()
+        else:
+            if admin_process is None:
+                # Même base que l'administration: une révocation invalide aussitôt le cache d'autorisations
+                transport_kwargs['user_manager'] = user_manager
+            if args.asyncio:
+                host = AsyncVPNHost(max_handshakes=args.max_handshakes, **transport_kwargs)
+            else:
+                host = VPNHost(**transport_kwargs)
+            host.start()
+    finally:
+        if admin_process is not None:
+            admin_process.terminate()
+            admin_process.join(5)
@@ -0,0 +1,57 @@
+import argparse
+import csv
+import sys
+import time
+from vpn import CertificateManager, UserManager
+from vpn.issuance import provision
+
+
+def read_usernames(source):
+    """Noms d'utilisateurs d'un CSV (colonne 'username', ou première colonne) ou d'un flux, un par ligne"""
+    rows = csv.reader(line for line in source if line.strip() and not line.lstrip().startswith('#'))
+    column = 0
+    for index, row in enumerate(rows):
+        if not row:
+            continue
+        if index == 0 and 'username' in [cell.strip().lower() for cell in row]:
+            column = [cell.strip().lower() for cell in row].index('username')
+            continue
+        if column < len(row) and row[column].strip():
+            yield row[column].strip()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Création en masse des utilisateurs (clés et certificats sur tous les cœurs)')
+    parser.add_argument('source', help="Fichier CSV des utilisateurs, ou '-' pour l'entrée standard (un nom par ligne)")
+    parser.add_argument('--key-type', choices=['rsa', 'ecdsa'], default='rsa', help='RSA-2048 ou ECDSA P-256 (poignées de main plus rapides)')
+    parser.add_argument('--workers', type=int, default=None, help='Processus de génération (défaut: un par cœur)')
+    parser.add_argument('--users-file', default='users.json')
+    args = parser.parse_args()
+
+    if args.source == '-':
+        usernames = list(read_usernames(sys.stdin))
+    else:
+        with open(args.source, newline='') as f:
+            usernames = list(read_usernames(f))
+
+    cert_manager = CertificateManager(key_type=args.key_type)
+    user_manager = UserManager(args.users_file)
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} utilisateurs générés", end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    try:
+        result = provision(usernames, cert_manager, user_manager, workers=args.workers, progress=progress)
+    except KeyboardInterrupt:
+        print("\nInterrompu: les utilisateurs déjà générés sont enregistrés, relancez la même commande pour reprendre.",
+              file=sys.stderr)
+        sys.exit(130)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(f"Créés: {result['created']}, repris: {result['recovered']}, déjà présents: {result['skipped']}, "
+          f"échecs: {len(result['failed'])} en {elapsed:.1f} s ({result['created'] / elapsed:.1f} utilisateurs/s)")
+    for username, error in list(result['failed'].items())[:20]:
+        print(f"  {username}: {error}")
+    sys.exit(1 if result['failed'] else 0)
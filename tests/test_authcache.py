@@ -0,0 +1,72 @@
+import datetime
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from vpn.authcache import AUTHORIZED, MISMATCH, REVOKED, UNKNOWN_USER, AuthCache
+from vpn.certs import certificate_fingerprint
+from vpn.user_manager import UserManager
+
+
+def certificate(username):
+    """Certificat DER auto-signé au CN de l'utilisateur (la chaîne est vérifiée par TLS, pas par le cache)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, username)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    return cert.public_bytes(serialization.Encoding.DER)
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    return str(tmp_path / 'users.json')
+
+
+def add_user(user_manager, username, der):
+    user_manager.add_user(username, f'users/{username}', f'users/{username}/client.crt',
+                          f'users/{username}/client.key', fingerprint=certificate_fingerprint(der))
+
+
+def test_decisions(users_file):
+    user_manager = UserManager(users_file)
+    cache = AuthCache(user_manager)
+    der = certificate('alice')
+    assert cache.authorize(der) == ('alice', UNKNOWN_USER)
+    add_user(user_manager, 'alice', der)
+    assert cache.authorize(der) == ('alice', AUTHORIZED)
+    assert cache.authorize(certificate('alice')) == ('alice', MISMATCH)
+    assert cache.authorize(der) == ('alice', AUTHORIZED)
+    assert cache.stats()['hits'] == 1
+
+
+def test_revocation_from_shared_manager_is_immediate(users_file):
+    user_manager = UserManager(users_file, refresh_interval=3600)
+    cache = AuthCache(user_manager)
+    der = certificate('alice')
+    add_user(user_manager, 'alice', der)
+    assert cache.authorize(der) == ('alice', AUTHORIZED)
+    assert user_manager.revoke_certificate('alice', certificate_fingerprint(der))
+    assert cache.authorize(der) == ('alice', REVOKED)
+
+
+def test_revocation_from_other_instance_seen_after_refresh(users_file):
+    # Administration dans un autre processus: même fichiers, autre UserManager
+    admin = UserManager(users_file)
+    der = certificate('alice')
+    add_user(admin, 'alice', der)
+    host = UserManager(users_file, refresh_interval=3600)
+    cache = AuthCache(host)
+    assert cache.authorize(der) == ('alice', AUTHORIZED)
+
+    assert admin.revoke_certificate('alice', certificate_fingerprint(der))
+    host.refresh_if_due()
+    assert cache.authorize(der) == ('alice', AUTHORIZED)  # Délai borné par refresh_interval
+
+    host.refresh_interval = 0
+    host.refresh_if_due()
+    assert cache.authorize(der) == ('alice', REVOKED)
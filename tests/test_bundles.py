@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from vpn.bundles import BundleCache
+from vpn.certs import CertificateManager
+from vpn.user_manager import UserManager
+
+
+@pytest.fixture
+def cert_manager(tmp_path, monkeypatch):
+    cert_manager = CertificateManager(str(tmp_path / 'certs' / 'ca.crt'), str(tmp_path / 'certs' / 'ca.key'),
+                                      key_type='ecdsa', ca_refresh_interval=3600)
+    cert_manager.generate_ca_cert()
+    # Compte les vérifications des fichiers de la CA (deux stat chacune)
+    cert_manager.stamps = 0
+    stamp = cert_manager._ca_stamp
+
+    def counted():
+        cert_manager.stamps += 1
+        return stamp()
+    monkeypatch.setattr(cert_manager, '_ca_stamp', counted)
+    return cert_manager
+
+
+@pytest.fixture
+def bundles(tmp_path, cert_manager):
+    user_manager = UserManager(str(tmp_path / 'users.json'))
+    folder = tmp_path / 'alice'
+    folder.mkdir()
+    (folder / 'client.crt').write_bytes(b'CERT\n')
+    (folder / 'client.key').write_bytes(b'KEY\n')
+    user_manager.add_user('alice', str(folder), str(folder / 'client.crt'), str(folder / 'client.key'))
+    return BundleCache(user_manager, cert_manager)
+
+
+def ca_pem(cert_manager):
+    return cert_manager.ca[1].public_bytes(serialization.Encoding.PEM)
+
+
+def test_downloads_do_not_touch_ca_files(bundles, cert_manager):
+    first = bundles.get('alice')
+    assert first.parts['ca'] == ca_pem(cert_manager)
+    assert all(bundles.get('alice') is first for _ in range(100))
+    assert cert_manager.stamps == 0
+    assert bundles.stats()['hits'] == 100
+
+
+def test_rotation_in_process_flushes_cache(bundles, cert_manager):
+    old = bundles.get('alice')
+    os.remove(cert_manager.ca_cert_file)
+    os.remove(cert_manager.ca_key_file)
+    cert_manager.generate_ca_cert()
+    new = bundles.get('alice')
+    assert new is not old and new.etag != old.etag
+    assert new.parts['ca'] == ca_pem(cert_manager) != old.parts['ca']
+
+
+def test_files_replaced_elsewhere_seen_after_interval(bundles, cert_manager, tmp_path):
+    old = bundles.get('alice')
+    other = CertificateManager(str(tmp_path / 'other.crt'), str(tmp_path / 'other.key'), key_type='ecdsa')
+    other.generate_ca_cert()
+    os.replace(other.ca_cert_file, cert_manager.ca_cert_file)
+    os.replace(other.ca_key_file, cert_manager.ca_key_file)
+    assert bundles.get('alice') is old  # Fichiers revérifiés au plus une fois par ca_refresh_interval
+
+    cert_manager.ca_refresh_interval = 0
+    new = bundles.get('alice')
+    assert cert_manager.stamps == 1
+    assert new.parts['ca'] == other.ca[1].public_bytes(serialization.Encoding.PEM) != old.parts['ca']
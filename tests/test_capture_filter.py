@@ -0,0 +1,151 @@
+import ctypes
+import ctypes.util
+import socket
+
+import pytest
+from scapy.all import ICMP, IP, TCP, UDP, Ether, conf, raw
+
+from vpn import VpnTunnel
+from vpn.injector import RawInjector
+from vpn.packet_io import ScapyPacketIO, client_capture_filter, route_source_address
+
+SERVER_IP = '203.0.113.5'
+SERVER_PORT = 1194
+LOCAL_IP = '192.168.1.10'
+
+
+def load_libpcap():
+    name = ctypes.util.find_library('pcap')
+    if name is None:
+        return None
+    from scapy.libs.winpcapy import bpf_program, pcap_pkthdr
+    lib = ctypes.CDLL(name)
+    lib.pcap_compile_nopcap.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(bpf_program), ctypes.c_char_p,
+                                        ctypes.c_int, ctypes.c_uint32]
+    lib.pcap_offline_filter.argtypes = [ctypes.POINTER(bpf_program), ctypes.POINTER(pcap_pkthdr), ctypes.c_char_p]
+    lib.pcap_freecode.argtypes = [ctypes.POINTER(bpf_program)]
+    return lib
+
+
+libpcap = load_libpcap()
+
+
+def bpf_matches(capture_filter, packet):
+    """Le filtre, compilé par libpcap comme pour la capture, laisse-t-il passer ce paquet (trame Ethernet) ?"""
+    from scapy.libs.winpcapy import bpf_program, pcap_pkthdr
+    program = bpf_program()
+    assert libpcap.pcap_compile_nopcap(65535, 1, ctypes.byref(program), capture_filter.encode(), 1, 0xFFFFFFFF) == 0
+    try:
+        data = raw(Ether() / packet)
+        header = pcap_pkthdr()
+        header.caplen = header.len = len(data)
+        return libpcap.pcap_offline_filter(ctypes.byref(program), ctypes.byref(header), data) != 0
+    finally:
+        libpcap.pcap_freecode(ctypes.byref(program))
+
+
+def test_client_capture_filter_expression():
+    assert client_capture_filter(SERVER_IP, SERVER_PORT) == (
+        f"ip and not (host {SERVER_IP} and tcp port {SERVER_PORT}) and not net 127.0.0.0/8"
+        " and not dst host 255.255.255.255 and not dst net 224.0.0.0/4")
+    assert client_capture_filter(SERVER_IP, SERVER_PORT, LOCAL_IP).startswith(f"ip and src host {LOCAL_IP} and not (")
+
+
+def test_route_source_address():
+    assert route_source_address('127.0.0.1') == '127.0.0.1'
+    assert route_source_address('not-an-address') is None
+
+
+@pytest.mark.skipif(libpcap is None, reason="libpcap indisponible")
+def test_filter_excludes_tunnel_traffic():
+    capture_filter = client_capture_filter(SERVER_IP, SERVER_PORT, LOCAL_IP)
+    excluded = [
+        # Le flux TLS du tunnel, dans les deux sens
+        IP(src=LOCAL_IP, dst=SERVER_IP) / TCP(sport=50000, dport=SERVER_PORT),
+        IP(src=SERVER_IP, dst=LOCAL_IP) / TCP(sport=SERVER_PORT, dport=50000),
+        # Loopback, diffusion, multicast
+        IP(src='127.0.0.1', dst='127.0.0.1') / UDP(dport=53),
+        IP(src=LOCAL_IP, dst='255.255.255.255') / UDP(sport=68, dport=67),
+        IP(src=LOCAL_IP, dst='224.0.0.251') / UDP(sport=5353, dport=5353),
+        # Réponses injectées par le tunnel (non émises par cette machine)
+        IP(src='198.51.100.7', dst=LOCAL_IP) / UDP(sport=53, dport=40000),
+    ]
+    tunneled = [
+        IP(src=LOCAL_IP, dst='198.51.100.7') / UDP(sport=40000, dport=53),
+        IP(src=LOCAL_IP, dst='198.51.100.7') / TCP(sport=40000, dport=443),
+        IP(src=LOCAL_IP, dst='198.51.100.7') / ICMP(),
+        # Autres services de l'hôte VPN: seul le port du tunnel est exclu
+        IP(src=LOCAL_IP, dst=SERVER_IP) / TCP(sport=50001, dport=443),
+        IP(src=LOCAL_IP, dst=SERVER_IP) / UDP(sport=50001, dport=SERVER_PORT),
+    ]
+    assert [bpf_matches(capture_filter, packet) for packet in excluded] == [False] * len(excluded)
+    assert [bpf_matches(capture_filter, packet) for packet in tunneled] == [True] * len(tunneled)
+
+
+class FakeListen:
+    """Remplace conf.L2listen: enregistre le filtre de chaque socket de capture ouvert"""
+
+    opened = []
+
+    def __init__(self, filter=None):
+        self.filter = filter
+        self.closed = False
+        FakeListen.opened.append(self)
+
+    @staticmethod
+    def select(sockets, timeout):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_listen(monkeypatch):
+    FakeListen.opened = []
+    monkeypatch.setattr(conf, 'L2listen', FakeListen)
+    return FakeListen.opened
+
+
+@pytest.fixture
+def packet_io():
+    sock, peer = socket.socketpair()
+    packet_io = ScapyPacketIO(injector=RawInjector(sock=sock))
+    yield packet_io
+    packet_io.close()
+    sock.close()
+    peer.close()
+
+
+def test_pending_filter_applied_on_open_and_refresh(fake_listen, packet_io):
+    assert packet_io.set_capture_filter('ip and not net 127.0.0.0/8')
+    packet_io.open()
+    assert [listen.filter for listen in fake_listen] == ['ip and not net 127.0.0.0/8']
+    assert packet_io.pending_filter is None
+
+    assert not packet_io.set_capture_filter('ip and not net 127.0.0.0/8')  # Inchangé
+    assert packet_io.set_capture_filter('ip and udp')
+    assert len(fake_listen) == 1  # Rouvert par le thread de capture, pas par l'appelant
+    assert packet_io.read_packet(timeout=0) is None
+    assert [listen.filter for listen in fake_listen] == ['ip and not net 127.0.0.0/8', 'ip and udp']
+    assert fake_listen[0].closed and not fake_listen[1].closed
+    assert (packet_io.capture_filter, packet_io.pending_filter) == ('ip and udp', None)
+
+
+def test_tunnel_refreshes_capture_filter(fake_listen, packet_io):
+    server = socket.create_server(('127.0.0.1', 0))
+    client_sock = socket.create_connection(server.getsockname())
+    accepted, _ = server.accept()
+    try:
+        tunnel = VpnTunnel(client_sock, is_client=True, packet_io=packet_io)
+        assert tunnel.refresh_capture_filter()
+        port = server.getsockname()[1]
+        assert packet_io.pending_filter == client_capture_filter('127.0.0.1', port, '127.0.0.1')
+        assert not tunnel.refresh_capture_filter()  # Même route, même serveur
+        packet_io.open()
+        assert fake_listen[0].filter == client_capture_filter('127.0.0.1', port, '127.0.0.1')
+        tunnel.series.release()
+    finally:
+        accepted.close()
+        client_sock.close()
+        server.close()
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from vpn.datagram import (CIPHERS, DATAGRAM_HEADER, DatagramChannel, ReplayWindow, decode_grant, decode_message,
+                          derive_keys, encode_grant)
+from vpn.framing import encode_frame
+
+
+def test_replay_window_in_order_and_duplicates():
+    window = ReplayWindow()
+    assert not window.accept(0)  # Le premier numéro envoyé est 1
+    assert [window.accept(seq) for seq in range(1, 6)] == [True] * 5
+    assert not window.accept(5)
+    assert not window.accept(3)
+
+
+def test_replay_window_out_of_order_within_window():
+    window = ReplayWindow(size=8)
+    assert window.accept(10)
+    assert window.accept(7)
+    assert window.accept(3)  # Plus ancien numéro de la fenêtre: highest - 7
+    assert not window.accept(7)
+    assert not window.accept(2)  # Sorti de la fenêtre, même jamais reçu
+    assert window.accept(9)
+
+
+def test_replay_window_slides():
+    window = ReplayWindow(size=8)
+    assert window.accept(1)
+    assert window.accept(12)  # Décale de 11 (plus que la fenêtre): l'historique est oublié
+    assert not window.accept(4)
+    assert window.accept(5)
+    assert window.accept(14)
+    assert not window.accept(6)  # highest - 8: sorti après le glissement
+    assert window.accept(7)
+    assert not window.accept(12) and not window.accept(14)
+    assert window.accept(13)
+
+
+def test_derive_keys_separates_directions():
+    secret = os.urandom(32)
+    client_key, host_key = derive_keys(secret)
+    assert len(client_key) == len(host_key) == 32
+    assert client_key != host_key
+    assert derive_keys(secret) == (client_key, host_key)
+    assert derive_keys(os.urandom(32))[0] != client_key
+
+
+def channels(cipher, secret=None):
+    secret = secret or os.urandom(32)
+    client = DatagramChannel(7, secret, cipher, is_client=True, sock=None)
+    host = DatagramChannel(7, secret, cipher, is_client=False, sock=None)
+    return client, host
+
+
+@pytest.mark.parametrize('cipher', sorted(CIPHERS))
+def test_round_trip_both_directions(cipher):
+    client, host = channels(cipher)
+    frame = encode_frame([b'\x45' + bytes(39), b'\x45' + bytes(59)])
+    assert host.open(client.seal(frame)) == frame
+    assert client.open(host.seal(frame)) == frame
+    assert (host.datagrams_received, client.datagrams_received) == (1, 1)
+
+
+@pytest.mark.parametrize('cipher', sorted(CIPHERS))
+def test_keys_differ_per_direction(cipher):
+    client, host = channels(cipher)
+    frame = encode_frame([b'\x45' + bytes(39)])
+    # Un datagramme renvoyé à son émetteur (réflexion) ne s'ouvre pas avec la clé de l'autre sens
+    assert client.open(client.seal(frame)) is None
+    assert host.open(host.seal(frame)) is None
+    other_client, _ = channels(cipher)
+    assert host.open(other_client.seal(frame)) is None
+    assert host.rejected == 2
+
+
+@pytest.mark.parametrize('offset', [
+    0,  # Type
+    1,  # Identifiant de session (authentifié comme données associées)
+    DATAGRAM_HEADER.size - 1,  # Numéro
+    DATAGRAM_HEADER.size + 2,  # Trame chiffrée
+    -1,  # Tag
+])
+def test_tampering_is_rejected(offset):
+    client, host = channels('aes-gcm')
+    datagram = bytearray(client.seal(encode_frame([b'\x45' + bytes(39)])))
+    datagram[offset] ^= 0x01
+    assert host.open(bytes(datagram)) is None
+    assert host.datagrams_received == 0
+
+
+def test_forged_datagram_does_not_move_window():
+    client, host = channels('aes-gcm')
+    first = client.seal(b'first')
+    forged = bytearray(client.seal(b'forged'))
+    # Numéro falsifié très loin devant: rejeté avant d'atteindre la fenêtre
+    forged[5:13] = (10 ** 6).to_bytes(8, 'big')
+    assert host.open(bytes(forged)) is None
+    assert host.replay.highest == 0
+    assert host.open(first) == b'first'
+
+
+def test_replayed_datagram_is_rejected():
+    client, host = channels('chacha20-poly1305')
+    datagrams = [client.seal(bytes([i])) for i in range(3)]
+    assert host.open(datagrams[2]) == b'\x02'
+    assert host.open(datagrams[0]) == b'\x00'  # En retard mais dans la fenêtre
+    assert host.open(datagrams[2]) is None
+    assert host.open(datagrams[0]) is None
+    assert host.replayed == 2
+
+
+def test_grant_round_trip():
+    secret = os.urandom(32)
+    grant = encode_grant(1195, 42, 'aes-gcm', secret)
+    assert decode_grant(decode_message(grant)) == (1195, 42, 'aes-gcm', secret)
+    assert decode_grant(decode_message(b'udp=')) is None
+    assert decode_message(b'compress=zlib') is None
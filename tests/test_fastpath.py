@@ -0,0 +1,84 @@
+import random
+
+import pytest
+from scapy.all import ICMP, IP, TCP, UDP, Raw
+
+from vpn.conntrack import ConnTrack
+from vpn.nat import translate_inbound, translate_inbound_scapy, translate_outbound, translate_outbound_scapy
+
+PUBLIC_IP = '203.0.113.1'
+KINDS = ('tcp_options', 'tcp', 'udp', 'udp_no_checksum', 'icmp')
+
+
+def client_packet(kind, rng, seq):
+    """Paquet client du type demandé, champs et contenu tirés au hasard"""
+    ip = IP(src=f"10.8.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            dst=f"198.51.100.{rng.randrange(1, 255)}",
+            ttl=rng.randrange(1, 255), id=rng.randrange(65536))
+    payload = Raw(bytes(rng.randrange(256) for _ in range(rng.choice([0, 1, 17, 512, 1400]))))
+    sport = rng.randrange(1, 65536)
+    if kind == 'tcp_options':
+        pkt = ip / TCP(sport=sport, dport=rng.choice([80, 443, 22]), flags=rng.choice(['S', 'A', 'PA', 'FA']),
+                       seq=rng.randrange(2 ** 32), options=[('MSS', 1460), ('NOP', None), ('WScale', 7)]) / payload
+    elif kind == 'tcp':
+        pkt = ip / TCP(sport=sport, dport=443, flags='PA') / payload
+    elif kind == 'udp':
+        pkt = ip / UDP(sport=sport, dport=53) / payload
+    elif kind == 'udp_no_checksum':
+        pkt = ip / UDP(sport=sport, dport=123, chksum=0) / payload
+    else:
+        pkt = ip / ICMP(type=8, id=rng.randrange(65536), seq=seq & 0xFFFF) / payload
+    return bytes(pkt)
+
+
+def reply_for(packet):
+    """Réponse du correspondant à un paquet traduit (sans somme UDP si l'aller n'en avait pas)"""
+    pkt = IP(packet)
+    reply = IP(src=pkt.dst, dst=pkt.src)
+    if TCP in pkt:
+        reply = reply / TCP(sport=pkt[TCP].dport, dport=pkt[TCP].sport, flags='A') / Raw(b'r' * 40)
+    elif UDP in pkt:
+        udp = UDP(sport=pkt[UDP].dport, dport=pkt[UDP].sport)
+        if pkt[UDP].chksum == 0:
+            udp.chksum = 0
+        reply = reply / udp / Raw(b'r' * 40)
+    else:
+        reply = reply / ICMP(type=0, id=pkt[ICMP].id, seq=pkt[ICMP].seq)
+    return bytes(reply)
+
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_translation_matches_scapy(kind):
+    rng = random.Random(kind)
+    fast = ConnTrack(PUBLIC_IP)
+    slow = ConnTrack(PUBLIC_IP)
+    session = object()
+    for seq in range(100):
+        packet = client_packet(kind, rng, seq)
+        expected = translate_outbound_scapy(slow, session, packet)
+        got = translate_outbound(fast, session, packet)
+        assert bytes(got) == expected, IP(packet).summary()
+        if kind == 'udp_no_checksum':
+            assert IP(expected)[UDP].chksum == 0
+
+        reply = reply_for(expected)
+        expected_session, expected_reply = translate_inbound_scapy(slow, reply)
+        got_session, got_reply = translate_inbound(fast, reply)
+        assert got_session is expected_session is session
+        assert bytes(got_reply) == expected_reply, IP(reply).summary()
+        assert IP(bytes(got_reply)).dst == IP(packet).src
+
+
+def test_non_initial_fragment_matches_scapy():
+    # Pas d'en-tête L4: seule l'adresse source est traduite
+    packet = bytes(IP(src='10.8.0.9', dst='198.51.100.7', proto=17, frag=185) / Raw(b'x' * 64))
+    expected = translate_outbound_scapy(ConnTrack(PUBLIC_IP), object(), packet)
+    got = translate_outbound(ConnTrack(PUBLIC_IP), object(), packet)
+    assert bytes(got) == expected
+    assert IP(expected).src == PUBLIC_IP
+
+
+def test_unknown_reply_is_dropped():
+    reply = bytes(IP(src='198.51.100.7', dst=PUBLIC_IP) / UDP(sport=53, dport=40000) / Raw(b'r'))
+    assert translate_inbound(ConnTrack(PUBLIC_IP), reply) is None
+    assert translate_inbound_scapy(ConnTrack(PUBLIC_IP), reply) is None
@@ -0,0 +1,122 @@
+import asyncio
+import socket
+
+import pytest
+
+from vpn.framing import (FLAG_CONTROL, FRAME_HEADER, FRAME_VERSION, MAX_FRAME_PAYLOAD, FrameDecoder, FrameError,
+                         decode_frame, encode_control, encode_frame, read_frame_async)
+
+
+class ChunkedSocket:
+    """Socket factice qui livre le flux par morceaux de tailles imposées (frontières de recv arbitraires)"""
+
+    def __init__(self, data, sizes):
+        self.data = memoryview(data)
+        self.sizes = list(sizes)
+
+    def recv_into(self, buffer):
+        size = self.sizes.pop(0) if self.sizes else len(self.data)
+        n = min(size, len(buffer), len(self.data))
+        buffer[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def batches():
+    return [
+        [b'\x45' + bytes(39)],
+        [bytes([i]) * (20 + i) for i in range(10)],
+        [b'', b'x' * 1500, b'y'],
+    ]
+
+
+def read_all(decoder):
+    frames = []
+    while True:
+        frame = decoder.read_frame()
+        if frame is None:
+            return frames
+        frames.append((frame[0], [bytes(packet) for packet in frame[1]]))
+
+
+def test_round_trip_batches():
+    stream = b''.join(encode_frame(packets) for packets in batches())
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(stream)
+        a.shutdown(socket.SHUT_WR)
+        assert read_all(FrameDecoder(b)) == [(0, packets) for packets in batches()]
+
+
+def test_decode_frame_in_memory():
+    for packets in batches():
+        flags, decoded = decode_frame(encode_frame(packets))
+        assert flags == 0 and [bytes(p) for p in decoded] == packets
+
+
+@pytest.mark.parametrize('sizes', [
+    [1] * 10000,  # Un octet par recv: en-têtes et paquets coupés partout
+    [3, 5, 7, 11, 13, 17, 19, 23] * 300,
+    [FRAME_HEADER.size - 1, 1, 2],  # En-tête coupé, puis données partielles
+])
+def test_split_across_recv_boundaries(sizes):
+    stream = b''.join(encode_frame(packets) for packets in batches())
+    # Petit tampon: les octets restants sont recopiés en tête, puis le tampon grandit
+    decoder = FrameDecoder(ChunkedSocket(stream, sizes), buffer_size=64)
+    assert read_all(decoder) == [(0, packets) for packets in batches()]
+    assert decoder.frames_received == len(batches())
+    assert decoder.bytes_received == len(stream)
+
+
+def test_control_frame():
+    decoder = FrameDecoder(ChunkedSocket(encode_control(b'compress=zlib'), [2, 100]))
+    assert decoder.read_frame() == (FLAG_CONTROL, [b'compress=zlib'])
+
+
+@pytest.mark.parametrize('cut', [3, FRAME_HEADER.size, FRAME_HEADER.size + 5])
+def test_truncated_frame(cut):
+    frame = encode_frame([b'a' * 100])
+    with pytest.raises(FrameError):
+        FrameDecoder(ChunkedSocket(frame[:cut], [])).read_frame()
+
+
+def test_bad_version():
+    frame = bytearray(encode_frame([b'a' * 10]))
+    frame[0] = FRAME_VERSION + 1
+    with pytest.raises(FrameError):
+        FrameDecoder(ChunkedSocket(bytes(frame), [])).read_frame()
+    with pytest.raises(FrameError):
+        decode_frame(bytes(frame))
+
+
+def test_oversized_frame():
+    header = FRAME_HEADER.pack(FRAME_VERSION, 0, 1, MAX_FRAME_PAYLOAD + 1)
+    with pytest.raises(FrameError):
+        FrameDecoder(ChunkedSocket(header, [])).read_frame()
+    with pytest.raises(FrameError):
+        encode_frame([b'a' * 60000] * 20)
+
+
+def test_inconsistent_packet_lengths():
+    frame = bytearray(encode_frame([b'a' * 10, b'b' * 10]))
+    frame[FRAME_HEADER.size + 1] = 11  # Premier paquet annoncé plus long qu'il ne l'est
+    with pytest.raises(FrameError):
+        decode_frame(bytes(frame))
+
+
+def test_read_frame_async():
+    async def read(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        frames = []
+        while True:
+            frame = await read_frame_async(reader)
+            if frame is None:
+                return frames
+            frames.append([bytes(packet) for packet in frame[1]])
+
+    stream = b''.join(encode_frame(packets) for packets in batches())
+    assert asyncio.run(read(stream)) == batches()
+    with pytest.raises(FrameError):
+        asyncio.run(read(stream[:-1]))
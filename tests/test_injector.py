@@ -0,0 +1,67 @@
+import socket
+
+import pytest
+
+from vpn import injector
+from vpn.injector import RawInjector
+
+
+@pytest.fixture
+def pair():
+    sock, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    peer.settimeout(1)
+    yield sock, peer
+    sock.close()
+    peer.close()
+
+
+def packets(count):
+    return [bytes([0x45]) + bytes([i]) * (20 + i) for i in range(count)]
+
+
+def received(peer, count):
+    return [peer.recv(65535) for _ in range(count)]
+
+
+@pytest.mark.skipif(injector._sendmmsg is None, reason="sendmmsg indisponible")
+def test_batch_with_sendmmsg(pair):
+    sock, peer = pair
+    raw = RawInjector(sock=sock)
+    assert raw.use_sendmmsg
+    raw.open()
+    assert raw.inject_batch(packets(16)) == 16
+    assert received(peer, 16) == packets(16)
+    assert (raw.packets_injected, raw.batches_injected, raw.errors) == (16, 1, 0)
+    raw.close()
+    assert sock.fileno() != -1  # Socket fourni: pas fermé par l'injecteur
+
+
+def test_batch_fallback_without_sendmmsg(pair, monkeypatch):
+    sock, peer = pair
+    monkeypatch.setattr(injector, '_sendmmsg', None)
+    raw = RawInjector(sock=sock)
+    assert not raw.use_sendmmsg
+    assert raw.inject_batch(packets(5)) == 5
+    assert received(peer, 5) == packets(5)
+    assert (raw.packets_injected, raw.batches_injected) == (5, 0)
+
+
+def test_single_packet_and_empty_batch(pair):
+    sock, peer = pair
+    raw = RawInjector(sock=sock)
+    assert raw.inject_batch([]) == 0
+    assert raw.inject_batch(packets(1)) == 1
+    raw.inject(b'\x45single')
+    assert received(peer, 2) == packets(1) + [b'\x45single']
+
+
+@pytest.mark.parametrize('use_sendmmsg', [True, False])
+def test_errors_are_counted(pair, use_sendmmsg):
+    sock, peer = pair
+    raw = RawInjector(sock=sock, use_sendmmsg=use_sendmmsg)
+    peer.close()  # Plus de destinataire: chaque envoi échoue
+    assert raw.inject_batch(packets(3)) == 0
+    assert raw.errors == 3
+    with pytest.raises(OSError):
+        raw.inject(b'\x45')
+    assert raw.errors == 4
@@ -0,0 +1,25 @@
+from vpn.metrics import REGISTRY, SESSION_PACKETS, UserSeries
+
+
+def user_lines(username):
+    return [line for line in REGISTRY.render().splitlines() if f'user="{username}"' in line]
+
+
+def test_user_series_removed_with_last_session():
+    first = UserSeries('churn')
+    second = UserSeries('churn')
+    assert first.rx_packets is second.rx_packets
+    first.rx_packets.inc(3)
+    assert 'vpn_session_packets_total{user="churn",direction="rx"} 3' in user_lines('churn')
+
+    first.release()
+    first.release()  # Idempotent: ne libère pas la série de la seconde session
+    assert user_lines('churn')
+    second.release()
+    assert user_lines('churn') == []
+    assert ('churn', 'rx') not in SESSION_PACKETS.children
+
+    # Reconnexion: nouvelles séries, comptées depuis zéro
+    again = UserSeries('churn')
+    assert again.rx_packets.value == 0
+    again.release()
@@ -0,0 +1,95 @@
+import socket
+import threading
+
+import pytest
+from scapy.all import IP, UDP, raw
+
+from vpn import VpnTunnel
+from vpn.injector import RawInjector
+from vpn.packet_io import (NullPacketIO, ScapyPacketIO, SocketPairPacketIO, TunPacketIO,
+                           create_packet_io)
+
+PUBLIC_IP = '198.51.100.1'
+CLIENT_IP = '10.8.0.2'
+REMOTE_IP = '192.0.2.1'
+
+
+def recv_packet(sock, timeout=5):
+    sock.settimeout(timeout)
+    return IP(sock.recv(65535))
+
+
+@pytest.fixture
+def tunnels():
+    """Un client et un hôte autonome reliés par un socketpair, chacun avec un faux backend de paquets"""
+    client_sock, host_sock = socket.socketpair()
+    client = VpnTunnel(client_sock, is_client=True, packet_io=SocketPairPacketIO(), batch_delay=0)
+    host = VpnTunnel(host_sock, is_client=False, server_ip=PUBLIC_IP, packet_io=SocketPairPacketIO(), batch_delay=0)
+    host_thread = threading.Thread(target=host.start_tunnel, daemon=True)
+    host_thread.start()
+    client.start_tunnel()
+    yield client, host
+    client.stop_tunnel()
+    host.stop_tunnel()
+    client.client_send_thread.join(5)
+    client.client_receive_thread.join(5)
+    host_thread.join(5)
+
+
+def test_packet_crosses_tunnel_and_reply_comes_back(tunnels):
+    client, host = tunnels
+    request = IP(src=CLIENT_IP, dst=REMOTE_IP) / UDP(sport=5353, dport=53) / b'query'
+    client.packet_io.peer.send(raw(request))
+
+    # Sortie côté hôte: source traduite vers l'adresse publique
+    forwarded = recv_packet(host.packet_io.peer)
+    assert forwarded.src == PUBLIC_IP
+    assert forwarded.dst == REMOTE_IP
+    assert forwarded[UDP].dport == 53
+    assert bytes(forwarded[UDP].payload) == b'query'
+    nat_port = forwarded[UDP].sport
+
+    # Réponse du réseau: NAT inverse puis livraison sur le backend du client
+    reply = IP(src=REMOTE_IP, dst=PUBLIC_IP) / UDP(sport=53, dport=nat_port) / b'answer'
+    host.packet_io.peer.send(raw(reply))
+    delivered = recv_packet(client.packet_io.peer)
+    assert delivered.src == REMOTE_IP
+    assert delivered.dst == CLIENT_IP
+    assert delivered[UDP].dport == 5353
+    assert bytes(delivered[UDP].payload) == b'answer'
+    assert client.client_packets_sent == 1
+    assert client.client_packets_received == 1
+
+
+def test_socketpair_backend_round_trip():
+    packet_io = SocketPairPacketIO()
+    try:
+        packet_io.open()
+        assert packet_io.read_packet(timeout=0) is None
+        packet_io.peer.send(b'captured')
+        assert packet_io.read_packet(timeout=1) == b'captured'
+        packet_io.write_packets([b'first', b'second'])
+        assert [packet_io.peer.recv(100), packet_io.peer.recv(100)] == [b'first', b'second']
+    finally:
+        packet_io.close()
+
+
+def test_create_packet_io_by_name():
+    fake = create_packet_io('fake')
+    try:
+        assert isinstance(fake, SocketPairPacketIO)
+    finally:
+        fake.close()
+    assert isinstance(create_packet_io('null'), NullPacketIO)
+    tun = create_packet_io('tun', name='tun7', mtu=1400)
+    assert isinstance(tun, TunPacketIO)
+    assert (tun.name, tun.mtu) == ('tun7', 1400)
+    scapy_io = create_packet_io('scapy', capture_filter='udp')
+    assert isinstance(scapy_io, ScapyPacketIO)
+    assert scapy_io.capture_filter == 'udp' and scapy_io.owns_injector
+    # Injecteur fourni par l'hôte: partagé, jamais fermé par le backend
+    injector = RawInjector()
+    shared = create_packet_io('scapy', injector=injector)
+    assert shared.injector is injector and not shared.owns_injector
+    with pytest.raises(ValueError):
+        create_packet_io('pcap')
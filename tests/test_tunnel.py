@@ -0,0 +1,16 @@
+import socket
+
+from vpn import VpnTunnel
+from vpn.packet_io import SocketPairPacketIO
+
+
+def test_client_tunnel_accepts_hostname():
+    # Régression: le client ne construit pas de table NAT, server_ip peut être un nom d'hôte
+    local, remote = socket.socketpair()
+    try:
+        for server_ip in ('localhost', None):
+            tunnel = VpnTunnel(local, is_client=True, server_ip=server_ip, packet_io=SocketPairPacketIO())
+            assert tunnel.conntrack is None
+    finally:
+        local.close()
+        remote.close()
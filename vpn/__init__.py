@@ -1,7 +1,9 @@
 from .core import VPNHost, VPNClient
+from .aio_host import AsyncVPNHost
 from .admin import AdminInterface
 from .certs import CertificateManager
 from .user_manager import UserManager
 from .tunnel import VpnTunnel
+from .workers import WorkerSupervisor
 
 __version__ = "1.0.0"
\ No newline at end of file
@@ -1,35 +1,35 @@
-from flask import Flask, request, jsonify, render_template_string, redirect, send_file
+from cryptography.hazmat.primitives import serialization
+from flask import Flask, Response, request, jsonify, redirect
+from werkzeug.serving import make_server
 from .user_manager import UserManager
-from .certs import CertificateManager
+from .bundles import BundleCache
+from .certs import CertificateManager, certificate_fingerprint, file_fingerprint
+from .issuance import Issuer, KeyPool
+from .listing import RenderCache, UserIndex
+from .metrics import REGISTRY
+from .profiling import PROFILER
+from .log import setup_logging
+import logging
+import multiprocessing
+import signal
 import threading
 import os
 import shutil
 
-class AdminInterface:
-    def __init__(self, port=80, user_manager=None, cert_manager=None):
-        self.port = port
-        self.user_manager = user_manager or UserManager()
-        self.cert_manager = cert_manager or CertificateManager()
-        self.app = Flask(__name__)
-        self.app.config['UPLOAD_FOLDER'] = 'uploads'
-        os.makedirs(self.app.config['UPLOAD_FOLDER'], exist_ok=True)
-        self.setup_routes()
+try:
+    import waitress
+    from waitress import wasyncore
+except ImportError:  # Requis par le serveur par défaut: run() échoue sans lui, sauf server='werkzeug'
+    waitress = None
 
-    def setup_routes(self):
-        @self.app.route('/')
-        def index():
-            from flask import request
-            users = []
-            for username in self.user_manager.list_users():
-                user_info = self.user_manager.get_user(username)
-                users.append({
-                    'name': username,
-                    'folder': user_info['folder'],
-                    'cert_file': user_info['cert_file'],
-                    'key_file': user_info['key_file']
-                })
-            host = request.host
-            html = """
+logger = logging.getLogger(__name__)
+
+SERVERS = ('waitress', 'werkzeug')
+ADMIN_THREADS = 8  # Requêtes servies en parallèle (téléchargements simultanés)
+PAGE_SIZE = 50  # Utilisateurs par page de l'interface
+API_MAX_LIMIT = 1000
+
+INDEX_TEMPLATE = """
             <html>
             <head>
                 <title>Personal VPN Admin</title>
@@ -68,6 +68,8 @@ class AdminInterface:
                     
                     <h3>Configuration des certificats</h3>
                     <p>Les certificats sont générés automatiquement lors de la première connexion. Si vous voulez les configurer manuellement :</p>
+                    <p>Le plus simple: téléchargez le paquet de l'utilisateur (certificat, clé et CA dans un seul fichier)
+                    et lancez <code>python client.py &lt;username&gt; --bundle &lt;username&gt;.pem</code>. Sinon :</p>
                     <ol>
                         <li>Téléchargez le certificat et la clé de l'utilisateur depuis la liste ci-dessus</li>
                         <li>Créez un dossier <code>users/&lt;username&gt;</code> côté client</li>
@@ -82,19 +84,28 @@ class AdminInterface:
                     </ol>
                 </div>
                 
-                <h2>Utilisateurs existants</h2>
+                <h2>Utilisateurs existants ({{ total }})</h2>
+                <form method="GET" action="/">
+                    <label>Rechercher (début du nom): <input type="text" name="q" value="{{ prefix }}"></label>
+                    <button type="submit">Rechercher</button>
+                </form>
                 <ul>
                 {% for user in users %}
                     <li>
                         <strong>{{ user.name }}</strong>
                         <div class="user-info">
                             <p><strong>Dossier:</strong> {{ user.folder }}</p>
+                            <p><strong>Paquet:</strong> {{ user.bundle or user.name + '.pem' }} 
+                            <a class="download-link" href="/bundle/{{ user.name }}">Télécharger</a></p>
                             <p><strong>Certificat:</strong> {{ user.cert_file }} 
                             <a class="download-link" href="/download/{{ user.name }}/cert">Télécharger</a></p>
                             <p><strong>Clé:</strong> {{ user.key_file }} 
                             <a class="download-link" href="/download/{{ user.name }}/key">Télécharger</a></p>
                             <p><strong>Certificat CA:</strong> ca.crt 
                             <a class="download-link" href="/download/ca">Télécharger</a></p>
+                            <form method="POST" action="/revoke_user/{{ user.name }}" style="display:inline;">
+                                <button type="submit" style="background:#fd7e14; color:white; border:none; padding:5px 10px; border-radius:3px; cursor:pointer;" onclick="return confirm('Révoquer le certificat actuel de cet utilisateur ?')">Révoquer le certificat</button>
+                            </form>
                             <form method="POST" action="/delete_user/{{ user.name }}" style="display:inline;">
                                 <button type="submit" style="background:#dc3545; color:white; border:none; padding:5px 10px; border-radius:3px; cursor:pointer;" onclick="return confirm('Êtes-vous sûr de vouloir supprimer cet utilisateur ?')">Supprimer</button>
                             </form>
@@ -102,11 +113,23 @@ class AdminInterface:
                     </li>
                 {% endfor %}
                 </ul>
+                {% if pages > 1 %}
+                <p>
+                    {% if page > 1 %}<a href="/?page={{ page - 1 }}{% if prefix %}&amp;q={{ prefix | urlencode }}{% endif %}">&laquo; Précédente</a>{% endif %}
+                    Page {{ page }} / {{ pages }}
+                    {% if page < pages %}<a href="/?page={{ page + 1 }}{% if prefix %}&amp;q={{ prefix | urlencode }}{% endif %}">Suivante &raquo;</a>{% endif %}
+                </p>
+                {% endif %}
                 <h2>Créer un nouvel utilisateur</h2>
                 <form method="POST" action="/create_user">
                     <label>Nom d'utilisateur: <input type="text" name="username" required></label><br>
                     <button type="submit">Créer</button>
                 </form>
+                <h2>Créer des utilisateurs en masse</h2>
+                <form method="POST" action="/bulk_create">
+                    <label>Noms d'utilisateur (un par ligne): <textarea name="usernames" rows="6" style="width:100%"></textarea></label><br>
+                    <button type="submit">Créer</button>
+                </form>
                 <h2>Déposer des clés pour un utilisateur existant</h2>
                 <form method="POST" action="/upload_keys" enctype="multipart/form-data">
                     <label>Nom d'utilisateur: <input type="text" name="username" required></label><br>
@@ -114,11 +137,74 @@ class AdminInterface:
                     <label>Clé (.key): <input type="file" name="key" accept=".key" required></label><br>
                     <button type="submit">Déposer</button>
                 </form>
+                <h2>Profilage</h2>
+                <form method="POST" action="/profile/start" style="display:inline;">
+                    <label>Échantillons/s: <input type="number" name="rate" value="100" min="1" max="1000"></label>
+                    <button type="submit">Démarrer</button>
+                </form>
+                <form method="POST" action="/profile/stop" style="display:inline;">
+                    <button type="submit">Arrêter</button>
+                </form>
+                <p><a href="/profile/stages">Temps par étape</a> | <a href="/profile/stacks">Piles repliées (flamegraph)</a></p>
                 </div>
             </body>
             </html>
             """
-            return render_template_string(html, users=users, host=host)
+
+
+class AdminInterface:
+    def __init__(self, port=80, user_manager=None, cert_manager=None, registry=None, key_pool_size=0,
+                 bundle_cache_size=1024, page_size=PAGE_SIZE, server='waitress', threads=ADMIN_THREADS):
+        self.port = port
+        self.server = server  # 'waitress' ou 'werkzeug' (serveur de développement, sur demande explicite)
+        self.threads = threads
+        self.httpd = None
+        self.waitress_map = None  # Sockets de la boucle de waitress
+        self.registry = registry or REGISTRY
+        self.user_manager = user_manager or UserManager()
+        self.cert_manager = cert_manager or CertificateManager()
+        # Clés générées dans un pool de processus (avec key_pool_size clés d'avance)
+        self.key_pool = KeyPool(self.cert_manager.key_type, reserve=key_pool_size)
+        self.key_pool.start()
+        self.issuer = Issuer(self.cert_manager, self.user_manager, self.key_pool)
+        # Paquets d'identifiants servis depuis la mémoire (ETag, GET conditionnels)
+        self.bundles = BundleCache(self.user_manager, self.cert_manager, bundle_cache_size)
+        # Noms triés (pages, recherche par préfixe) et pages rendues, tenus à jour par le UserManager
+        self.page_size = page_size
+        self.user_index = UserIndex(self.user_manager)
+        self.render_cache = RenderCache(self.user_manager)
+        self.app = Flask(__name__)
+        self.index_template = self.app.jinja_env.from_string(INDEX_TEMPLATE)  # Compilé une seule fois
+        self.app.config['UPLOAD_FOLDER'] = 'uploads'
+        os.makedirs(self.app.config['UPLOAD_FOLDER'], exist_ok=True)
+        self.setup_routes()
+
+    def setup_routes(self):
+        @self.app.route('/')
+        def index():
+            prefix = request.args.get('q', '').strip()
+            try:
+                page = max(1, int(request.args.get('page', 1)))
+            except ValueError:
+                page = 1
+            self.user_manager.refresh_if_due()  # Changements des autres processus: vident le cache des pages
+            return self.render_cache.get((request.host, prefix, page), lambda: self.render_index(prefix, page))
+
+        @self.app.route('/api/users')
+        def api_users():
+            # Pagination par curseur: ?prefix=&limit=&cursor= (next_cursor de la réponse précédente)
+            prefix = request.args.get('prefix', '')
+            try:
+                limit = min(max(1, int(request.args.get('limit', 100))), API_MAX_LIMIT)
+                names, next_cursor = self.user_index.after(prefix, request.args.get('cursor'), limit)
+            except ValueError:
+                return jsonify({'error': 'limit ou curseur invalide'}), 400
+            users = []
+            for username in names:
+                user_info = self.user_manager.get_user(username)
+                if user_info is not None:
+                    users.append(self.user_entry(username, user_info))
+            return jsonify({'users': users, 'next_cursor': next_cursor, 'total': self.user_index.count(prefix)})
 
         @self.app.route('/create_user', methods=['POST'])
         def create_user():
@@ -130,21 +216,37 @@ class AdminInterface:
                 return "Utilisateur existe déjà", 400
             
             try:
-                # Générer les certificats pour le nouvel utilisateur
-                ca_key, ca_cert = self.cert_manager.generate_ca_cert()  # Recharger ou utiliser existant
-                # Note: En production, charger le CA existant au lieu de régénérer
-                self.cert_manager.generate_user_cert(username, ca_key, ca_cert)
-                
-                # Ajouter à la liste des utilisateurs
-                folder = f"users/{username}"
-                cert_file = f"{folder}/{username}.crt"
-                key_file = f"{folder}/{username}.key"
-                self.user_manager.add_user(username, folder, cert_file, key_file)
-                
+                # Certificat signé par la CA en mémoire, clé de la réserve ou du pool de processus
+                self.issuer.issue(username)
                 return redirect('/')
+            except ValueError as e:
+                return str(e), 400
             except Exception as e:
                 return f"Erreur: {str(e)}", 500
 
+        @self.app.route('/bulk_create', methods=['POST'])
+        def bulk_create():
+            # JSON {"usernames": [...]} ou champ de formulaire (un nom par ligne, ou séparés par des virgules)
+            data = request.get_json(silent=True)
+            if data is not None:
+                usernames = data.get('usernames') if isinstance(data, dict) else None
+                if not isinstance(usernames, list) or not all(isinstance(name, str) for name in usernames):
+                    return jsonify({'error': 'usernames: liste de noms attendue'}), 400
+            else:
+                usernames = request.form.get('usernames', '').replace(',', '\n').split()
+            usernames = [name.strip() for name in usernames if name.strip()]
+            if not usernames:
+                return jsonify({'error': "Aucun nom d'utilisateur"}), 400
+            job = self.issuer.submit(usernames)
+            return jsonify({'job': job.id, 'status_url': f'/jobs/{job.id}', **job.status()}), 202
+
+        @self.app.route('/jobs/<int:job_id>')
+        def job_status(job_id):
+            status = self.issuer.job_status(job_id)
+            if status is None:
+                return jsonify({'error': 'Tâche inconnue'}), 404
+            return jsonify({**status, 'key_pool': self.key_pool.stats()})
+
         @self.app.route('/upload_keys', methods=['POST'])
         def upload_keys():
             username = request.form.get('username')
@@ -167,11 +269,28 @@ class AdminInterface:
                 
                 cert_file.save(cert_path)
                 key_file.save(key_path)
+                # Seul ce certificat est désormais accepté pour l'utilisateur (l'hôte est notifié)
+                self.user_manager.update_user(username, cert_file=cert_path, key_file=key_path,
+                                              fingerprint=file_fingerprint(cert_path), bundle=None)
                 
                 return redirect('/')
             except Exception as e:
                 return f"Erreur: {str(e)}", 500
 
+        @self.app.route('/revoke_user/<username>', methods=['POST'])
+        def revoke_user(username):
+            user_info = self.user_manager.get_user(username)
+            if not user_info:
+                return "Utilisateur non trouvé", 404
+            
+            try:
+                # Le certificat actuel est refusé dès la prochaine connexion, et la session ouverte coupée
+                fingerprint = user_info.get('fingerprint') or file_fingerprint(user_info['cert_file'])
+                self.user_manager.revoke_certificate(username, fingerprint)
+                return redirect('/')
+            except Exception as e:
+                return f"Erreur: {str(e)}", 500
+
         @self.app.route('/delete_user/<username>', methods=['POST'])
         def delete_user(username):
             if not self.user_manager.get_user(username):
@@ -186,38 +305,165 @@ class AdminInterface:
                     shutil.rmtree(folder)
                 
                 # Supprimer de la liste
-                self.user_manager.users.pop(username, None)
-                self.user_manager.save_users()
+                self.user_manager.remove_user(username)
                 
                 return redirect('/')
             except Exception as e:
                 return f"Erreur: {str(e)}", 500
 
+        @self.app.route('/bundle/<username>')
+        def download_bundle(username):
+            bundle, error = self.get_bundle(username)
+            if error:
+                return error
+            return self.attachment(bundle.data, bundle.etag, f"{username}.pem")
+
         @self.app.route('/download/<username>/<file_type>')
         def download_file(username, file_type):
-            user_info = self.user_manager.get_user(username)
-            if not user_info:
-                return jsonify({'error': 'Utilisateur non trouvé'}), 404
-            
-            if file_type == 'cert':
-                file_path = user_info['cert_file']
-            elif file_type == 'key':
-                file_path = user_info['key_file']
-            else:
+            if file_type not in ('cert', 'key'):
                 return jsonify({'error': 'Type de fichier invalide'}), 400
-            
-            file_path = os.path.abspath(file_path)
-            if os.path.exists(file_path):
-                return send_file(file_path, as_attachment=True, download_name=os.path.basename(file_path))
-            return jsonify({'error': 'Fichier non trouvé'}), 404
+            bundle, error = self.get_bundle(username)
+            if error:
+                return error
+            suffix = '.crt' if file_type == 'cert' else '.key'
+            return self.attachment(bundle.parts[file_type], bundle.part_etag(file_type), f"{username}{suffix}")
 
         @self.app.route('/download/ca')
         def download_ca():
-            ca_path = os.path.abspath('certs/ca.crt')
-            if os.path.exists(ca_path):
-                return send_file(ca_path, as_attachment=True, download_name='ca.crt')
-            return "CA non trouvé", 404
+            # CA en mémoire (fichiers revérifiés au plus une fois par seconde)
+            _, ca_cert = self.cert_manager.current_ca()
+            if ca_cert is None:
+                return "CA non trouvé", 404
+            return self.attachment(ca_cert.public_bytes(serialization.Encoding.PEM),
+                                   certificate_fingerprint(ca_cert)[:32], 'ca.crt')
+
+        @self.app.route('/metrics')
+        def metrics():
+            # Format texte d'exposition Prometheus
+            return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/profile/start', methods=['POST'])
+        def profile_start():
+            try:
+                rate = int(request.form.get('rate', 100))
+            except ValueError:
+                return "Fréquence d'échantillonnage invalide", 400
+            if not 1 <= rate <= 1000:
+                return "Fréquence d'échantillonnage hors limites (1-1000)", 400
+            PROFILER.start(rate)
+            return redirect('/')
+
+        @self.app.route('/profile/stop', methods=['POST'])
+        def profile_stop():
+            PROFILER.stop()
+            return redirect('/')
+
+        @self.app.route('/profile/stages')
+        def profile_stages():
+            return jsonify(status=PROFILER.status(), stages=PROFILER.stage_report())
+
+        @self.app.route('/profile/stacks')
+        def profile_stacks():
+            # Format « replié » de flamegraph.pl, lisible aussi par speedscope
+            return Response(PROFILER.collapsed(), mimetype='text/plain',
+                            headers={'Content-Disposition': 'attachment; filename=vpn-profile.folded'})
+
+    @staticmethod
+    def user_entry(username, user_info):
+        return {
+            'name': username,
+            'folder': user_info['folder'],
+            'cert_file': user_info['cert_file'],
+            'key_file': user_info['key_file'],
+            'bundle': user_info.get('bundle'),
+            'fingerprint': user_info.get('fingerprint')
+        }
+
+    def render_index(self, prefix, page):
+        """Page d'accueil: seuls les utilisateurs de la page demandée sont lus"""
+        total = self.user_index.count(prefix)
+        pages = max(1, -(-total // self.page_size))
+        page = min(page, pages)
+        users = []
+        for username in self.user_index.page(prefix, (page - 1) * self.page_size, self.page_size):
+            user_info = self.user_manager.get_user(username)
+            if user_info is not None:
+                users.append(self.user_entry(username, user_info))
+        return self.index_template.render(users=users, host=request.host, prefix=prefix, page=page, pages=pages,
+                                          total=total)
+
+    def get_bundle(self, username):
+        """(Bundle, None), ou (None, réponse d'erreur)"""
+        try:
+            bundle = self.bundles.get(username)
+        except (OSError, ValueError):
+            return None, (jsonify({'error': 'Fichier non trouvé'}), 404)
+        if bundle is None:
+            return None, (jsonify({'error': 'Utilisateur non trouvé'}), 404)
+        return bundle, None
+
+    @staticmethod
+    def attachment(data, etag, filename):
+        """Fichier en pièce jointe depuis la mémoire; 304 si le client a déjà cette version"""
+        response = Response(data, mimetype='application/x-pem-file',
+                            headers={'Content-Disposition': f'attachment; filename={filename}',
+                                     'Cache-Control': 'private, no-cache'})
+        response.set_etag(etag)
+        return response.make_conditional(request)
 
     def run(self):
-        print(f"Admin interface running on port {self.port}")
-        self.app.run(host='0.0.0.0', port=self.port, debug=False)
\ No newline at end of file
+        """Sert l'interface jusqu'à stop(): waitress (serveur WSGI de production) ou serveur threadé de Werkzeug"""
+        if self.server == 'waitress':
+            if waitress is None:
+                raise RuntimeError("waitress n'est pas installé: pip install waitress, "
+                                   "ou --admin-server werkzeug pour le serveur de développement")
+            self.waitress_map = {}
+            self.httpd = waitress.create_server(self.app, map=self.waitress_map, host='0.0.0.0', port=self.port,
+                                               threads=self.threads)
+            logger.info("Admin interface running on port %d (waitress, %d threads)", self.port, self.threads)
+            self.httpd.run()
+        else:
+            self.httpd = make_server('0.0.0.0', self.port, self.app, threaded=True)
+            logger.info("Admin interface running on port %d (werkzeug)", self.port)
+            self.httpd.serve_forever()
+
+    def stop(self):
+        """Arrête le serveur de run() (appelé depuis un autre thread)"""
+        if self.httpd is None:
+            return
+        if self.waitress_map is not None:
+            # Sockets fermés par la boucle de waitress elle-même, qui s'arrête quand il n'en reste plus
+            self.httpd.task_dispatcher.shutdown()
+            self.httpd.trigger.pull_trigger(lambda: wasyncore.close_all(self.waitress_map))
+        else:
+            self.httpd.shutdown()
+        self.key_pool.close()
+
+
+def run_admin(port, users_file, key_type, admin_kwargs, log_level=None):
+    """Point d'entrée du processus d'administration: sa propre base d'utilisateurs sur les mêmes fichiers que l'hôte"""
+    if log_level is not None:
+        # Le thread d'écriture des journaux du parent n'existe pas dans le processus fils
+        setup_logging(log_level)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # terminate(): arrêt propre du pool de clés
+    admin = AdminInterface(port=port, user_manager=UserManager(users_file),
+                           cert_manager=CertificateManager(key_type=key_type), **admin_kwargs)
+    try:
+        admin.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Un processus fils attend ses propres fils en sortant: le pool doit être arrêté, pas seulement prévenu
+        admin.key_pool.close(wait=True)
+
+
+def start_admin_process(port=80, users_file='users.json', key_type='rsa', log_level=logging.INFO, **admin_kwargs):
+    """Lance l'administration dans un processus séparé (hors du GIL des threads du tunnel)"""
+    # spawn: l'hôte a déjà ses threads (tunnel, journaux) quand il lance l'administration, et un fork
+    # hériterait de leurs verrous dans l'état du moment. Arguments simples, transmis par pickle.
+    # Pas de processus démon: le pool de clés de l'administration lance ses propres processus
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=run_admin, name='vpn-admin',
+                              args=(port, users_file, key_type, dict(admin_kwargs), log_level))
+    process.start()
+    return process
\ No newline at end of file
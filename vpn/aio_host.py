@@ -0,0 +1,398 @@
+import asyncio
+import logging
+import os
+import queue
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .core import VPNHost
+from .framing import (FrameError, FLAG_CONTROL, encode_frame, encode_control, decode_payload, parse_frame,
+                      read_raw_frame_async)
+from .compression import FrameCompressor, offer, choose, encode_offer, decode_offer
+from . import datagram, striping
+from .nat import translate_outbound
+from .sendqueue import SendQueue, DROP_TAIL
+from .profiling import PROFILER, clock
+from .metrics import (UserSeries, PACKET_SECONDS, HANDSHAKE_SECONDS, HANDSHAKE_FAILURES, FRAME_ERRORS,
+                      DATAGRAMS_REJECTED)
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_QUEUE = 1024  # Trames reçues en attente de NAT/injection; au-delà, la lecture du client attend
+
+# La boucle ne fait ni compression ni décompression: les trames reçues sont
+# décodées par le thread outbound, les trames envoyées compressées par un pool
+# de threads (zlib et lz4 relâchent le GIL). Une session qui compresse ne
+# retarde donc pas la lecture, les poignées de main ni les écritures des
+# autres; en contrepartie, chaque trame compressée coûte un aller-retour vers
+# le pool (quelques dizaines de µs, amorties sur les paquets de la trame).
+
+
+class AsyncSession:
+    """Session d'un client sur l'hôte asyncio: lecture, écriture et fermeture en coroutines"""
+
+    def __init__(self, host, reader, writer, username, queue_size=4096, drop_policy=DROP_TAIL, max_frame_bytes=32 * 1024,
+                 compression=None, adaptive_compression=True):
+        self.host = host
+        self.reader = reader
+        self.writer = writer
+        self.username = username
+        self.loop = asyncio.get_running_loop()
+        self.max_frame_bytes = max_frame_bytes
+        self.wakeup = asyncio.Event()
+        self.series = UserSeries(username)  # Libérées à la fin de run()
+        # Paquets en attente d'envoi, remplis depuis le thread reverse NAT; un
+        # seul réveil de la boucle pour tous les paquets accumulés entre-temps
+        self.send_queue = SendQueue(queue_size, drop_policy,
+                                    on_ready=lambda: self.loop.call_soon_threadsafe(self.wakeup.set),
+                                    drop_counter=self.series.queue_drops)
+        self.compression_offer = offer(compression) if compression else []
+        self.adaptive_compression = adaptive_compression
+        self.compressor = None  # Trames envoyées au client
+        self.decompressor = None  # Trames reçues du client
+        self.datagram = None  # DatagramChannel si le client a obtenu le transport datagramme
+        self.stream_group = None  # Groupe de connexions parallèles du client
+        self.nat_session = self  # Propriétaire des flux NAT (le groupe le cas échéant)
+        self.cert_fingerprint = None  # Empreinte du certificat client (révocation des sessions ouvertes)
+        self.closed = False
+        self.packets_received = 0
+        self.packets_sent = 0
+        self.frames_sent = 0
+        self.rx_packets = self.series.rx_packets
+        self.rx_bytes = self.series.rx_bytes
+        self.tx_packets = self.series.tx_packets
+        self.tx_bytes = self.series.tx_bytes
+        self.outbound_latency = PACKET_SECONDS.labels('outbound')
+
+    def send_to_peer(self, packet_data):
+        """Remet un paquet à envoyer au client (appelé depuis n'importe quel thread, sans bloquer)"""
+        return self.send_queue.put(packet_data)
+
+    def disconnect(self):
+        """Coupe la connexion (appelable depuis un autre thread)"""
+        self.host.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def queue_stats(self):
+        """Profondeur et rejets de la file d'envoi de la session"""
+        stats = self.send_queue.stats()
+        stats['frames_sent'] = self.frames_sent
+        return stats
+
+    def compression_stats(self):
+        """Octets économisés et CPU de compression de la session, ou None sans compression"""
+        if self.compressor is None:
+            return None
+        stats = self.compressor.stats()
+        stats['cpu_seconds'] = round(self.compressor.cpu_seconds + self.decompressor.cpu_seconds, 6)
+        return stats
+
+    def handle_control(self, message):
+        """Répond aux demandes du client: compression, transport datagramme"""
+        codecs = decode_offer(message)
+        if codecs is not None:
+            self.negotiate_compression(codecs)
+            return
+        fields = datagram.decode_message(message)
+        if fields is not None:
+            self.negotiate_datagram(fields)
+            return
+        stream_message = striping.decode_message(message)
+        if stream_message is not None:
+            self.negotiate_streams(*stream_message)
+            return
+        logger.warning("Message de contrôle inconnu de %s ignoré", self.username)
+
+    def negotiate_streams(self, key, value):
+        registry = self.host.stream_registry
+        if key == 'streams':
+            group = registry.create(self.username, self, int(value)) if value.isdigit() else None
+            reply = striping.encode_token(group.token if group else None)
+        else:
+            group = registry.join(value, self.username, self)
+            reply = striping.encode_joined(group is not None)
+        if group is not None:
+            # Avant toute trame de paquets: les flux NAT appartiennent au groupe
+            self.stream_group = group
+            self.nat_session = group
+        self.writer.write(encode_control(reply))
+
+    def negotiate_datagram(self, fields):
+        server = self.host.datagram_server
+        if server is None or server.cipher not in fields:
+            self.writer.write(encode_control(datagram.encode_refusal()))
+            return
+        channel, grant = server.register(self)
+        self.max_frame_bytes = datagram.DATAGRAM_FRAME_BYTES
+        self.datagram = channel
+        self.writer.write(encode_control(grant))
+        logger.info("Transport datagramme pour %s (session %d)", self.username, channel.session_id)
+
+    def datagram_received(self, frame):
+        """Trame reçue en datagramme (thread du DatagramServer): remise au thread outbound comme celles du flux TLS"""
+        flags, count, payload = parse_frame(frame)
+        if flags & FLAG_CONTROL:
+            return  # Le contrôle ne passe que par le flux TLS authentifié
+        try:
+            self.host.outbound.put_nowait((self, flags, count, payload))
+        except queue.Full:
+            # Ne jamais bloquer la réception des datagrammes de toutes les sessions: celui-ci est perdu
+            DATAGRAMS_REJECTED.labels('queue_full').inc()
+
+    def datagram_stats(self):
+        return self.datagram.stats() if self.datagram is not None else None
+
+    def negotiate_compression(self, codecs):
+        codec = choose(codecs, self.compression_offer)
+        # Écrit directement: la boucle est seule à écrire, la réponse précède toute trame compressée
+        self.writer.write(encode_control(encode_offer([codec] if codec else [])))
+        if codec is not None:
+            self.decompressor = FrameCompressor(codec)
+            self.compressor = FrameCompressor(codec, self.adaptive_compression)
+            logger.info("Compression des trames pour %s: %s", self.username, codec)
+
+    def compress(self, frame, count):
+        """Compresse une trame (pool de compression de l'hôte, jamais la boucle)"""
+        if PROFILER.enabled:
+            t0 = clock()
+            frame = self.compressor.compress(frame)
+            PROFILER.add('compress', clock() - t0, count)
+            return frame
+        return self.compressor.compress(frame)
+
+    def send_frame(self, frame):
+        channel = self.datagram
+        if channel is not None and channel.peer is not None:
+            try:
+                channel.send_frame(frame)
+                return
+            except OSError:
+                pass  # Datagramme impossible: la trame passe par le flux TLS
+        self.writer.write(frame)
+
+    async def write_loop(self):
+        """Regroupe les paquets en attente en trames et les écrit sur le flux TLS"""
+        while not self.closed:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while True:
+                packets = self.send_queue.take(max_bytes=self.max_frame_bytes, timeout=0)
+                if not packets:
+                    break
+                frame = encode_frame(packets)
+                compressor = self.compressor
+                if compressor is not None and compressor.will_try(frame):
+                    # Une seule trame en cours par session: l'ordre des trames est conservé
+                    frame = await self.loop.run_in_executor(self.host.compress_executor, self.compress, frame,
+                                                            len(packets))
+                if PROFILER.enabled:
+                    # Le chiffrement TLS a lieu dans write(), de façon synchrone
+                    t0 = clock()
+                    self.send_frame(frame)
+                    PROFILER.add('encrypt_send', clock() - t0, len(packets))
+                else:
+                    self.send_frame(frame)
+                self.frames_sent += 1
+                self.packets_sent += len(packets)
+                self.tx_packets.inc(len(packets))
+                self.tx_bytes.inc(sum(len(packet_data) for packet_data in packets))
+                # Un client lent ne bloque que sa propre coroutine; sa file déborde
+                await self.writer.drain()
+
+    async def read_loop(self):
+        """Reçoit les trames du client et les remet au thread outbound (décodage, NAT, injection)"""
+        while True:
+            frame = await read_raw_frame_async(self.reader)
+            if frame is None:
+                return
+            flags, count, payload = frame
+            if flags & FLAG_CONTROL:
+                self.handle_control(payload)
+                continue
+            # Décompression, NAT et injection (socket brut, bloquant) hors de la boucle, dans l'ordre de réception
+            item = (self, flags, count, payload)
+            try:
+                self.host.outbound.put_nowait(item)
+            except queue.Full:
+                # File pleine: seule la lecture de ce client attend, la boucle continue
+                await self.host.loop.run_in_executor(None, self.host.outbound.put, item)
+
+    def forward_frame(self, flags, count, payload):
+        """Décode (et décompresse) une trame reçue du client, puis forwarde ses paquets (thread outbound)"""
+        profiling = PROFILER.enabled
+        if profiling:
+            t0 = clock()
+        packets = decode_payload(flags, memoryview(payload), count, self.decompressor)
+        if profiling:
+            PROFILER.add('decode', clock() - t0, count)
+        self.forward_packets(packets)
+
+    def forward_packets(self, received):
+        """NAT et injection des paquets d'une trame reçue du client (thread outbound uniquement)"""
+        count = len(received)
+        self.rx_packets.inc(count)
+        self.rx_bytes.inc(sum(len(packet_data) for packet_data in received))
+        start = time.perf_counter()
+        profiling = PROFILER.enabled
+        if profiling:
+            t0 = clock()
+        packets = []
+        for packet_data in received:
+            packet_data = translate_outbound(self.host.conntrack, self.nat_session, packet_data)
+            if packet_data is not None:
+                packets.append(packet_data)
+        self.packets_received += count
+        if profiling:
+            t1 = clock()
+            PROFILER.add('nat_outbound', t1 - t0, count)
+        if packets:
+            self.host.packet_io.write_packets(packets)
+            if profiling:
+                PROFILER.add('inject', clock() - t1, len(packets))
+        if count:
+            self.outbound_latency.observe((time.perf_counter() - start) / count, count)
+
+    async def run(self):
+        writer_task = asyncio.create_task(self.write_loop())
+        try:
+            await self.read_loop()
+        except FrameError as e:
+            FRAME_ERRORS.inc()
+            logger.warning("Trame invalide de %s, fermeture: %s", self.username, e)
+        except (ConnectionError, ssl.SSLError) as e:
+            logger.info("Connexion perdue avec %s: %s", self.username, e)
+        finally:
+            self.closed = True
+            self.send_queue.close()
+            writer_task.cancel()
+            if self.stream_group is not None:
+                self.host.stream_registry.leave(self.stream_group, self)
+            else:
+                self.host.conntrack.remove_session(self)
+            if self.datagram is not None:
+                self.host.datagram_server.unregister(self.datagram)
+            self.series.release()
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+class AsyncVPNHost(VPNHost):
+    """Hôte VPN asyncio: poignées de main TLS non bloquantes et sessions en coroutines.
+
+    Un client lent ou malveillant pendant la poignée de main ne bloque plus
+    les autres connexions, et une session inactive ne coûte aucun thread.
+    """
+
+    def __init__(self, *args, max_handshakes=64, handshake_timeout=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_handshakes = max_handshakes
+        self.handshake_timeout = handshake_timeout
+        self.connection_tasks = set()
+        self.outbound = queue.Queue(OUTBOUND_QUEUE)  # (session, flags, nombre, données) à décoder et injecter, dans l'ordre
+        self.compress_executor = ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix='compress')
+        self.loop = None
+        self.accept_task = None
+        self.handshakes_completed = 0
+        self.handshakes_failed = 0
+
+    def start(self):
+        self.start_reverse_path()
+        self.start_datagram_server()
+        self.start_user_watch()
+        threading.Thread(target=self.outbound_path, name='outbound', daemon=True).start()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.outbound.put(None)
+            self.compress_executor.shutdown(wait=False)
+
+    def outbound_path(self):
+        """Décodage, NAT sortant et injection des trames reçues par la boucle: un socket brut lent ne bloque aucune session"""
+        while True:
+            item = self.outbound.get()
+            if item is None:
+                return
+            session, flags, count, payload = item
+            if session.closed:
+                continue  # Ses flux NAT ont déjà été retirés
+            try:
+                session.forward_frame(flags, count, payload)
+            except FrameError as e:
+                # Trame compressée invalide: la connexion est fermée comme sur une erreur de lecture
+                FRAME_ERRORS.inc()
+                logger.warning("Trame invalide de %s, fermeture: %s", session.username, e)
+                session.disconnect()
+            except Exception as e:
+                logger.error("Erreur de transmission des paquets de %s: %s", session.username, e)
+
+    def stop(self):
+        """Arrête le serveur (appelable depuis un autre thread)"""
+        if self.loop is not None and self.accept_task is not None:
+            self.loop.call_soon_threadsafe(self.accept_task.cancel)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.handshake_slots = asyncio.Semaphore(self.max_handshakes)
+        self.server_socket.setblocking(False)
+        self.server_socket.listen(1024)
+        logger.info("VPN Host (SSL, asyncio) started on %s:%s", self.host, self.port)
+        self.accept_task = asyncio.current_task()
+        try:
+            while True:
+                client_socket, addr = await self.loop.sock_accept(self.server_socket)
+                task = asyncio.create_task(self.handle_connection(client_socket, addr))
+                # Garder une référence forte sur la tâche jusqu'à sa fin
+                self.connection_tasks.add(task)
+                task.add_done_callback(self.connection_tasks.discard)
+        except asyncio.CancelledError:
+            pass
+
+    async def handle_connection(self, client_socket, addr):
+        logger.debug("Connection attempt from %s", addr)
+        # Nombre borné de poignées de main TLS simultanées; en attendant, le
+        # ClientHello reste dans le tampon du noyau
+        reader = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(reader)
+        try:
+            async with self.handshake_slots:
+                self.rotate_ticket_keys()
+                start = time.perf_counter()
+                transport, _ = await self.loop.connect_accepted_socket(
+                    lambda: protocol, client_socket, ssl=self.ssl_context,
+                    ssl_handshake_timeout=self.handshake_timeout)
+        except (ssl.SSLError, ConnectionError, asyncio.TimeoutError, OSError) as e:
+            self.handshakes_failed += 1
+            HANDSHAKE_FAILURES.inc()
+            logger.warning("SSL Error: %s", e)
+            client_socket.close()
+            return
+        self.handshakes_completed += 1
+        HANDSHAKE_SECONDS.observe(time.perf_counter() - start)
+        # Les paquets sont déjà regroupés en trames: Nagle n'ajouterait que de la latence
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer = asyncio.StreamWriter(transport, protocol, reader, self.loop)
+
+        # Autorisation hors de la boucle: sur un défaut de cache, relecture des utilisateurs et analyse du DER
+        der = writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+        username, fingerprint = await self.loop.run_in_executor(None, self.authorize, der)
+        if not username:
+            writer.close()
+            return
+
+        logger.info("Authorized connection from %s at %s", username, addr)
+        session = AsyncSession(self, reader, writer, username, queue_size=self.queue_size, drop_policy=self.drop_policy,
+                               max_frame_bytes=self.batch_bytes, compression=self.compression,
+                               adaptive_compression=self.adaptive_compression)
+        session.cert_fingerprint = fingerprint
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+            logger.info("Connection closed for %s", username)
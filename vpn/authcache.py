@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from .certs import certificate_fingerprint, common_name, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Décision d'autorisation par empreinte du certificat client présenté. Le
+# premier passage vérifie que le certificat est bien celui délivré à
+# l'utilisateur de son CN (empreinte de la fiche, ou du fichier .crt pour
+# les fiches plus anciennes) et qu'il n'est pas révoqué; les connexions
+# suivantes ne coûtent qu'un SHA-256 du DER et une recherche dans un dict.
+# Toute modification d'un utilisateur (ajout, suppression, révocation,
+# nouveau certificat) retire ses entrées: la décision suivante est refaite.
+
+AUTHORIZED = 'authorized'
+REVOKED = 'revoked'
+UNKNOWN_USER = 'unknown_user'
+MISMATCH = 'mismatch'  # Certificat valide pour la CA mais pas celui délivré à l'utilisateur
+
+
+class AuthCache:
+    """Cache LRU/TTL empreinte -> (utilisateur, statut), invalidé par le UserManager"""
+
+    def __init__(self, user_manager, max_entries=4096, ttl=300.0):
+        self.user_manager = user_manager
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # empreinte -> (expiration, utilisateur, statut)
+        self.by_user = {}  # utilisateur -> empreintes en cache
+        self.lock = threading.Lock()
+        self.generation = 0  # Incrémenté à chaque invalidation: une décision prise avant n'est pas gardée
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        user_manager.subscribe(self.on_user_change)
+
+    def authorize(self, der, fingerprint=None):
+        """(utilisateur, statut) pour un certificat client DER"""
+        fingerprint = fingerprint or certificate_fingerprint(der)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            generation = self.generation
+        username, status = self.check(der, fingerprint)
+        with self.lock:
+            if generation == self.generation:
+                self._store(fingerprint, now + self.ttl, username, status)
+        return username, status
+
+    def check(self, der, fingerprint):
+        """Décision complète, sans cache"""
+        username = common_name(der)
+        info = self.user_manager.get_user(username) if username else None
+        if info is None:
+            return username, UNKNOWN_USER
+        if fingerprint in info.get('revoked', ()):
+            return username, REVOKED
+        issued = info.get('fingerprint')
+        if issued is None:
+            try:
+                issued = file_fingerprint(info['cert_file'])
+            except (OSError, ValueError) as e:
+                logger.warning("Certificat délivré à %s illisible (%s): accès refusé", username, e)
+                return username, MISMATCH
+        if fingerprint != issued:
+            return username, MISMATCH
+        return username, AUTHORIZED
+
+    def _store(self, fingerprint, expires, username, status):
+        if fingerprint in self.entries:
+            self._discard(fingerprint)
+        self.entries[fingerprint] = (expires, username, status)
+        if username is not None:
+            self.by_user.setdefault(username, set()).add(fingerprint)
+        while len(self.entries) > self.max_entries:
+            self._discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _discard(self, fingerprint):
+        _, username, _ = self.entries.pop(fingerprint)
+        fingerprints = self.by_user.get(username)
+        if fingerprints is not None:
+            fingerprints.discard(fingerprint)
+            if not fingerprints:
+                del self.by_user[username]
+
+    def on_user_change(self, op, username, info):
+        with self.lock:
+            self.generation += 1
+            for fingerprint in list(self.by_user.get(username, ())):
+                self._discard(fingerprint)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.by_user.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives import serialization
+from .certs import bundle_pem, split_bundle
+
+logger = logging.getLogger(__name__)
+
+# Paquets d'identifiants (certificat, clé, CA dans un seul PEM) gardés en
+# mémoire pour l'interface d'administration. Un téléchargement ne touche le
+# disque qu'au premier accès: les suivants sont servis depuis le cache, avec
+# une ETag pour les GET conditionnels (304 sans corps). Les fiches d'avant
+# les paquets (trois fichiers par utilisateur) sont assemblées à la volée.
+# Toute modification d'un utilisateur retire son entrée. La CA des paquets
+# servis est toujours celle du serveur: quand elle change, le cache est vidé.
+# Elle est lue en mémoire (CertificateManager.current_ca): une CA générée par
+# ce processus est vue aussitôt, des fichiers remplacés par un autre au plus
+# une seconde plus tard, sans stat à chaque téléchargement.
+
+PARTS = ('cert', 'key', 'ca')
+
+
+class Bundle:
+    """Paquet d'un utilisateur: PEM complet, ses trois parties et son ETag"""
+
+    __slots__ = ('username', 'data', 'parts', 'etag')
+
+    def __init__(self, username, data, parts):
+        self.username = username
+        self.data = data
+        self.parts = dict(zip(PARTS, parts))
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+
+    def part_etag(self, part):
+        return f"{self.etag}-{part}"
+
+
+class BundleCache:
+    """Cache LRU utilisateur -> Bundle, invalidé par le UserManager"""
+
+    def __init__(self, user_manager, cert_manager, max_entries=1024):
+        self.user_manager = user_manager
+        self.cert_manager = cert_manager
+        self.max_entries = max_entries
+        self.ca_cert = None  # CA des paquets en cache
+        self.ca_pem = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0  # Incrémenté à chaque invalidation: un paquet lu avant n'est pas gardé
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        user_manager.subscribe(self.on_user_change)
+
+    def get(self, username):
+        """Bundle de l'utilisateur, None s'il est inconnu; OSError/ValueError si ses fichiers sont illisibles"""
+        _, ca_cert = self.cert_manager.current_ca()
+        with self.lock:
+            if ca_cert is not self.ca_cert:
+                # Nouvelle CA (rotation): aucun paquet en cache ne l'embarque
+                self.generation += 1
+                self.entries.clear()
+                self.ca_cert = ca_cert
+                self.ca_pem = ca_cert.public_bytes(serialization.Encoding.PEM) if ca_cert is not None else None
+            bundle = self.entries.get(username)
+            if bundle is not None:
+                self.entries.move_to_end(username)
+                self.hits += 1
+                return bundle
+            self.misses += 1
+            generation = self.generation
+            ca_pem = self.ca_pem
+        info = self.user_manager.get_user(username)
+        if info is None:
+            return None
+        bundle = self.build(username, info, ca_pem)
+        with self.lock:
+            if generation == self.generation:
+                self.entries[username] = bundle
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return bundle
+
+    def build(self, username, info, ca_pem=None):
+        """Paquet de l'utilisateur avec la CA actuelle du serveur (à défaut, celle de ses fichiers)"""
+        if info.get('bundle'):
+            with open(info['bundle'], 'rb') as f:
+                cert_pem, key_pem, file_ca = split_bundle(f.read())
+        else:
+            with open(info['cert_file'], 'rb') as f:
+                cert_pem = f.read()
+            with open(info['key_file'], 'rb') as f:
+                key_pem = f.read()
+            file_ca = None
+            if ca_pem is None:
+                with open(os.path.join(info['folder'], 'ca.crt'), 'rb') as f:
+                    file_ca = f.read()
+        parts = (cert_pem, key_pem, ca_pem or file_ca)
+        return Bundle(username, bundle_pem(*parts), parts)
+
+    def on_user_change(self, op, username, info):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(username, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
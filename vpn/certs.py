@@ -1,25 +1,113 @@
+import hashlib
 import os
+import re
+import threading
+import time
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 from cryptography.hazmat.backends import default_backend
 import datetime
 
+KEY_TYPES = ('rsa', 'ecdsa')
+CA_REFRESH_INTERVAL = 1.0  # Fréquence max. de vérification des fichiers de la CA par current_ca
+PEM_BLOCK = re.compile(rb'-----BEGIN ([A-Z0-9 ]+)-----.+?-----END \1-----\r?\n?', re.S)
+
+
+def bundle_pem(cert_pem, key_pem, ca_pem):
+    """Paquet d'identifiants d'un utilisateur: certificat, clé privée et CA dans un seul fichier PEM"""
+    return cert_pem + key_pem + ca_pem
+
+
+def split_bundle(data):
+    """(certificat, clé, CA) PEM d'un paquet d'identifiants"""
+    certs = []
+    key = None
+    for block in PEM_BLOCK.finditer(data):
+        if block.group(1).endswith(b'PRIVATE KEY'):
+            key = block.group(0)
+        elif block.group(1) == b'CERTIFICATE':
+            certs.append(block.group(0))
+    if key is None or len(certs) != 2:
+        raise ValueError("Paquet d'identifiants invalide (certificat, clé et CA attendus)")
+    return certs[0], key, certs[1]
+
+
+def certificate_fingerprint(cert):
+    """Empreinte SHA-256 (hex) d'un certificat, x509.Certificate ou DER"""
+    if isinstance(cert, x509.Certificate):
+        cert = cert.public_bytes(serialization.Encoding.DER)
+    return hashlib.sha256(cert).hexdigest()
+
+
+def file_fingerprint(cert_file):
+    """Empreinte du certificat PEM enregistré dans `cert_file`"""
+    with open(cert_file, 'rb') as f:
+        return certificate_fingerprint(x509.load_pem_x509_certificate(f.read(), default_backend()))
+
+
+def common_name(der):
+    """CN du sujet d'un certificat DER, ou None"""
+    names = x509.load_der_x509_certificate(der, default_backend()).subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return names[0].value if names else None
+
+
 class CertificateManager:
-    def __init__(self, ca_cert_file='certs/ca.crt', ca_key_file='certs/ca.key'):
+    def __init__(self, ca_cert_file='certs/ca.crt', ca_key_file='certs/ca.key', key_type='rsa',
+                 ca_refresh_interval=CA_REFRESH_INTERVAL):
         self.ca_cert_file = ca_cert_file
         self.ca_key_file = ca_key_file
+        if key_type not in KEY_TYPES:
+            raise ValueError(f"Type de clé inconnu: {key_type} (attendu: {', '.join(KEY_TYPES)})")
+        self.key_type = key_type  # 'ecdsa': P-256, poignées de main TLS moins coûteuses que RSA-2048
+        # CA chargée une fois, rechargée seulement si l'un de ses fichiers change
+        self.ca_lock = threading.Lock()
+        self.ca_stamp = None
+        self.ca = (None, None)
+        self.ca_loads = 0
+        self.ca_refresh_interval = ca_refresh_interval
+        self.ca_checked = None  # Dernière vérification des fichiers (time.monotonic)
+
+    def generate_key(self):
+        """Génère une clé privée selon le profil choisi (RSA-2048 ou ECDSA P-256)"""
+        if self.key_type == 'ecdsa':
+            return ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+            backend=default_backend()
+        )
+
+    def _ca_stamp(self):
+        try:
+            return tuple((st.st_ino, st.st_size, st.st_mtime_ns) for st in map(os.stat, (self.ca_cert_file, self.ca_key_file)))
+        except FileNotFoundError:
+            return None
 
     def load_ca(self):
-        """Charge le CA existant s'il existe, sinon retourne None"""
-        if os.path.exists(self.ca_cert_file) and os.path.exists(self.ca_key_file):
-            with open(self.ca_key_file, "rb") as f:
-                ca_key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
-            with open(self.ca_cert_file, "rb") as f:
-                ca_cert = x509.load_pem_x509_certificate(f.read(), backend=default_backend())
-            return ca_key, ca_cert
-        return None, None
+        """Charge le CA existant s'il existe (depuis la mémoire si ses fichiers n'ont pas changé), sinon retourne None"""
+        stamp = self._ca_stamp()
+        with self.ca_lock:
+            self.ca_checked = time.monotonic()
+            if stamp is None:
+                self.ca = (None, None)
+                self.ca_stamp = None
+            elif stamp != self.ca_stamp:
+                with open(self.ca_key_file, "rb") as f:
+                    ca_key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
+                with open(self.ca_cert_file, "rb") as f:
+                    ca_cert = x509.load_pem_x509_certificate(f.read(), backend=default_backend())
+                self.ca = (ca_key, ca_cert)
+                self.ca_stamp = stamp
+                self.ca_loads += 1
+            return self.ca
+
+    def current_ca(self):
+        """CA en mémoire, sans accès disque: ses fichiers ne sont revérifiés qu'une fois par ca_refresh_interval"""
+        if self.ca_checked is not None and time.monotonic() - self.ca_checked < self.ca_refresh_interval:
+            return self.ca
+        return self.load_ca()
 
     def generate_ca_cert(self):
         """Génère le certificat et la clé de l'Autorité de Certification (CA) si elle n'existe pas"""
@@ -31,11 +119,7 @@ class CertificateManager:
         os.makedirs(os.path.dirname(self.ca_cert_file), exist_ok=True)
         
         # Clé privée CA
-        ca_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+        ca_key = self.generate_key()
         
         # Certificat CA auto-signé
         ca_cert = x509.CertificateBuilder().subject_name(
@@ -69,6 +153,11 @@ class CertificateManager:
         with open(self.ca_cert_file, "wb") as f:
             f.write(ca_cert.public_bytes(serialization.Encoding.PEM))
         
+        # Nouvelle CA servie aussitôt par current_ca, sans attendre la vérification suivante
+        with self.ca_lock:
+            self.ca = (ca_key, ca_cert)
+            self.ca_stamp = self._ca_stamp()
+            self.ca_checked = time.monotonic()
         return ca_key, ca_cert
 
     def generate_server_cert(self, ca_key, ca_cert, server_cert_file='certs/server.crt', server_key_file='certs/server.key'):
@@ -77,11 +166,7 @@ class CertificateManager:
         os.makedirs(os.path.dirname(server_cert_file), exist_ok=True)
         
         # Clé privée serveur
-        server_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+        server_key = self.generate_key()
         
         # Certificat serveur signé par la CA
         server_cert = x509.CertificateBuilder().subject_name(
@@ -119,14 +204,13 @@ class CertificateManager:
         
         return server_cert
 
-    def generate_user_cert(self, username, ca_key, ca_cert):
-        """Génère le certificat et la clé pour un utilisateur"""
+    def generate_user_cert(self, username, ca_key, ca_cert, user_key=None, user_folder=None, bundle=False):
+        """Génère le certificat (et la clé, si elle n'est pas fournie) pour un utilisateur.
+
+        Avec `bundle`, un seul fichier <username>.pem (certificat, clé, CA) au lieu de trois.
+        """
         # Clé privée utilisateur
-        user_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+        user_key = user_key or self.generate_key()
         
         # Certificat utilisateur signé par la CA
         user_cert = x509.CertificateBuilder().subject_name(
@@ -152,9 +236,23 @@ class CertificateManager:
         ).sign(ca_key, hashes.SHA256(), default_backend())
         
         # Créer le dossier utilisateur
-        user_folder = f"users/{username}"
+        user_folder = user_folder or f"users/{username}"
         os.makedirs(user_folder, exist_ok=True)
         
+        if bundle:
+            key_pem = user_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+            data = bundle_pem(user_cert.public_bytes(serialization.Encoding.PEM), key_pem,
+                              ca_cert.public_bytes(serialization.Encoding.PEM))
+            # Contient la clé privée: lisible par le seul propriétaire
+            fd = os.open(f"{user_folder}/{username}.pem", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            return user_cert
+        
         # Sauvegarde
         with open(f"{user_folder}/{username}.key", "wb") as f:
             f.write(user_key.private_bytes(
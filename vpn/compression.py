@@ -0,0 +1,144 @@
+import zlib
+from .framing import FRAME_HEADER, FLAG_COMPRESSED, MAX_FRAME_PAYLOAD, FrameError
+from .profiling import clock
+
+try:
+    import lz4.block
+except ImportError:  # lz4 est optionnel: zlib seul
+    lz4 = None
+
+# Compression des trames du tunnel, négociée à l'ouverture de la session par
+# une trame de contrôle (voir framing.FLAG_CONTROL). Chaque trame est
+# compressée d'un bloc, tous ses paquets ensemble: le taux est bien meilleur
+# que paquet par paquet. En mode adaptatif, un flux incompressible (déjà
+# chiffré, vidéo...) coupe la compression pour économiser le CPU, puis une
+# trame témoin est réessayée de temps en temps.
+
+ZLIB_LEVEL = 1  # Le plus rapide: le lien est lent, le CPU doit le rester aussi
+MIN_FRAME_BYTES = 256  # En dessous, le gain ne couvre pas le coût
+MAX_RATIO = 0.9  # Une trame qui ne gagne pas 10 % est envoyée telle quelle
+PROBE_INTERVAL = 64  # Trames envoyées sans compression avant un nouvel essai
+
+
+def _zlib_decompress(data):
+    decompressor = zlib.decompressobj()
+    raw = decompressor.decompress(data, MAX_FRAME_PAYLOAD)
+    if decompressor.unconsumed_tail:
+        raise FrameError("Trame décompressée trop grande")
+    return raw
+
+
+def _lz4_decompress(data):
+    # store_size: les 4 premiers octets donnent la taille décompressée
+    if len(data) < 4 or int.from_bytes(data[:4], 'little') > MAX_FRAME_PAYLOAD:
+        raise FrameError("Trame décompressée trop grande")
+    return lz4.block.decompress(data)
+
+
+CODECS = {'zlib': (lambda data: zlib.compress(data, ZLIB_LEVEL), _zlib_decompress)}
+if lz4 is not None:
+    CODECS['lz4'] = (lambda data: lz4.block.compress(data, store_size=True), _lz4_decompress)
+
+PREFERENCE = ('lz4', 'zlib')  # Du plus rapide au plus compact
+
+
+def available_codecs():
+    """Algorithmes utilisables dans ce processus, par ordre de préférence"""
+    return [name for name in PREFERENCE if name in CODECS]
+
+
+def offer(compression):
+    """Algorithmes proposés au pair pour `compression` ('auto', 'zlib' ou 'lz4')"""
+    if compression == 'auto':
+        return available_codecs()
+    if compression not in CODECS:
+        raise ValueError(f"Compression non disponible: {compression} (disponibles: {', '.join(available_codecs())})")
+    return [compression]
+
+
+def choose(offered, allowed=None):
+    """Premier algorithme proposé par le client que l'hôte accepte, ou None"""
+    for name in offered:
+        if name in CODECS and (allowed is None or name in allowed):
+            return name
+    return None
+
+
+def encode_offer(codecs):
+    return ('compress=' + ','.join(codecs)).encode()
+
+
+def decode_offer(payload):
+    """Liste d'algorithmes d'une trame de contrôle; None si ce n'est pas une négociation"""
+    text = bytes(payload).decode('ascii', 'replace')
+    if not text.startswith('compress='):
+        return None
+    return [name for name in text[len('compress='):].split(',') if name]
+
+
+class FrameCompressor:
+    """Compression des trames sortantes d'une session, avec coupure adaptative"""
+
+    def __init__(self, codec, adaptive=True):
+        self.codec = codec
+        self.compress_data, self.decompress_data = CODECS[codec]
+        self.adaptive = adaptive
+        self.skip = 0  # Trames restant à envoyer sans essayer de compresser
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames_compressed = 0
+        self.frames_raw = 0
+        self.cpu_seconds = 0.0
+
+    def will_try(self, frame):
+        """compress() essaiera-t-il de compresser cette trame (sinon elle est rendue telle quelle, sans calcul) ?"""
+        return not self.skip and len(frame) - FRAME_HEADER.size >= MIN_FRAME_BYTES
+
+    def compress(self, frame):
+        """Retourne la trame compressée, ou la trame d'origine si la compression ne gagne rien"""
+        payload_size = len(frame) - FRAME_HEADER.size
+        if payload_size < MIN_FRAME_BYTES or self.skip:
+            if self.skip:
+                self.skip -= 1
+            self.frames_raw += 1
+            return frame
+        start = clock()
+        data = self.compress_data(memoryview(frame)[FRAME_HEADER.size:])
+        self.cpu_seconds += clock() - start
+        if len(data) > payload_size * MAX_RATIO:
+            # Incompressible: envoyer tel quel, et ne plus essayer pendant un moment
+            self.frames_raw += 1
+            if self.adaptive:
+                self.skip = PROBE_INTERVAL
+            return frame
+        version, flags, count, _ = FRAME_HEADER.unpack_from(frame)
+        self.bytes_in += payload_size
+        self.bytes_out += len(data)
+        self.frames_compressed += 1
+        return FRAME_HEADER.pack(version, flags | FLAG_COMPRESSED, count, len(data)) + data
+
+    def decompress(self, payload):
+        start = clock()
+        try:
+            return self.decompress_data(payload)
+        except FrameError:
+            raise
+        except Exception as e:
+            raise FrameError(f"Trame compressée invalide: {e}") from e
+        finally:
+            self.cpu_seconds += clock() - start
+
+    @property
+    def active(self):
+        return self.skip == 0
+
+    def stats(self):
+        return {
+            'codec': self.codec,
+            'active': self.active,
+            'frames_compressed': self.frames_compressed,
+            'frames_raw': self.frames_raw,
+            'bytes_saved': self.bytes_in - self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            'cpu_seconds': round(self.cpu_seconds, 6),
+        }
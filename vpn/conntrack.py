@@ -0,0 +1,224 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+# Drapeaux TCP utiles au suivi d'état
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Délais d'inactivité (secondes) par classe de flux
+DEFAULT_TIMEOUTS = {
+    'tcp_syn': 120,
+    'tcp_established': 3600,
+    'tcp_closing': 30,
+    'udp': 60,
+    'udp_replied': 180,
+    'icmp': 30,
+}
+
+
+class Flow:
+    """Un flux suivi par le NAT, vu du côté client"""
+    __slots__ = ('proto', 'session', 'src', 'sport', 'dst', 'dport', 'nat_port',
+                 'state', 'last_seen', 'packets_out', 'packets_in')
+
+    def __init__(self, proto, session, src, sport, dst, dport, nat_port, state, now):
+        self.proto = proto
+        self.session = session
+        self.src = src
+        self.sport = sport
+        self.dst = dst
+        self.dport = dport
+        self.nat_port = nat_port
+        self.state = state
+        self.last_seen = now
+        self.packets_out = 0
+        self.packets_in = 0
+
+    def outbound_key(self):
+        return (self.proto, self.session, self.src, self.sport, self.dst, self.dport)
+
+    def inbound_key(self):
+        return (self.proto, self.dst, self.dport, self.nat_port)
+
+
+class ConnTrack:
+    """Table de suivi de connexions de l'hôte (NAT source avec allocation de ports).
+
+    Les flux sont indexés par leur 5-tuple côté client (plus la session, deux
+    clients pouvant utiliser la même adresse privée) et par leur 5-tuple de
+    retour côté réseau. Chaque classe de délai a son OrderedDict trié par
+    dernière activité: l'expiration et l'éviction se font en O(1) en tête.
+    """
+
+    def __init__(self, public_ip, port_range=(20000, 60000), max_entries=65536, timeouts=None):
+        self.public_ip = public_ip
+        self.public_ip_packed = socket.inet_aton(public_ip)
+        self.port_min, self.port_max = port_range
+        self.max_entries = max_entries
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.lock = threading.Lock()
+        self.outbound = {}
+        self.inbound = {}
+        self.by_state = {state: OrderedDict() for state in self.timeouts}
+        self.sessions = {}
+        self.next_port = {PROTO_TCP: self.port_min, PROTO_UDP: self.port_min, PROTO_ICMP: self.port_min}
+        self.next_expiry_check = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.allocation_failures = 0
+
+    def __len__(self):
+        return len(self.outbound)
+
+    def _allocate_port(self, proto, dst, dport, preferred):
+        """Choisit un port public libre pour ce correspondant (conserve le port d'origine si possible)"""
+        if self.port_min <= preferred <= self.port_max and (proto, dst, dport, preferred) not in self.inbound:
+            return preferred
+        span = self.port_max - self.port_min + 1
+        port = self.next_port.get(proto, self.port_min)
+        for _ in range(span):
+            candidate = port
+            port = port + 1 if port < self.port_max else self.port_min
+            if (proto, dst, dport, candidate) not in self.inbound:
+                self.next_port[proto] = port
+                return candidate
+        return None
+
+    def _initial_state(self, proto, tcp_flags):
+        if proto == PROTO_TCP:
+            if tcp_flags & (TCP_FIN | TCP_RST):
+                return 'tcp_closing'
+            return 'tcp_syn' if tcp_flags & TCP_SYN and not tcp_flags & TCP_ACK else 'tcp_established'
+        if proto == PROTO_UDP:
+            return 'udp'
+        return 'icmp'
+
+    def _next_state(self, flow, inbound, tcp_flags):
+        state = flow.state
+        if flow.proto == PROTO_TCP:
+            if tcp_flags & (TCP_FIN | TCP_RST):
+                return 'tcp_closing'
+            if state == 'tcp_syn' and inbound and tcp_flags & TCP_ACK:
+                return 'tcp_established'
+        elif flow.proto == PROTO_UDP and inbound:
+            return 'udp_replied'
+        return state
+
+    def _touch(self, flow, state, now):
+        """Met à jour l'activité (et l'état) d'un flux en O(1)"""
+        if state != flow.state:
+            del self.by_state[flow.state][flow]
+            flow.state = state
+            self.by_state[state][flow] = None
+        else:
+            self.by_state[state].move_to_end(flow)
+        flow.last_seen = now
+
+    def _remove(self, flow):
+        del self.outbound[flow.outbound_key()]
+        self.inbound.pop(flow.inbound_key(), None)
+        del self.by_state[flow.state][flow]
+        flows = self.sessions.get(flow.session)
+        if flows is not None:
+            flows.discard(flow)
+            if not flows:
+                del self.sessions[flow.session]
+
+    def _evict_oldest(self, now):
+        """Libère une place en supprimant le flux le plus proche de son expiration"""
+        victim = None
+        victim_deadline = None
+        for state, flows in self.by_state.items():
+            if flows:
+                flow = next(iter(flows))
+                deadline = flow.last_seen + self.timeouts[state]
+                if victim is None or deadline < victim_deadline:
+                    victim, victim_deadline = flow, deadline
+        if victim is not None:
+            self._remove(victim)
+            self.evictions += 1
+
+    def _expire_locked(self, now):
+        expired = 0
+        for state, flows in self.by_state.items():
+            limit = now - self.timeouts[state]
+            while flows:
+                flow = next(iter(flows))
+                if flow.last_seen > limit:
+                    break
+                self._remove(flow)
+                expired += 1
+        self.expirations += expired
+        self.next_expiry_check = now + 1
+        return expired
+
+    def expire(self, now=None):
+        """Supprime les flux inactifs; retourne le nombre de flux expirés"""
+        with self.lock:
+            return self._expire_locked(time.monotonic() if now is None else now)
+
+    def track_outbound(self, session, proto, src, sport, dst, dport, tcp_flags=0, now=None):
+        """Enregistre ou rafraîchit un flux sortant; retourne le Flow (avec son nat_port), ou None si aucun port n'est libre"""
+        if now is None:
+            now = time.monotonic()
+        key = (proto, session, src, sport, dst, dport)
+        with self.lock:
+            if now >= self.next_expiry_check:
+                self._expire_locked(now)
+            flow = self.outbound.get(key)
+            if flow is not None:
+                self._touch(flow, self._next_state(flow, False, tcp_flags), now)
+                flow.packets_out += 1
+                return flow
+
+            if len(self.outbound) >= self.max_entries:
+                self._evict_oldest(now)
+            nat_port = self._allocate_port(proto, dst, dport, sport)
+            if nat_port is None:
+                self.allocation_failures += 1
+                return None
+            flow = Flow(proto, session, src, sport, dst, dport, nat_port, self._initial_state(proto, tcp_flags), now)
+            flow.packets_out = 1
+            self.outbound[key] = flow
+            self.inbound[flow.inbound_key()] = flow
+            self.by_state[flow.state][flow] = None
+            self.sessions.setdefault(session, set()).add(flow)
+            return flow
+
+    def lookup_inbound(self, proto, remote_ip, remote_port, nat_port, tcp_flags=0, now=None):
+        """Retrouve le flux d'un paquet de retour, ou None s'il n'appartient à aucun flux"""
+        flow = self.inbound.get((proto, remote_ip, remote_port, nat_port))
+        if flow is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            if self.outbound.get(flow.outbound_key()) is not flow:
+                return None  # Supprimé entre-temps
+            self._touch(flow, self._next_state(flow, True, tcp_flags), now)
+            flow.packets_in += 1
+        return flow
+
+    def remove_session(self, session):
+        """Supprime tous les flux d'une session terminée"""
+        with self.lock:
+            for flow in list(self.sessions.get(session, ())):
+                self._remove(flow)
+
+    def stats(self):
+        return {
+            'entries': len(self.outbound),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'allocation_failures': self.allocation_failures,
+        }
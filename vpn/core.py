@@ -5,132 +5,324 @@ import json
 import os
 import time
 import subprocess
+import logging
 from .user_manager import UserManager
 import requests
 from .tunnel import VpnTunnel  # Pour les requêtes HTTP
+from .packet_io import create_packet_io
+from .injector import RawInjector
+from .conntrack import ConnTrack
+from .nat import ReverseNatEngine, return_path_filter
+from .sendqueue import DROP_POLICIES, DROP_TAIL
+from .datagram import DatagramServer, DEFAULT_CIPHER
+from .striping import StreamRegistry, MAX_STREAMS
+from .authcache import AuthCache, AUTHORIZED, REVOKED
+from .certs import certificate_fingerprint, split_bundle
+from .metrics import REGISTRY, HANDSHAKE_SECONDS, HANDSHAKE_FAILURES, AUTH_REJECTED
+
+logger = logging.getLogger(__name__)
 
 class VPNHost:
-    def __init__(self, host='0.0.0.0', port=1194, ca_cert='certs/ca.crt', server_cert='certs/server.crt', server_key='certs/server.key', users_file='users.json'):
+    def __init__(self, host='0.0.0.0', port=1194, ca_cert='certs/ca.crt', server_cert='certs/server.crt', server_key='certs/server.key', users_file='users.json', packet_backend='scapy', max_flows=65536,
+                 nat_port_range=(20000, 60000), reuse_port=False, ticket_key_lifetime=3600,
+                 queue_size=4096, drop_policy=DROP_TAIL, batch_bytes=32 * 1024, batch_delay=0.002,
+                 compression='auto', udp_port=None, udp_public_port=None, udp_cipher=DEFAULT_CIPHER,
+                 max_streams=MAX_STREAMS, auth_cache_size=4096, auth_cache_ttl=300.0, adaptive_compression=True,
+                 user_manager=None):
         self.host = host
         self.port = port
         self.ca_cert = ca_cert
         self.server_cert = server_cert
         self.server_key = server_key
         self.users_file = users_file
+        self.packet_backend = packet_backend  # 'scapy', 'tun', 'fake' ou 'null'
+        self.nat_port_range = nat_port_range
+        # File d'envoi bornée de chaque session ('tail' ou 'oldest' quand elle est pleine)
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Politique de rejet inconnue: {drop_policy}")
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        # Regroupement des paquets envoyés aux clients (taille max. d'une trame, attente max.)
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        # Algorithmes de compression accordés aux clients qui en demandent ('auto': tous, None: aucun)
+        self.compression = compression
+        self.adaptive_compression = adaptive_compression  # False: compresser même le trafic incompressible
+        self.sessions = set()
         
-        # Charger la liste des utilisateurs
-        self.user_manager = UserManager(self.users_file)
+        # Charger la liste des utilisateurs (les changements faits ailleurs sont relus à chaud). Celui de
+        # l'administration, s'il est dans le même processus: ses révocations sont vues sans attendre la relecture
+        self.user_manager = user_manager or UserManager(self.users_file)
+        self.user_manager.subscribe(self.on_user_change)
+        # Décisions d'autorisation par empreinte de certificat, invalidées à chaque changement d'utilisateur
+        self.auth_cache = AuthCache(self.user_manager, max_entries=auth_cache_size, ttl=auth_cache_ttl)
         
         # IP du serveur pour NAT
         self.server_ip = socket.gethostbyname(socket.gethostname())
-        print(f"Server IP for NAT: {self.server_ip}")
+        logger.info("Server IP for NAT: %s", self.server_ip)
+        self.conntrack = ConnTrack(self.server_ip, port_range=nat_port_range, max_entries=max_flows)
+        # Connexions TLS parallèles d'un même client, regroupées en une session NAT (1: désactivé)
+        self.stream_registry = StreamRegistry(self.conntrack, max_streams)
+        
+        # Socket brut d'injection, backend de paquets et table NAT partagés par tous les tunnels
+        self.injector = RawInjector()
+        if self.packet_backend == 'scapy':
+            # Le noyau ne remonte que les retours vers notre IP et notre plage de ports NAT
+            self.packet_io = create_packet_io('scapy', injector=self.injector,
+                                              capture_filter=return_path_filter(self.server_ip, nat_port_range))
+        else:
+            self.packet_io = create_packet_io(self.packet_backend)
+        self.reverse_engine = None
+
+        # Transport datagramme (UDP chiffré) proposé aux clients qui le demandent
+        self.datagram_server = None
+        if udp_port is not None:
+            self.datagram_server = DatagramServer(self.host, udp_port, public_port=udp_public_port, cipher=udp_cipher)
         
         # Socket serveur
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if reuse_port:
+            # Plusieurs processus workers écoutent sur le même port (Linux)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
         
         # Contexte SSL avec vérification des certificats clients
-        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-        self.ssl_context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
-        self.ssl_context.load_verify_locations(cafile=self.ca_cert)
-        self.ssl_context.verify_mode = ssl.CERT_REQUIRED  # Exiger un certificat client valide
-        self.ssl_context.check_hostname = False
+        self.ticket_key_lifetime = ticket_key_lifetime
+        self.ssl_context = self.create_ssl_context()
+        self.ticket_keys_created = time.monotonic()
+        self.ticket_key_rotations = 0
+        REGISTRY.add_collector(self.collect_metrics)
+
+    def create_ssl_context(self):
+        """Contexte TLS serveur; chaque contexte a sa propre clé de tickets de session (aléatoire)"""
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
+        context.load_verify_locations(cafile=self.ca_cert)
+        context.verify_mode = ssl.CERT_REQUIRED  # Exiger un certificat client valide
+        context.check_hostname = False
+        # Tickets de session (reprise sans échange de certificats) : activés par défaut, à conserver
+        context.options &= ~ssl.OP_NO_TICKET
+        return context
+
+    def rotate_ticket_keys(self, now=None):
+        """Remplace le contexte TLS (et donc la clé des tickets) une fois sa durée de vie écoulée.
+
+        Les sessions établies gardent leur contexte ; un client dont le ticket
+        est plus ancien que la rotation refait une poignée de main complète.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.ticket_keys_created < self.ticket_key_lifetime:
+            return False
+        self.ssl_context = self.create_ssl_context()
+        self.ticket_keys_created = now
+        self.ticket_key_rotations += 1
+        return True
+
+    def start_reverse_path(self):
+        """Démarre l'unique capture de retour de l'hôte, qui dispatch vers les sessions"""
+        try:
+            self.packet_io.open()
+        except Exception as e:
+            logger.warning("Capture de paquets non disponible, NAT inverse désactivé: %s", e)
+            return
+        self.reverse_engine = ReverseNatEngine(self.packet_io, self.conntrack)
+        self.reverse_engine.start()
+
+    def start_user_watch(self):
+        """Relit la base d'utilisateurs en continu: un utilisateur supprimé est déconnecté aussitôt"""
+        threading.Thread(target=self.user_manager.watch, name='user_watch', daemon=True).start()
+
+    def on_user_change(self, op, username, info):
+        revoked = info.get('revoked', ()) if info else ()
+        for session in list(self.sessions):
+            if session.username != username:
+                continue
+            if op == 'delete':
+                logger.info("Utilisateur %s supprimé, déconnexion de sa session", username)
+                session.disconnect()
+            elif session.cert_fingerprint in revoked:
+                logger.info("Certificat de %s révoqué, déconnexion de sa session", username)
+                session.disconnect()
+
+    def start_datagram_server(self):
+        if self.datagram_server is not None:
+            self.datagram_server.start()
+            logger.info("Transport datagramme sur UDP %s:%d", self.host, self.datagram_server.port)
+
+    def collect_metrics(self):
+        """Valeurs lues à chaque collecte de /metrics (table NAT, files d'envoi, injection)"""
+        conntrack = self.conntrack.stats()
+        depth = {}
+        saved = {}
+        compression_cpu = {}
+        for session in list(self.sessions):
+            depth[session.username] = depth.get(session.username, 0) + len(session.send_queue)
+            compression = session.compression_stats()
+            if compression is not None:
+                saved[session.username] = saved.get(session.username, 0) + compression['bytes_saved']
+                compression_cpu[session.username] = compression_cpu.get(session.username, 0) + compression['cpu_seconds']
+        engine = self.reverse_engine
+        auth = self.auth_cache.stats()
+        return [
+            ('vpn_sessions', 'gauge', 'Sessions actives', [({}, len(self.sessions))]),
+            ('vpn_nat_entries', 'gauge', 'Flux dans la table NAT', [({}, conntrack['entries'])]),
+            ('vpn_nat_evictions_total', 'counter', 'Flux évincés (table NAT pleine)', [({}, conntrack['evictions'])]),
+            ('vpn_nat_expirations_total', 'counter', 'Flux expirés', [({}, conntrack['expirations'])]),
+            ('vpn_nat_allocation_failures_total', 'counter', 'Ports NAT indisponibles', [({}, conntrack['allocation_failures'])]),
+            ('vpn_send_queue_depth', 'gauge', "Paquets en attente dans les files d'envoi, par utilisateur",
+             [({'user': user}, value) for user, value in depth.items()]),
+            ('vpn_packets_injected_total', 'counter', 'Paquets injectés sur le socket brut',
+             [({}, self.injector.packets_injected)]),
+            ('vpn_packets_captured_total', 'counter', 'Paquets capturés sur le chemin retour',
+             [({}, engine.packets_captured if engine is not None else 0)]),
+            ('vpn_compression_bytes_saved', 'gauge', 'Octets économisés par la compression des sessions actives, par utilisateur',
+             [({'user': user}, value) for user, value in saved.items()]),
+            ('vpn_compression_cpu_seconds', 'gauge', 'Temps CPU de compression des sessions actives, par utilisateur',
+             [({'user': user}, value) for user, value in compression_cpu.items()]),
+            ('vpn_auth_cache_entries', 'gauge', "Décisions d'autorisation en cache", [({}, auth['entries'])]),
+            ('vpn_auth_cache_hits_total', 'counter', "Autorisations servies par le cache", [({}, auth['hits'])]),
+            ('vpn_auth_cache_misses_total', 'counter', "Autorisations vérifiées sur la fiche utilisateur", [({}, auth['misses'])]),
+        ]
+
+    def session_queue_stats(self):
+        """Files d'envoi des sessions actives: {utilisateur: [statistiques par session]}"""
+        stats = {}
+        for session in list(self.sessions):
+            stats.setdefault(session.username, []).append(session.queue_stats())
+        return stats
+
+    def session_compression_stats(self):
+        """Compression des sessions actives qui l'ont négociée: {utilisateur: [statistiques par session]}"""
+        stats = {}
+        for session in list(self.sessions):
+            compression = session.compression_stats()
+            if compression is not None:
+                stats.setdefault(session.username, []).append(compression)
+        return stats
+
+    def authorize(self, client_cert):
+        """(utilisateur, empreinte) autorisés pour un certificat client DER, ou (None, None)"""
+        if not client_cert:
+            logger.warning("No client certificate provided")
+            return None, None
+        fingerprint = certificate_fingerprint(client_cert)
+        username, status = self.auth_cache.authorize(client_cert, fingerprint)
+        if status != AUTHORIZED:
+            AUTH_REJECTED.labels(status).inc()
+            if status == REVOKED:
+                logger.warning("Revoked certificate for user %s (%s)", username, fingerprint[:16])
+            else:
+                logger.warning("Unauthorized user: %s (%s)", username, status)
+            return None, None
+        return username, fingerprint
 
     def start(self):
-        print(f"VPN Host (SSL) started on {self.host}:{self.port}")
+        self.start_reverse_path()
+        self.start_datagram_server()
+        self.start_user_watch()
+        logger.info("VPN Host (SSL) started on %s:%s", self.host, self.port)
         while True:
             client_socket, addr = self.server_socket.accept()
-            print(f"Connection attempt from {addr}")
+            logger.debug("Connection attempt from %s", addr)
             
             try:
                 # Envelopper avec SSL
+                self.rotate_ticket_keys()
+                start = time.perf_counter()
                 ssl_client_socket = self.ssl_context.wrap_socket(client_socket, server_side=True)
+                HANDSHAKE_SECONDS.observe(time.perf_counter() - start)
                 
                 # Vérifier le certificat client
-                client_cert = ssl_client_socket.getpeercert()
-                if not client_cert:
-                    print("No client certificate provided")
+                username, fingerprint = self.authorize(ssl_client_socket.getpeercert(binary_form=True))
+                if not username:
                     ssl_client_socket.close()
                     continue
                 
-                # Extraire le nom d'utilisateur du CN
-                username = None
-                for attr in client_cert['subject']:
-                    for key, value in attr:
-                        if key == 'commonName':
-                            username = value
-                            break
-                    if username:
-                        break
+                logger.info("Authorized connection from %s at %s", username, addr)
                 
-                if not username or not self.user_manager.get_user(username):
-                    print(f"Unauthorized user: {username}")
-                    ssl_client_socket.close()
-                    continue
-                
-                print(f"Authorized connection from {username} at {addr}")
-                
-                client_thread = threading.Thread(target=self.handle_client, args=(ssl_client_socket, username))
+                client_thread = threading.Thread(target=self.handle_client, args=(ssl_client_socket, username, fingerprint),
+                                                 name=f"server_tunnel-{username}")
                 client_thread.start()
                 
             except ssl.SSLError as e:
-                print(f"SSL Error: {e}")
+                HANDSHAKE_FAILURES.inc()
+                logger.warning("SSL Error: %s", e)
                 client_socket.close()
             except Exception as e:
-                print(f"Error: {e}")
+                logger.error("Error: %s", e)
                 client_socket.close()
 
-    def handle_client(self, client_socket, username):
+    def handle_client(self, client_socket, username, fingerprint=None):
+        tunnel = VpnTunnel(client_socket, is_client=False, server_ip=self.server_ip,
+                           packet_io=self.packet_io, conntrack=self.conntrack, username=username,
+                           queue_size=self.queue_size, drop_policy=self.drop_policy,
+                           batch_bytes=self.batch_bytes, batch_delay=self.batch_delay,
+                           compression=self.compression, adaptive_compression=self.adaptive_compression,
+                           datagram_server=self.datagram_server,
+                           stream_registry=self.stream_registry)
+        tunnel.cert_fingerprint = fingerprint
+        self.sessions.add(tunnel)
         try:
-            # Démarrer le tunneling
-            tunnel = VpnTunnel(client_socket, is_client=False, server_ip=self.server_ip)
-            tunnel_thread = threading.Thread(target=tunnel.start_tunnel)
-            tunnel_thread.start()
-            
-            # Garder la connexion ouverte tant que le tunnel tourne
-            while tunnel.running:
-                time.sleep(1)
-                
+            # Tunneling dans ce thread, jusqu'à la fermeture de la connexion
+            tunnel.start_tunnel()
         except Exception as e:
-            print(f"Error handling client {username}: {e}")
+            logger.error("Error handling client %s: %s", username, e)
         finally:
-            tunnel.running = False
-            tunnel_thread.join()
-            if hasattr(tunnel, 'reverse_thread'):
-                tunnel.reverse_thread.join()
+            self.sessions.discard(tunnel)
+            tunnel.stop_tunnel()
             client_socket.close()
-            print(f"Connection closed for {username}")
+            logger.info("Connection closed for %s", username)
 
 class VPNClient:
-    def __init__(self, host='localhost', port=1194, username='alice', admin_port=80):
+    def __init__(self, host='localhost', port=1194, username='alice', admin_port=80, packet_backend='scapy',
+                 compression=None, transport='tls', streams=1, bundle_file=None):
         self.host = host
         self.port = port
         self.username = username
         self.admin_port = admin_port
+        self.packet_backend = packet_backend  # 'scapy', 'tun' ou 'fake'
+        self.compression = compression  # 'auto', 'zlib', 'lz4' ou None
+        self.transport = transport  # 'tls' (flux) ou 'udp' (datagrammes chiffrés, contrôle sur TLS)
+        self.streams = streams  # Connexions TLS parallèles, flux répartis par hachage du 5-tuple
+        self.stream_tunnels = []
         self.gateway = None  # Pour restaurer la route
+        self.tls_session = None  # Session TLS conservée pour la reprise à la reconnexion
+        self.session_reused = False
+        self.bundle_file = bundle_file  # Paquet d'identifiants (certificat, clé, CA dans un seul PEM)
         
         # Charger les infos utilisateur si existant
         self.user_manager = UserManager()
         user_info = self.user_manager.get_user(username)
-        if user_info:
-            self.cert_file = user_info['cert_file']
-            self.key_file = user_info['key_file']
-            self.ca_file = os.path.join(user_info['folder'], 'ca.crt')
-            self.registered = True
-        else:
-            self.registered = False
+        self.registered = bool(user_info or bundle_file)
         
         # Socket client
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         
         # Contexte SSL (initialisé seulement si enregistré)
         if self.registered:
-            self.ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+            self.load_ssl_context(user_info)
+
+    def load_ssl_context(self, user_info=None):
+        """Contexte SSL depuis le paquet d'identifiants, ou depuis les trois fichiers PEM de l'utilisateur"""
+        bundle = self.bundle_file or (user_info or {}).get('bundle')
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        if bundle:
+            with open(bundle, 'rb') as f:
+                _, _, ca_pem = split_bundle(f.read())
+            # Certificat et clé lus dans le même fichier; la CA est passée depuis la mémoire
+            self.cert_file = self.key_file = bundle
+            self.ca_file = None
+            self.ssl_context.load_cert_chain(certfile=bundle)
+            self.ssl_context.load_verify_locations(cadata=ca_pem.decode())
+        else:
+            self.cert_file = user_info['cert_file']
+            self.key_file = user_info['key_file']
+            self.ca_file = os.path.join(user_info['folder'], 'ca.crt')
             self.ssl_context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file)
             self.ssl_context.load_verify_locations(cafile=self.ca_file)
-            self.ssl_context.check_hostname = False
-            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
 
     def get_default_gateway(self):
         """Récupère la passerelle par défaut sur Windows"""
@@ -143,7 +335,7 @@ class VPNClient:
                     if len(parts) >= 3:
                         return parts[2]  # Adresse de la passerelle
         except Exception as e:
-            print(f"Erreur récupération passerelle: {e}")
+            logger.warning("Erreur récupération passerelle: %s", e)
         return None
 
     def register_user(self):
@@ -151,41 +343,46 @@ class VPNClient:
         try:
             url = f"http://{self.host}:{self.admin_port}/create_user"
             response = requests.post(url, data={'username': self.username})
-            if response.status_code == 201:
-                print(f"Utilisateur {self.username} créé avec succès !")
-                # Recharger les infos utilisateur
-                self.user_manager = UserManager()  # Recharger
-                user_info = self.user_manager.get_user(self.username)
-                if user_info:
-                    self.cert_file = user_info['cert_file']
-                    self.key_file = user_info['key_file']
-                    self.ca_file = os.path.join(user_info['folder'], 'ca.crt')
-                    self.registered = True
-                    # Initialiser le contexte SSL
-                    self.ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-                    self.ssl_context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file)
-                    self.ssl_context.load_verify_locations(cafile=self.ca_file)
-                    self.ssl_context.check_hostname = False
-                    self.ssl_context.verify_mode = ssl.CERT_NONE
-                    return True
+            if response.status_code in (200, 201):
+                logger.info("Utilisateur %s créé avec succès !", self.username)
+                # Un seul téléchargement: certificat, clé et CA dans le paquet
+                response = requests.get(f"http://{self.host}:{self.admin_port}/bundle/{self.username}")
+                if response.status_code != 200:
+                    logger.error("Paquet d'identifiants indisponible (HTTP %s)", response.status_code)
+                    return False
+                folder = f"users/{self.username}"
+                os.makedirs(folder, exist_ok=True)
+                self.bundle_file = f"{folder}/{self.username}.pem"
+                fd = os.open(self.bundle_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(response.content)
+                self.load_ssl_context()
+                self.registered = True
+                return True
             else:
-                print(f"Erreur lors de l'inscription: {response.json()}")
+                logger.error("Erreur lors de l'inscription: %s", response.json())
                 return False
         except Exception as e:
-            print(f"Erreur de connexion à l'administration: {e}")
+            logger.error("Erreur de connexion à l'administration: %s", e)
             return False
 
     def connect(self):
         if not self.registered:
-            print(f"Utilisateur {self.username} non enregistré. Tentative d'inscription...")
+            logger.info("Utilisateur %s non enregistré. Tentative d'inscription...", self.username)
             if not self.register_user():
-                print("Échec de l'inscription. Connexion impossible.")
+                logger.error("Échec de l'inscription. Connexion impossible.")
                 return
         
         try:
+            if self.client_socket is None:
+                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.connect((self.host, self.port))
-            self.ssl_socket = self.ssl_context.wrap_socket(self.client_socket, server_hostname=self.host)
-            print(f"Connected securely as {self.username} to VPN Host at {self.host}:{self.port}")
+            # Reprise de session (ticket TLS) si une connexion précédente en a fourni une
+            self.ssl_socket = self.ssl_context.wrap_socket(self.client_socket, server_hostname=self.host,
+                                                           session=self.tls_session)
+            self.session_reused = self.ssl_socket.session_reused
+            resumed = " (session TLS reprise)" if self.session_reused else ""
+            logger.info("Connected securely as %s to VPN Host at %s:%s%s", self.username, self.host, self.port, resumed)
             
             # Maintenant que la connexion est établie, bloquer le trafic normal
             self.gateway = self.get_default_gateway()
@@ -193,42 +390,94 @@ class VPNClient:
                 try:
                     # Ajouter une route spécifique pour le serveur VPN
                     subprocess.run(["route", "add", self.host, self.gateway], check=True)
-                    print(f"Route spécifique ajoutée pour {self.host} via {self.gateway}")
+                    logger.info("Route spécifique ajoutée pour %s via %s", self.host, self.gateway)
                     
                     # Supprimer la route par défaut
                     subprocess.run(["route", "delete", "0.0.0.0"], check=True)
-                    print(f"Route par défaut supprimée (passerelle: {self.gateway}). Trafic forcé via VPN.")
+                    logger.info("Route par défaut supprimée (passerelle: %s). Trafic forcé via VPN.", self.gateway)
                 except Exception as e:
-                    print(f"Erreur modification routes: {e}")
+                    logger.error("Erreur modification routes: %s", e)
             else:
-                print("Impossible de récupérer la passerelle. Le trafic normal peut continuer.")
+                logger.warning("Impossible de récupérer la passerelle. Le trafic normal peut continuer.")
             
             # Démarrer le tunneling
-            self.tunnel = VpnTunnel(self.ssl_socket, is_client=True, server_ip=self.host)
+            self.tunnel = VpnTunnel(self.ssl_socket, is_client=True, server_ip=self.host,
+                                    packet_io=create_packet_io(self.packet_backend), compression=self.compression,
+                                    datagram=self.transport == 'udp', streams=self.streams)
             self.tunnel_thread = threading.Thread(target=self.tunnel.start_tunnel)
             self.tunnel_thread.start()
+            self.open_streams()
             
         except Exception as e:
-            print(f"Failed to connect: {e}")
+            logger.error("Failed to connect: %s", e)
 
     def send_data(self, data):
         # Dans le mode tunneling, on n'envoie plus de messages texte
         # Tout le trafic passe par le tunnel
         pass
 
+    def open_streams(self):
+        """Ouvre les connexions parallèles et y répartit les flux (après la connexion principale)"""
+        if self.streams < 2:
+            return
+        if not self.tunnel.stream_reply.wait(5) or not self.tunnel.stream_token:
+            logger.warning("Connexions parallèles refusées par l'hôte, une seule connexion est utilisée")
+            return
+        stripes = [self.tunnel]
+        for _ in range(self.streams - 1):
+            try:
+                sock = socket.create_connection((self.host, self.port))
+                # La session de la connexion principale évite une poignée de main complète
+                ssl_socket = self.ssl_context.wrap_socket(sock, server_hostname=self.host, session=self.ssl_socket.session)
+            except (OSError, ssl.SSLError) as e:
+                logger.warning("Connexion parallèle impossible: %s", e)
+                break
+            tunnel = VpnTunnel(ssl_socket, is_client=True, server_ip=self.host, packet_io=self.tunnel.packet_io,
+                               compression=self.compression, join_token=self.tunnel.stream_token, capture=False)
+            tunnel.start_tunnel()
+            if not tunnel.stream_reply.wait(5) or not tunnel.stream_joined:
+                # En mode multi-workers, la connexion a pu arriver sur un autre processus
+                logger.warning("Connexion parallèle refusée par l'hôte")
+                tunnel.stop_tunnel()
+                ssl_socket.close()
+                continue
+            stripes.append(tunnel)
+        self.stream_tunnels = stripes[1:]
+        self.tunnel.stripes = stripes
+        logger.info("%d connexions parallèles, flux répartis par hachage", len(stripes))
+
     def close(self):
         # Restaurer la route par défaut
         if self.gateway:
             try:
                 # Supprimer la route spécifique
                 subprocess.run(["route", "delete", self.host], check=True)
-                print(f"Route spécifique supprimée pour {self.host}")
+                logger.info("Route spécifique supprimée pour %s", self.host)
                 
                 # Restaurer la route par défaut
                 subprocess.run(["route", "add", "0.0.0.0", "mask", "0.0.0.0", self.gateway], check=True)
-                print(f"Route par défaut restaurée (passerelle: {self.gateway}).")
+                logger.info("Route par défaut restaurée (passerelle: %s).", self.gateway)
             except Exception as e:
-                print(f"Erreur restauration routes: {e}")
+                logger.error("Erreur restauration routes: %s", e)
         
+        self.remember_session()
+        for tunnel in self.stream_tunnels:
+            tunnel.stop_tunnel()
+            tunnel.vpn_socket.close()
+        self.stream_tunnels = []
+        if hasattr(self, 'tunnel'):
+            self.tunnel.stop_tunnel()
         self.ssl_socket.close()
-        print("Connection closed")
\ No newline at end of file
+        self.client_socket = None
+        logger.info("Connection closed")
+
+    def remember_session(self):
+        """Conserve la session TLS courante (avec son ticket) pour la prochaine connexion"""
+        session = getattr(self, 'ssl_socket', None) and self.ssl_socket.session
+        if session is not None and session.has_ticket:
+            self.tls_session = session
+
+    def reconnect(self):
+        """Ferme la connexion et se reconnecte, en reprenant la session TLS si possible"""
+        self.close()
+        self.connect()
\ No newline at end of file
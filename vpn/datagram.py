@@ -0,0 +1,249 @@
+import base64
+import logging
+import os
+import socket
+import struct
+import threading
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from .framing import FRAME_HEADER, FrameError
+from .metrics import DATAGRAMS_REJECTED
+from .profiling import PROFILER, clock
+
+logger = logging.getLogger(__name__)
+
+# Transport datagramme: chaque trame du tunnel voyage dans son propre
+# datagramme UDP chiffré (AEAD), sans blocage en tête de file ni TCP dans TCP.
+# La connexion TLS authentifiée par certificat reste le canal de contrôle:
+# l'hôte y transmet l'identifiant de session, l'algorithme et le secret dont
+# sont dérivées les deux clés (une par sens).
+#
+# Datagramme: type (u8) | session (u32) | numéro (u64) | trame chiffrée + tag (16)
+# L'en-tête est authentifié (données associées); le nonce est le numéro,
+# jamais réutilisé pour une même clé.
+
+DATAGRAM_HEADER = struct.Struct('!BIQ')
+DATAGRAM_DATA = 1
+TAG_SIZE = 16
+# Données d'une trame par datagramme, pour tenir dans 1400 octets sans fragmentation IP
+# (un paquet plus grand part seul dans son datagramme)
+DATAGRAM_FRAME_BYTES = 1400 - DATAGRAM_HEADER.size - TAG_SIZE - FRAME_HEADER.size
+REPLAY_WINDOW = 2048
+NONCE_PREFIX = b'\0' * 4
+
+CIPHERS = {'aes-gcm': AESGCM, 'chacha20-poly1305': ChaCha20Poly1305}
+DEFAULT_CIPHER = 'aes-gcm'
+
+
+def derive_keys(secret):
+    """Clés (client -> hôte, hôte -> client) dérivées du secret transmis sur TLS"""
+    material = HKDF(algorithm=hashes.SHA256(), length=64, salt=None, info=b'vpn datagram keys').derive(secret)
+    return material[:32], material[32:]
+
+
+def encode_request(ciphers):
+    return ('udp=' + ','.join(ciphers)).encode()
+
+
+def encode_grant(port, session_id, cipher, secret):
+    return f"udp={port},{session_id},{cipher},{base64.b64encode(secret).decode()}".encode()
+
+
+def encode_refusal():
+    return b'udp='
+
+
+def decode_message(payload):
+    """Champs d'une trame de contrôle 'udp=...'; None si ce n'est pas une négociation datagramme"""
+    text = bytes(payload).decode('ascii', 'replace')
+    if not text.startswith('udp='):
+        return None
+    return [field for field in text[len('udp='):].split(',') if field]
+
+
+def decode_grant(fields):
+    """(port, session, algorithme, secret) d'une réponse de l'hôte, ou None en cas de refus"""
+    if len(fields) != 4 or fields[2] not in CIPHERS:
+        return None
+    return int(fields[0]), int(fields[1]), fields[2], base64.b64decode(fields[3])
+
+
+class ReplayWindow:
+    """Fenêtre glissante des numéros déjà reçus (datagrammes authentifiés uniquement)"""
+
+    def __init__(self, size=REPLAY_WINDOW):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.highest = 0
+        self.bitmap = 0  # Bit i: numéro highest - i déjà reçu
+
+    def accept(self, seq):
+        """Enregistre `seq`; retourne False s'il a déjà été reçu ou sort de la fenêtre"""
+        if seq > self.highest:
+            shift = seq - self.highest
+            self.bitmap = ((self.bitmap << shift) | 1) & self.mask if shift < self.size else 1
+            self.highest = seq
+            return True
+        offset = self.highest - seq
+        if seq == 0 or offset >= self.size:
+            return False
+        bit = 1 << offset
+        if self.bitmap & bit:
+            return False
+        self.bitmap |= bit
+        return True
+
+
+class DatagramChannel:
+    """Canal UDP chiffré d'une session, dans un sens d'envoi et un sens de réception"""
+
+    def __init__(self, session_id, secret, cipher, is_client, sock, peer=None):
+        client_key, host_key = derive_keys(secret)
+        aead = CIPHERS[cipher]
+        self.send_aead = aead(client_key if is_client else host_key)
+        self.recv_aead = aead(host_key if is_client else client_key)
+        self.session_id = session_id
+        self.cipher = cipher
+        self.is_client = is_client
+        self.sock = sock
+        self.peer = peer  # Côté hôte: appris du premier datagramme authentifié
+        self.session = None
+        self.send_seq = 0
+        self.replay = ReplayWindow()
+        self.datagrams_sent = 0
+        self.datagrams_received = 0
+        self.rejected = 0
+        self.replayed = 0
+
+    def seal(self, frame):
+        self.send_seq += 1
+        header = DATAGRAM_HEADER.pack(DATAGRAM_DATA, self.session_id, self.send_seq)
+        nonce = NONCE_PREFIX + self.send_seq.to_bytes(8, 'big')
+        return header + self.send_aead.encrypt(nonce, frame, header)
+
+    def send_frame(self, frame):
+        """Chiffre et envoie une trame (appelé par l'écrivain de la session uniquement)"""
+        self.sock.sendto(self.seal(frame), self.peer)
+        self.datagrams_sent += 1
+
+    def open(self, datagram):
+        """Trame en clair d'un datagramme reçu, ou None s'il est falsifié ou rejoué"""
+        kind, _, seq = DATAGRAM_HEADER.unpack_from(datagram)
+        if kind != DATAGRAM_DATA:
+            return None
+        header = datagram[:DATAGRAM_HEADER.size]
+        nonce = NONCE_PREFIX + seq.to_bytes(8, 'big')
+        try:
+            frame = self.recv_aead.decrypt(nonce, datagram[DATAGRAM_HEADER.size:], header)
+        except InvalidTag:
+            self.rejected += 1
+            DATAGRAMS_REJECTED.labels('auth').inc()
+            return None
+        # Après authentification seulement: un faux datagramme ne décale pas la fenêtre
+        if not self.replay.accept(seq):
+            self.replayed += 1
+            DATAGRAMS_REJECTED.labels('replay').inc()
+            return None
+        self.datagrams_received += 1
+        return frame
+
+    def stats(self):
+        return {
+            'cipher': self.cipher,
+            'datagrams_sent': self.datagrams_sent,
+            'datagrams_received': self.datagrams_received,
+            'rejected': self.rejected,
+            'replayed': self.replayed,
+        }
+
+
+def receive_loop(sock, channel_for, running):
+    """Lit les datagrammes de `sock` et remet chaque trame authentifiée à sa session.
+
+    `channel_for(session_id)` retourne le canal d'une session ou None;
+    `running()` indique s'il faut continuer.
+    """
+    while running():
+        try:
+            datagram, addr = sock.recvfrom(65535)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        if len(datagram) < DATAGRAM_HEADER.size + TAG_SIZE:
+            continue
+        profiling = PROFILER.enabled
+        if profiling:
+            t0 = clock()
+        _, session_id, _ = DATAGRAM_HEADER.unpack_from(datagram)
+        channel = channel_for(session_id)
+        if channel is None:
+            DATAGRAMS_REJECTED.labels('unknown_session').inc()
+            continue
+        frame = channel.open(datagram)
+        if frame is None:
+            continue
+        if profiling:
+            PROFILER.add('decrypt', clock() - t0)
+        if channel.peer != addr and not channel.is_client:
+            # Datagramme authentifié: suivre le client s'il change d'adresse (NAT)
+            channel.peer = addr
+        try:
+            channel.session.datagram_received(frame)
+        except FrameError as e:
+            logger.warning("Trame invalide dans un datagramme: %s", e)
+        except Exception as e:
+            logger.error("Erreur de traitement d'un datagramme: %s", e)
+
+
+class DatagramServer:
+    """Socket UDP de l'hôte, partagé par toutes les sessions; un thread de réception"""
+
+    def __init__(self, host, port, public_port=None, cipher=DEFAULT_CIPHER, reuse_port=False):
+        if cipher not in CIPHERS:
+            raise ValueError(f"Algorithme inconnu: {cipher} (attendu: {', '.join(CIPHERS)})")
+        self.cipher = cipher
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind((host, port))
+        self.sock.settimeout(1)
+        self.port = self.sock.getsockname()[1]
+        # Port annoncé aux clients (redirection de port devant l'hôte)
+        self.public_port = public_port or self.port
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def register(self, session):
+        """Ouvre un canal pour `session`; retourne (canal, message de contrôle à envoyer au client)"""
+        secret = os.urandom(32)
+        with self.lock:
+            session_id = int.from_bytes(os.urandom(4), 'big')
+            while session_id == 0 or session_id in self.channels:
+                session_id = int.from_bytes(os.urandom(4), 'big')
+            channel = DatagramChannel(session_id, secret, self.cipher, is_client=False, sock=self.sock)
+            channel.session = session
+            self.channels[session_id] = channel
+        return channel, encode_grant(self.public_port, session_id, self.cipher, secret)
+
+    def unregister(self, channel):
+        with self.lock:
+            self.channels.pop(channel.session_id, None)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='datagram_server', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        receive_loop(self.sock, self.channels.get, lambda: self.running)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.sock.close()
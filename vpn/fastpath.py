@@ -0,0 +1,121 @@
+import struct
+
+# Réécriture d'en-têtes IPv4/TCP/UDP/ICMP directement dans un bytearray, sans
+# dissection scapy. Les sommes de contrôle sont mises à jour de façon
+# incrémentale (RFC 1624): HC' = ~(~HC + ~m + m').
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+IP_CHECKSUM = 10
+IP_SRC = 12
+IP_DST = 16
+TCP_CHECKSUM = 16
+TCP_FLAGS = 13
+UDP_CHECKSUM = 6
+ICMP_CHECKSUM = 2
+ICMP_ID = 4
+
+# Taille minimale de l'en-tête L4 par protocole
+_L4_MIN_SIZE = {PROTO_TCP: 20, PROTO_UDP: 8, PROTO_ICMP: 8}
+
+_U16 = struct.Struct('!H')
+_PORTS = struct.Struct('!HH')
+
+
+def parse_ipv4(buf):
+    """Lit les champs utiles d'un paquet IPv4.
+
+    Retourne (proto, offset L4) ou None si ce n'est pas un paquet IPv4 valide.
+    L'offset L4 vaut None pour les fragments non initiaux (pas d'en-tête L4).
+    """
+    if len(buf) < 20 or buf[0] >> 4 != 4:
+        return None
+    ihl = (buf[0] & 0x0F) * 4
+    if ihl < 20 or len(buf) < ihl:
+        return None
+    proto = buf[9]
+    if _U16.unpack_from(buf, 6)[0] & 0x1FFF:
+        return proto, None
+    if len(buf) < ihl + _L4_MIN_SIZE.get(proto, 0):
+        return proto, None
+    return proto, ihl
+
+
+def l4_ports(buf, l4):
+    """Ports source et destination (TCP/UDP)"""
+    return _PORTS.unpack_from(buf, l4)
+
+
+def tcp_flags(buf, l4):
+    return buf[l4 + TCP_FLAGS]
+
+
+def icmp_echo(buf, l4):
+    """Retourne (type, identifiant) d'un message ICMP"""
+    return buf[l4], _U16.unpack_from(buf, l4 + ICMP_ID)[0]
+
+
+def checksum_update16(checksum, old, new):
+    """Mise à jour incrémentale d'une somme de contrôle pour un mot de 16 bits (RFC 1624, éq. 3)"""
+    total = (~checksum & 0xFFFF) + (~old & 0xFFFF) + new
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def checksum_update32(checksum, old, new):
+    """Mise à jour incrémentale pour une adresse IPv4 (deux mots de 16 bits)"""
+    checksum = checksum_update16(checksum, (old[0] << 8) | old[1], (new[0] << 8) | new[1])
+    return checksum_update16(checksum, (old[2] << 8) | old[3], (new[2] << 8) | new[3])
+
+
+def _update_field_checksum(buf, offset, old, new, udp=False):
+    checksum = _U16.unpack_from(buf, offset)[0]
+    if udp and checksum == 0:
+        return  # Pas de somme de contrôle UDP
+    if isinstance(old, int):
+        checksum = checksum_update16(checksum, old, new)
+    else:
+        checksum = checksum_update32(checksum, old, new)
+    if udp and checksum == 0:
+        checksum = 0xFFFF
+    _U16.pack_into(buf, offset, checksum)
+
+
+def _rewrite(buf, proto, l4, addr_offset, new_addr, port_offset, new_port):
+    """Réécrit une adresse IP (et un port/identifiant L4) en place"""
+    old_addr = bytes(buf[addr_offset:addr_offset + 4])
+    if old_addr != new_addr:
+        buf[addr_offset:addr_offset + 4] = new_addr
+        _update_field_checksum(buf, IP_CHECKSUM, old_addr, new_addr)
+        # Les sommes TCP/UDP couvrent le pseudo-en-tête (adresses IP)
+        if l4 is not None and proto == PROTO_TCP:
+            _update_field_checksum(buf, l4 + TCP_CHECKSUM, old_addr, new_addr)
+        elif l4 is not None and proto == PROTO_UDP:
+            _update_field_checksum(buf, l4 + UDP_CHECKSUM, old_addr, new_addr, udp=True)
+
+    if l4 is None or new_port is None:
+        return
+    if proto == PROTO_TCP:
+        checksum_offset = l4 + TCP_CHECKSUM
+    elif proto == PROTO_UDP:
+        checksum_offset = l4 + UDP_CHECKSUM
+    else:
+        checksum_offset = l4 + ICMP_CHECKSUM
+    offset = l4 + port_offset
+    old_port = _U16.unpack_from(buf, offset)[0]
+    if old_port != new_port:
+        _U16.pack_into(buf, offset, new_port)
+        _update_field_checksum(buf, checksum_offset, old_port, new_port, udp=proto == PROTO_UDP)
+
+
+def rewrite_source(buf, proto, l4, new_src, new_sport=None):
+    """Remplace l'adresse source (4 octets) et le port source, ou l'identifiant ICMP"""
+    _rewrite(buf, proto, l4, IP_SRC, new_src, ICMP_ID if proto == PROTO_ICMP else 0, new_sport)
+
+
+def rewrite_destination(buf, proto, l4, new_dst, new_dport=None):
+    """Remplace l'adresse destination (4 octets) et le port destination, ou l'identifiant ICMP"""
+    _rewrite(buf, proto, l4, IP_DST, new_dst, ICMP_ID if proto == PROTO_ICMP else 2, new_dport)
@@ -0,0 +1,205 @@
+import asyncio
+import struct
+
+# Format de trame sur le flux TLS :
+#   en-tête  : version (u8) | flags (u8) | nombre de paquets (u16) | taille des données (u32)
+#   données  : pour chaque paquet, taille (u16) suivie des octets du paquet IP
+# Avec FLAG_COMPRESSED, les données sont compressées d'un bloc (taille = taille
+# compressée). Une trame FLAG_CONTROL ne contient aucun paquet mais un message
+# de négociation (ex: algorithme de compression).
+FRAME_VERSION = 1
+FLAG_COMPRESSED = 0x01
+FLAG_CONTROL = 0x02
+FRAME_HEADER = struct.Struct('!BBHI')
+PACKET_HEADER = struct.Struct('!H')
+MAX_FRAME_PAYLOAD = 1 << 20
+MAX_PACKETS_PER_FRAME = 0xFFFF
+
+
+class FrameError(ValueError):
+    """Trame invalide reçue sur le tunnel"""
+
+
+def encode_frame(packets, flags=0):
+    """Encode une liste de paquets IP en une seule trame"""
+    parts = [b'']
+    size = 0
+    for packet in packets:
+        parts.append(PACKET_HEADER.pack(len(packet)))
+        parts.append(packet)
+        size += PACKET_HEADER.size + len(packet)
+    if size > MAX_FRAME_PAYLOAD or len(packets) > MAX_PACKETS_PER_FRAME:
+        raise FrameError(f"Trame trop grande ({len(packets)} paquets, {size} octets)")
+    parts[0] = FRAME_HEADER.pack(FRAME_VERSION, flags, len(packets), size)
+    return b''.join(parts)
+
+
+def encode_control(message):
+    """Trame de contrôle portant `message` (octets)"""
+    if len(message) > MAX_FRAME_PAYLOAD:
+        raise FrameError("Message de contrôle trop grand")
+    return FRAME_HEADER.pack(FRAME_VERSION, FLAG_CONTROL, 0, len(message)) + message
+
+
+def decode_payload(flags, payload, count, compressor=None):
+    """Paquets d'une trame reçue; pour une trame de contrôle, son message seul"""
+    if flags & FLAG_CONTROL:
+        return [bytes(payload)]
+    if flags & FLAG_COMPRESSED:
+        if compressor is None:
+            raise FrameError("Trame compressée sans compression négociée")
+        payload = memoryview(compressor.decompress(payload))
+    return split_frame(payload, count)
+
+
+def parse_frame(data):
+    """En-tête d'une trame complète déjà en mémoire: (flags, nombre de paquets, données non décodées)"""
+    if len(data) < FRAME_HEADER.size:
+        raise FrameError("Trame tronquée")
+    version, flags, count, size = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise FrameError(f"Version de trame non supportée: {version}")
+    if size != len(data) - FRAME_HEADER.size:
+        raise FrameError("Taille de trame incohérente")
+    return flags, count, memoryview(data)[FRAME_HEADER.size:]
+
+
+def decode_frame(data, compressor=None):
+    """Décode une trame complète déjà en mémoire (ex: un datagramme); retourne (flags, paquets)"""
+    flags, count, payload = parse_frame(data)
+    return flags, decode_payload(flags, payload, count, compressor)
+
+
+def split_frame(payload, count):
+    """Découpe les données d'une trame en vues mémoire sur chaque paquet (sans copie)"""
+    packets = []
+    offset = 0
+    end = len(payload)
+    for _ in range(count):
+        if offset + PACKET_HEADER.size > end:
+            raise FrameError("Trame tronquée")
+        (length,) = PACKET_HEADER.unpack_from(payload, offset)
+        offset += PACKET_HEADER.size
+        if offset + length > end:
+            raise FrameError("Paquet tronqué dans la trame")
+        packets.append(payload[offset:offset + length])
+        offset += length
+    if offset != end:
+        raise FrameError("Octets en trop dans la trame")
+    return packets
+
+
+class FrameDecoder:
+    """Décodeur de trames en flux, avec un tampon de réception réutilisé"""
+
+    def __init__(self, sock, buffer_size=256 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.compressor = None  # FrameCompressor une fois la compression négociée
+
+    def _fill(self, needed):
+        """Lit sur le socket jusqu'à avoir au moins `needed` octets disponibles.
+
+        Retourne False en fin de flux entre deux trames; FrameError si le pair
+        coupe au milieu d'une trame.
+        """
+        if self.end - self.start >= needed:
+            return True
+        if self.start + needed > len(self.buffer):
+            pending = self.end - self.start
+            if needed > len(self.buffer):
+                # Trame plus grande que le tampon : en allouer un nouveau
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:pending] = self.view[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                # Ramener les octets restants en début de tampon
+                self.view[:pending] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        while self.end - self.start < needed:
+            n = self.sock.recv_into(self.view[self.end:])
+            if not n:
+                if self.end > self.start:
+                    raise FrameError("Trame tronquée")
+                return False
+            self.end += n
+            self.bytes_received += n
+        return True
+
+    def read_frame(self):
+        """Lit la trame suivante et retourne (flags, paquets), ou None en fin de flux.
+
+        FrameError si la trame est invalide ou tronquée par la fin du flux.
+
+        Les paquets sont des memoryview sur le tampon interne : ils ne restent
+        valides que jusqu'au prochain appel. Une trame de contrôle (flags &
+        FLAG_CONTROL) retourne son message comme unique élément.
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        if not self._fill(FRAME_HEADER.size):
+            return None
+        version, flags, count, size = FRAME_HEADER.unpack_from(self.view, self.start)
+        if version != FRAME_VERSION:
+            raise FrameError(f"Version de trame non supportée: {version}")
+        if size > MAX_FRAME_PAYLOAD:
+            raise FrameError(f"Trame trop grande ({size} octets)")
+        if not self._fill(FRAME_HEADER.size + size):
+            return None
+        payload_start = self.start + FRAME_HEADER.size
+        payload = self.view[payload_start:payload_start + size]
+        self.start = payload_start + size
+        self.frames_received += 1
+        return flags, decode_payload(flags, payload, count, self.compressor)
+
+    def packets(self):
+        """Itère sur tous les paquets reçus jusqu'à la fin du flux"""
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            if not frame[0] & FLAG_CONTROL:
+                yield from frame[1]
+
+
+async def read_frame_async(reader, compressor=None):
+    """Version asyncio de FrameDecoder.read_frame pour un asyncio.StreamReader.
+
+    Retourne (flags, paquets) ou None en fin de flux entre deux trames;
+    FrameError si le pair coupe au milieu d'une trame.
+    """
+    frame = await read_raw_frame_async(reader)
+    if frame is None:
+        return None
+    flags, count, payload = frame
+    return flags, decode_payload(flags, memoryview(payload), count, compressor)
+
+
+async def read_raw_frame_async(reader):
+    """Lit une trame sans la décoder: (flags, nombre de paquets, données), ou None en fin de flux.
+
+    Les données restent compressées: decode_payload() peut être appelé hors de la boucle.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Trame tronquée") from e
+        return None
+    version, flags, count, size = FRAME_HEADER.unpack(header)
+    if version != FRAME_VERSION:
+        raise FrameError(f"Version de trame non supportée: {version}")
+    if size > MAX_FRAME_PAYLOAD:
+        raise FrameError(f"Trame trop grande ({size} octets)")
+    try:
+        payload = await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        raise FrameError("Trame tronquée") from e
+    return flags, count, payload
@@ -0,0 +1,164 @@
+import ctypes
+import ctypes.util
+import logging
+import socket
+import struct
+import sys
+from .metrics import INJECT_ERRORS
+
+IP_HDRINCL = getattr(socket, "IP_HDRINCL", 3)
+
+logger = logging.getLogger(__name__)
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    """Retourne sendmmsg(2) de la libc si disponible (Linux), sinon None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+def _sockaddr_in(dst):
+    """sockaddr_in (port 0) pour l'adresse de destination d'un paquet IP"""
+    return struct.pack("=H2s4s8x", socket.AF_INET, b"\0\0", dst)
+
+
+class RawInjector:
+    """Injecte des paquets IP bruts sur un socket persistant (IPPROTO_RAW / IP_HDRINCL).
+
+    Un seul socket est ouvert pour toute la durée de vie de l'injecteur, au lieu
+    d'un socket par paquet avec scapy.send(). Un socket déjà connecté (par exemple
+    un bout de socketpair) peut être fourni pour tester sans droits root.
+    """
+
+    def __init__(self, sock=None, use_sendmmsg=True, fallback=True):
+        self.sock = sock
+        self.raw = sock is None  # Les paquets sont adressés à leur IP de destination
+        self.use_sendmmsg = use_sendmmsg and _sendmmsg is not None
+        self.fallback = fallback
+        self.use_scapy = False
+        self.packets_injected = 0
+        self.batches_injected = 0
+        self.errors = 0
+
+    def open(self):
+        if self.sock is not None or self.use_scapy:
+            return
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            sock.setsockopt(socket.IPPROTO_IP, IP_HDRINCL, 1)
+            self.sock = sock
+        except OSError as e:
+            if not self.fallback:
+                raise
+            # Pas de socket brut (droits, plateforme): repli sur scapy.send()
+            logger.warning("Socket brut indisponible (%s), repli sur scapy pour l'injection", e)
+            self.use_scapy = True
+
+    def inject(self, data):
+        """Injecte un paquet IP; lève l'erreur d'envoi après l'avoir comptée"""
+        try:
+            if self.use_scapy:
+                from scapy.all import IP, send
+                send(IP(bytes(data)), verbose=0)
+            elif self.raw:
+                self.sock.sendto(data, (socket.inet_ntoa(bytes(data[16:20])), 0))
+            else:
+                self.sock.send(data)
+        except OSError:
+            self.errors += 1
+            INJECT_ERRORS.inc()
+            raise
+        self.packets_injected += 1
+
+    def inject_batch(self, packets):
+        """Injecte une liste de paquets, avec sendmmsg quand c'est possible.
+
+        Retourne le nombre de paquets injectés; les erreurs sont comptées et le
+        paquet fautif est ignoré.
+        """
+        if not packets:
+            return 0
+        if self.use_sendmmsg and not self.use_scapy and len(packets) > 1:
+            sent = self._inject_sendmmsg(packets)
+        else:
+            sent = 0
+            for packet in packets:
+                try:
+                    self.inject(packet)
+                    sent += 1
+                except OSError:
+                    pass
+            return sent
+        self.batches_injected += 1
+        return sent
+
+    def _inject_sendmmsg(self, packets):
+        count = len(packets)
+        buffers = [bytes(packet) for packet in packets]
+        iovecs = (_IOVec * count)()
+        msgs = (_MMsgHdr * count)()
+        names = []
+        for i, data in enumerate(buffers):
+            iovecs[i].iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+            iovecs[i].iov_len = len(data)
+            hdr = msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(iovecs[i])
+            hdr.msg_iovlen = 1
+            if self.raw:
+                name = ctypes.create_string_buffer(_sockaddr_in(data[16:20]))
+                names.append(name)  # Garder le tampon en vie pendant l'appel
+                hdr.msg_name = ctypes.cast(name, ctypes.c_void_p)
+                hdr.msg_namelen = 16
+        fd = self.sock.fileno()
+        base = ctypes.addressof(msgs)
+        done = 0
+        injected = 0
+        while done < count:
+            first = ctypes.cast(base + done * ctypes.sizeof(_MMsgHdr), ctypes.POINTER(_MMsgHdr))
+            n = _sendmmsg(fd, first, count - done, 0)
+            if n < 0:
+                # Le paquet en tête est refusé: le compter et passer au suivant
+                self.errors += 1
+                INJECT_ERRORS.inc()
+                done += 1
+                continue
+            injected += n
+            done += n
+        self.packets_injected += injected
+        return injected
+
+    def close(self):
+        if self.sock is not None and self.raw:
+            self.sock.close()
+            self.sock = None
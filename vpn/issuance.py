@@ -0,0 +1,329 @@
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque, OrderedDict
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from .certs import CertificateManager, certificate_fingerprint, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Délivrance des certificats utilisateurs hors du thread de la requête:
+# la génération des clés (RSA-2048: des dizaines de ms) tourne dans un pool
+# de processus, sur tous les cœurs et sans le GIL de l'hôte; une réserve de
+# clés peut être générée d'avance et remplie en arrière-plan. Signer le
+# certificat avec la CA gardée en mémoire ne coûte ensuite qu'une signature.
+
+USERNAME = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}')  # Sert aussi de nom de dossier
+MAX_JOBS = 100  # Tâches de création en masse gardées pour la consultation de leur état
+
+
+def generate_key_pem(key_type):
+    """Clé privée PEM (PKCS8), générée dans un processus du pool"""
+    key = CertificateManager(key_type=key_type).generate_key()
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+
+def load_key(pem):
+    # Clé générée par nos propres processus: la vérification RSA (des dizaines de ms) est inutile
+    return serialization.load_pem_private_key(pem, password=None, unsafe_skip_rsa_key_validation=True)
+
+
+def valid_username(username):
+    return bool(username) and USERNAME.fullmatch(username) is not None
+
+
+class KeyPool:
+    """Clés privées générées dans un pool de processus, avec une réserve remplie en arrière-plan"""
+
+    def __init__(self, key_type='rsa', reserve=0, workers=None):
+        self.key_type = key_type
+        self.reserve = reserve  # Clés gardées d'avance (0: pas de réserve)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.keys = deque()
+        self.refilling = 0
+        self.lock = threading.Lock()
+        self.served_from_reserve = 0
+        self.generated_on_demand = 0
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn: l'hôte a de nombreux threads, un fork pourrait hériter d'un verrou pris
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def submit(self):
+        return self._executor().submit(generate_key_pem, self.key_type)
+
+    def start(self):
+        """Lance le remplissage de la réserve"""
+        self.refill()
+
+    def refill(self):
+        with self.lock:
+            missing = max(0, self.reserve - len(self.keys) - self.refilling)
+            self.refilling += missing
+        for _ in range(missing):
+            self.submit().add_done_callback(self._refilled)
+
+    def _refilled(self, future):
+        with self.lock:
+            self.refilling -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.keys.append(future.result())
+
+    def get(self):
+        """Une clé privée: de la réserve si possible, sinon générée dans le pool"""
+        return next(self.generate(1))
+
+    def generate(self, count):
+        """`count` clés privées, au fur et à mesure: la réserve d'abord, puis tous les cœurs en parallèle"""
+        with self.lock:
+            reserved = [self.keys.popleft() for _ in range(min(count, len(self.keys)))]
+            self.served_from_reserve += len(reserved)
+            self.generated_on_demand += count - len(reserved)
+        futures = [self.submit() for _ in range(count - len(reserved))]
+        self.refill()
+        try:
+            for pem in reserved:
+                yield load_key(pem)
+            for future in concurrent.futures.as_completed(futures):
+                yield load_key(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stats(self):
+        return {
+            'reserve': len(self.keys),
+            'reserve_target': self.reserve,
+            'workers': self.workers,
+            'served_from_reserve': self.served_from_reserve,
+            'generated_on_demand': self.generated_on_demand,
+        }
+
+    def close(self, wait=False):
+        """Arrête le pool; `wait` attend la fin de ses processus (obligatoire dans un processus fils avant de sortir)"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class BulkJob:
+    """Création en masse suivie par l'interface d'administration"""
+
+    def __init__(self, job_id, usernames):
+        self.id = job_id
+        self.usernames = usernames
+        self.state = 'pending'  # pending, running, done
+        self.issued = 0
+        self.errors = {}  # utilisateur -> message
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def status(self):
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0
+        return {
+            'id': self.id,
+            'state': self.state,
+            'total': len(self.usernames),
+            'issued': self.issued,
+            'failed': len(self.errors),
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 3),
+            'users_per_second': round(self.issued / elapsed, 2) if elapsed else None,
+        }
+
+
+class Issuer:
+    """Délivre les certificats utilisateurs (CA en mémoire, clés du KeyPool) et les enregistre"""
+
+    def __init__(self, cert_manager, user_manager, key_pool=None):
+        self.cert_manager = cert_manager
+        self.user_manager = user_manager
+        self.key_pool = key_pool or KeyPool(cert_manager.key_type)
+        self.jobs = OrderedDict()
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def issue(self, username, user_key=None):
+        """Crée un utilisateur: certificat signé par la CA, fichiers et fiche"""
+        if not valid_username(username):
+            raise ValueError(f"Nom d'utilisateur invalide: {username!r}")
+        if self.user_manager.get_user(username):
+            raise ValueError("Utilisateur existe déjà")
+        ca_key, ca_cert = self.cert_manager.generate_ca_cert()
+        user_key = user_key or self.key_pool.get()
+        # Écrit à côté puis mis en place sous les verrous de la base: deux créations
+        # simultanées du même nom ne peuvent pas réussir toutes les deux
+        folder = os.path.join('users', username)
+        tmp_folder = os.path.join('users', f".{username}.tmp-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        user_cert = self.cert_manager.generate_user_cert(username, ca_key, ca_cert, user_key, user_folder=tmp_folder,
+                                                         bundle=True)
+
+        def install():
+            shutil.rmtree(folder, ignore_errors=True)  # Dossier orphelin (utilisateur absent de la base)
+            os.rename(tmp_folder, folder)
+
+        record = user_record(username, fingerprint=certificate_fingerprint(user_cert))
+        if not self.user_manager.add_new_user(username, record, before_write=install):
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            raise ValueError("Utilisateur existe déjà")
+        return user_cert
+
+    def submit(self, usernames):
+        """Lance la création en masse dans un thread; retourne la tâche"""
+        usernames = list(dict.fromkeys(usernames))  # Sans doublons, dans l'ordre
+        with self.lock:
+            job = BulkJob(next(self.job_ids), usernames)
+            self.jobs[job.id] = job
+            while len(self.jobs) > MAX_JOBS:
+                self.jobs.popitem(last=False)
+        threading.Thread(target=self.run_job, args=(job,), name=f"bulk_issue-{job.id}", daemon=True).start()
+        return job
+
+    def run_job(self, job):
+        job.state = 'running'
+        job.started = time.time()
+        valid = []
+        for username in job.usernames:
+            if not valid_username(username):
+                job.errors[username] = "Nom d'utilisateur invalide"
+            elif self.user_manager.get_user(username):
+                job.errors[username] = "Utilisateur existe déjà"
+            else:
+                valid.append(username)
+        processed = 0
+        try:
+            for username, user_key in zip(valid, self.key_pool.generate(len(valid))):
+                processed += 1
+                try:
+                    self.issue(username, user_key)
+                    job.issued += 1
+                except Exception as e:
+                    job.errors[username] = str(e)
+        except Exception as e:
+            # Pool de processus en échec: les utilisateurs restants ne sont pas créés
+            logger.error("Création en masse %d interrompue: %s", job.id, e)
+            for username in valid[processed:]:
+                job.errors[username] = str(e)
+        job.finished = time.time()
+        job.state = 'done'
+        logger.info("Création en masse %d: %d utilisateurs créés, %d échecs", job.id, job.issued, len(job.errors))
+
+    def job_status(self, job_id):
+        job = self.jobs.get(job_id)
+        return job.status() if job is not None else None
+
+
+# Provisionnement en masse (provision.py): chaque processus du pool charge la
+# CA une fois, puis génère clé et certificat et écrit le dossier de
+# l'utilisateur dans un dossier temporaire renommé à la fin. Un dossier
+# users/<nom> présent est donc toujours complet: une reprise après
+# interruption enregistre les dossiers déjà écrits sans les régénérer.
+_worker = {}
+
+
+def _init_provision_worker(ca_key_pem, ca_cert_pem, key_type):
+    _worker['cert_manager'] = CertificateManager(key_type=key_type)
+    _worker['ca_key'] = serialization.load_pem_private_key(ca_key_pem, password=None, unsafe_skip_rsa_key_validation=True)
+    _worker['ca_cert'] = x509.load_pem_x509_certificate(ca_cert_pem)
+
+
+def provision_user(username, users_dir='users'):
+    """Processus du pool: clé, certificat et dossier de l'utilisateur; retourne (utilisateur, empreinte)"""
+    folder = os.path.join(users_dir, username)
+    tmp_folder = os.path.join(users_dir, f".{username}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    user_cert = _worker['cert_manager'].generate_user_cert(username, _worker['ca_key'], _worker['ca_cert'],
+                                                            user_folder=tmp_folder, bundle=True)
+    os.rename(tmp_folder, folder)
+    return username, certificate_fingerprint(user_cert)
+
+
+def user_record(username, users_dir='users', fingerprint=None, bundle=True):
+    """Fiche d'un utilisateur: paquet d'identifiants (un fichier) ou les trois fichiers PEM d'origine"""
+    folder = f"{users_dir}/{username}"
+    if bundle:
+        path = f"{folder}/{username}.pem"
+        record = {'folder': folder, 'cert_file': path, 'key_file': path, 'bundle': path}
+    else:
+        record = {'folder': folder, 'cert_file': f"{folder}/{username}.crt", 'key_file': f"{folder}/{username}.key"}
+    if fingerprint:
+        record['fingerprint'] = fingerprint
+    return record
+
+
+def written_record(username, users_dir='users'):
+    """Fiche d'un dossier utilisateur déjà complet (paquet ou fichiers séparés), sinon None"""
+    folder = os.path.join(users_dir, username)
+    if os.path.exists(os.path.join(folder, f"{username}.pem")):
+        return user_record(username, users_dir, file_fingerprint(os.path.join(folder, f"{username}.pem")))
+    if all(os.path.exists(os.path.join(folder, name)) for name in (f"{username}.crt", f"{username}.key", 'ca.crt')):
+        return user_record(username, users_dir, file_fingerprint(os.path.join(folder, f"{username}.crt")), bundle=False)
+    return None
+
+
+def provision(usernames, cert_manager, user_manager, users_dir='users', workers=None, progress=None):
+    """Crée en parallèle les utilisateurs absents, puis les enregistre en une fois.
+
+    Retourne {'created', 'recovered', 'skipped', 'failed'}. Interrompu (Ctrl-C),
+    les utilisateurs déjà écrits sont enregistrés avant de propager l'exception.
+    """
+    ca_key, ca_cert = cert_manager.generate_ca_cert()
+    ca_key_pem = ca_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption())
+    ca_cert_pem = ca_cert.public_bytes(serialization.Encoding.PEM)
+    os.makedirs(users_dir, exist_ok=True)
+    for entry in os.listdir(users_dir):
+        if entry.startswith('.') and '.tmp-' in entry:
+            shutil.rmtree(os.path.join(users_dir, entry), ignore_errors=True)  # Dossier d'un processus interrompu
+    result = {'created': 0, 'recovered': 0, 'skipped': 0, 'failed': {}}
+    batch = {}
+    pending = []
+    for username in dict.fromkeys(usernames):
+        if not valid_username(username):
+            result['failed'][username] = "Nom d'utilisateur invalide"
+        elif user_manager.get_user(username):
+            result['skipped'] += 1
+        elif (record := written_record(username, users_dir)) is not None:
+            # Écrit lors d'une exécution interrompue avant l'enregistrement
+            batch[username] = record
+            result['recovered'] += 1
+        else:
+            shutil.rmtree(os.path.join(users_dir, username), ignore_errors=True)  # Dossier d'avant l'écriture atomique
+            pending.append(username)
+    try:
+        if pending:
+            with concurrent.futures.ProcessPoolExecutor(
+                    workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_provision_worker, initargs=(ca_key_pem, ca_cert_pem, cert_manager.key_type)) as pool:
+                futures = {pool.submit(provision_user, username, users_dir): username for username in pending}
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        try:
+                            username, fingerprint = future.result()
+                        except Exception as e:
+                            result['failed'][futures[future]] = str(e)
+                            continue
+                        batch[username] = user_record(username, users_dir, fingerprint)
+                        result['created'] += 1
+                        if progress is not None:
+                            progress(result['created'], len(pending))
+                except BaseException:
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+    finally:
+        user_manager.add_users(batch)
+    return result
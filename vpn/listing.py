@@ -0,0 +1,116 @@
+import base64
+import binascii
+import bisect
+import threading
+from collections import OrderedDict
+
+# Liste des utilisateurs de l'interface d'administration: noms triés tenus à
+# jour par les notifications du UserManager (insertion/suppression par
+# bisection, sans rebalayer la base), pages et recherche par préfixe en
+# O(log n + taille de page). Les pages HTML rendues sont gardées en mémoire
+# jusqu'au prochain changement d'utilisateur.
+
+PREFIX_END = '\U0010ffff'  # Plus grand que tout caractère suivant un préfixe
+
+
+def encode_cursor(username):
+    return base64.urlsafe_b64encode(username.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Nom d'utilisateur d'un curseur; ValueError s'il est invalide"""
+    try:
+        return base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Curseur invalide")
+
+
+class UserIndex:
+    """Noms d'utilisateurs triés, pour la pagination et la recherche par préfixe"""
+
+    def __init__(self, user_manager):
+        self.user_manager = user_manager
+        self.lock = threading.Lock()
+        self.names = []
+        with user_manager.lock:  # Aucun changement entre l'abonnement et la lecture initiale
+            user_manager.subscribe(self.on_user_change)
+            self.names = sorted(user_manager.list_users())
+
+    def on_user_change(self, op, username, info):
+        with self.lock:
+            index = bisect.bisect_left(self.names, username)
+            present = index < len(self.names) and self.names[index] == username
+            if op == 'delete' and present:
+                del self.names[index]
+            elif op != 'delete' and not present:
+                self.names.insert(index, username)
+
+    def _range(self, prefix):
+        if not prefix:
+            return 0, len(self.names)
+        return (bisect.bisect_left(self.names, prefix),
+                bisect.bisect_left(self.names, prefix + PREFIX_END))
+
+    def count(self, prefix=''):
+        self.user_manager.refresh_if_due()
+        with self.lock:
+            start, end = self._range(prefix)
+            return end - start
+
+    def page(self, prefix='', offset=0, limit=50):
+        """Noms n° offset à offset+limit parmi ceux qui commencent par prefix"""
+        self.user_manager.refresh_if_due()
+        with self.lock:
+            start, end = self._range(prefix)
+            start = min(start + offset, end)
+            return self.names[start:min(start + limit, end)]
+
+    def after(self, prefix='', cursor=None, limit=100):
+        """(noms suivant le curseur, curseur suivant ou None): stable si des utilisateurs sont ajoutés entre deux appels"""
+        self.user_manager.refresh_if_due()
+        with self.lock:
+            start, end = self._range(prefix)
+            if cursor is not None:
+                start = max(start, bisect.bisect_right(self.names, decode_cursor(cursor)))
+            names = self.names[start:min(start + limit, end)]
+            more = start + limit < end
+        return names, (encode_cursor(names[-1]) if more and names else None)
+
+
+class RenderCache:
+    """Pages rendues (LRU), vidées à chaque changement d'utilisateur"""
+
+    def __init__(self, user_manager, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0  # Incrémenté à chaque invalidation: une page rendue avant n'est pas gardée
+        self.hits = 0
+        self.misses = 0
+        user_manager.subscribe(self.on_user_change)
+
+    def get(self, key, render):
+        """Page en cache pour key, sinon render() mise en cache"""
+        with self.lock:
+            page = self.entries.get(key)
+            if page is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return page
+            self.misses += 1
+            generation = self.generation
+        page = render()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = page
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return page
+
+    def on_user_change(self, op, username, info):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
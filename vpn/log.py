@@ -0,0 +1,111 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Journalisation du package: les modules utilisent logging.getLogger(__name__)
+# (formatage paresseux, niveaux). setup_logging() installe un gestionnaire qui
+# ne fait que déposer les messages dans une file bornée, écrite sur la sortie
+# par un thread dédié: un terminal lent ne bloque jamais le tunnel.
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+QUEUE_SIZE = 10000
+
+_listener = None
+_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """Limite les messages répétés (même logger, même modèle) à `burst` par intervalle.
+
+    Les messages supprimés sont comptés et le total est ajouté au premier
+    message accepté de l'intervalle suivant.
+    """
+
+    def __init__(self, interval=5.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.windows = {}  # (logger, modèle, niveau) -> [début, acceptés, supprimés]
+        self.lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = (record.name, record.msg, record.levelno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if len(self.windows) > 10000:
+                    self.windows.clear()
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} messages similaires supprimés)"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne les messages quand la file est pleine, au lieu de bloquer"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=logging.INFO, stream=None, rate_interval=5.0, rate_burst=5):
+    """Configure la journalisation du package `vpn` (à appeler par les scripts de lancement).
+
+    Peut être rappelée, par exemple dans un processus worker, pour repartir
+    d'une configuration neuve.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        logger = logging.getLogger('vpn')
+        for handler in list(logger.handlers):
+            if isinstance(handler, DroppingQueueHandler):
+                logger.removeHandler(handler)
+
+        log_queue = queue.Queue(QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter(rate_interval, rate_burst))
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+        return _listener
+
+
+def shutdown_logging():
+    """Vide la file et arrête le thread d'écriture"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,292 @@
+import bisect
+import math
+import threading
+import weakref
+
+# Registre de métriques au format texte Prometheus (exposé par l'admin sur
+# /metrics). Les compteurs et histogrammes sont mis à jour sous un verrou
+# propre à chaque série; les valeurs déjà tenues ailleurs (taille de la table
+# NAT, profondeur des files) sont lues par des collecteurs au moment de la
+# collecte, sans coût sur le chemin des paquets. Les séries par utilisateur
+# ne vivent que le temps de ses sessions (UserSeries): le nombre de séries
+# exposées suit les utilisateurs connectés, pas tous ceux passés par l'hôte.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.01)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value, count=1):
+        """Enregistre `count` observations de valeur `value` (ex: latence moyenne d'un lot)"""
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += count
+            self.sum += value * count
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Série correspondant à ces valeurs d'étiquettes (à conserver par l'appelant sur le chemin chaud)"""
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: étiquettes attendues {self.labelnames}")
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Retire la série de ces valeurs d'étiquettes (absente des collectes suivantes)"""
+        with self.lock:
+            self.children.pop(tuple(str(v) for v in values), None)
+
+    def _samples(self):
+        for values, child in list(self.children.items()):
+            yield self.name, _format_labels(self.labelnames, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.children[()].set(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value, count=1):
+        self.children[()].observe(value, count)
+
+    def _samples(self):
+        for values, child in list(self.children.items()):
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, values, ('le', _format_value(float(bound)))), cumulative)
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """Ensemble des métriques du processus et des collecteurs appelés à chaque collecte"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, method):
+        """Ajoute une méthode liée appelée à chaque collecte (sans garder l'objet en vie).
+
+        Elle retourne des tuples (nom, type, aide, [(étiquettes, valeur)]).
+        """
+        with self.lock:
+            self.collectors.append(weakref.WeakMethod(method))
+
+    def render(self):
+        """Toutes les métriques au format texte d'exposition Prometheus"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        collected = {}
+        with self.lock:
+            self.collectors = [ref for ref in self.collectors if ref() is not None]
+            collectors = list(self.collectors)
+        for ref in collectors:
+            method = ref()
+            if method is None:
+                continue
+            # Plusieurs hôtes dans le même processus: additionner les séries identiques
+            for name, kind, documentation, samples in method():
+                entry = collected.setdefault(name, (kind, documentation, {}))
+                for labels, value in samples:
+                    key = tuple(labels.items())
+                    entry[2][key] = entry[2].get(key, 0) + value
+        for name, (kind, documentation, samples) in collected.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in samples.items():
+                labels = _format_labels(tuple(k for k, _ in key), tuple(v for _, v in key))
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Métriques de l'hôte et des tunnels
+SESSION_PACKETS = REGISTRY.counter(
+    'vpn_session_packets_total', 'Paquets transportés par le tunnel, par utilisateur et sens', ('user', 'direction'))
+SESSION_BYTES = REGISTRY.counter(
+    'vpn_session_bytes_total', 'Octets de paquets IP transportés par le tunnel, par utilisateur et sens', ('user', 'direction'))
+QUEUE_DROPS = REGISTRY.counter(
+    'vpn_send_queue_dropped_total', "Paquets abandonnés par les files d'envoi pleines", ('user',))
+HANDSHAKE_SECONDS = REGISTRY.histogram(
+    'vpn_tls_handshake_seconds', 'Durée des poignées de main TLS réussies')
+HANDSHAKE_FAILURES = REGISTRY.counter(
+    'vpn_tls_handshake_failures_total', 'Poignées de main TLS échouées')
+INJECT_ERRORS = REGISTRY.counter(
+    'vpn_inject_errors_total', "Erreurs d'injection de paquets sur le socket brut")
+CAPTURE_ERRORS = REGISTRY.counter(
+    'vpn_capture_errors_total', 'Erreurs de capture sur le chemin retour')
+PACKET_SECONDS = REGISTRY.histogram(
+    'vpn_packet_processing_seconds', 'Temps de traitement par paquet (NAT et remise), par chemin',
+    ('path',), buckets=LATENCY_BUCKETS)
+AUTH_REJECTED = REGISTRY.counter(
+    'vpn_auth_rejected_total', 'Connexions refusées après la poignée de main (utilisateur inconnu, certificat révoqué ou non délivré)',
+    ('reason',))
+FRAME_ERRORS = REGISTRY.counter(
+    'vpn_frame_errors_total', 'Connexions fermées sur une trame invalide ou tronquée')
+DATAGRAMS_REJECTED = REGISTRY.counter(
+    'vpn_datagrams_rejected_total', 'Datagrammes UDP rejetés (session inconnue, authentification, rejeu, file outbound pleine)', ('reason',))
+
+
+class UserSeries:
+    """Séries d'un utilisateur tenues par une session (paquets et octets par sens, rejets de file).
+
+    Les sessions d'un même utilisateur partagent les mêmes séries; elles sont
+    retirées du registre quand la dernière est libérée (déconnexion ou
+    suppression de l'utilisateur). Une reconnexion repart de zéro, ce que
+    Prometheus traite comme la remise à zéro d'un compteur.
+    """
+
+    _lock = threading.Lock()
+    _holders = {}  # Utilisateur -> sessions qui tiennent ses séries
+
+    def __init__(self, username):
+        self.username = username
+        self.released = False
+        with self._lock:
+            # Sous le verrou: release() d'une autre session ne peut pas retirer des séries en cours d'acquisition
+            self._holders[username] = self._holders.get(username, 0) + 1
+            self.rx_packets = SESSION_PACKETS.labels(username, 'rx')
+            self.rx_bytes = SESSION_BYTES.labels(username, 'rx')
+            self.tx_packets = SESSION_PACKETS.labels(username, 'tx')
+            self.tx_bytes = SESSION_BYTES.labels(username, 'tx')
+            self.queue_drops = QUEUE_DROPS.labels(username)
+
+    def release(self):
+        """Fin de la session (idempotent); retire les séries si c'était la dernière de l'utilisateur"""
+        with self._lock:
+            if self.released:
+                return
+            self.released = True
+            remaining = self._holders.pop(self.username) - 1
+            if remaining:
+                self._holders[self.username] = remaining
+                return
+            for direction in ('rx', 'tx'):
+                SESSION_PACKETS.remove(self.username, direction)
+                SESSION_BYTES.remove(self.username, direction)
+            QUEUE_DROPS.remove(self.username)
@@ -0,0 +1,229 @@
+import os
+import threading
+import errno
+import logging
+import socket
+import time
+from .conntrack import PROTO_ICMP, PROTO_TCP, PROTO_UDP
+from . import fastpath
+from .metrics import CAPTURE_ERRORS, PACKET_SECONDS
+from .profiling import PROFILER, clock
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# VPN_SCAPY_NAT=1: traduction via scapy (lent, pour le débogage uniquement)
+USE_SCAPY_NAT = os.environ.get("VPN_SCAPY_NAT") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def return_path_filter(public_ip, port_range):
+    """Filtre BPF de capture limité aux retours vers l'IP publique et la plage de ports NAT"""
+    low, high = port_range
+    return (f"ip dst host {public_ip} and ("
+            f"((tcp or udp) and dst portrange {low}-{high}) or "
+            f"(icmp and icmp[icmptype] == icmp-echoreply and icmp[4:2] >= {low} and icmp[4:2] <= {high}))")
+
+
+def translate_outbound(conntrack, session, packet_data):
+    """NAT source d'un paquet venant d'un client; retourne les octets à forwarder ou None"""
+    if USE_SCAPY_NAT:
+        return translate_outbound_scapy(conntrack, session, packet_data)
+    buf = bytearray(packet_data)
+    parsed = fastpath.parse_ipv4(buf)
+    if parsed is None:
+        return None
+    proto, l4 = parsed
+    src = bytes(buf[fastpath.IP_SRC:fastpath.IP_SRC + 4])
+    dst = bytes(buf[fastpath.IP_DST:fastpath.IP_DST + 4])
+
+    # Enregistrer le flux pour les réponses (TCP/UDP/ICMP echo)
+    nat_port = None
+    if l4 is not None:
+        flow = None
+        if proto == PROTO_TCP or proto == PROTO_UDP:
+            sport, dport = fastpath.l4_ports(buf, l4)
+            flags = fastpath.tcp_flags(buf, l4) if proto == PROTO_TCP else 0
+            flow = conntrack.track_outbound(session, proto, src, sport, dst, dport, flags)
+            if flow is None:
+                return None
+        elif proto == PROTO_ICMP:
+            icmp_type, icmp_id = fastpath.icmp_echo(buf, l4)
+            if icmp_type == ICMP_ECHO_REQUEST:
+                flow = conntrack.track_outbound(session, PROTO_ICMP, src, icmp_id, dst, 0)
+                if flow is None:
+                    return None
+        if flow is not None:
+            nat_port = flow.nat_port
+
+    # NAT: Changer l'IP source pour celle du serveur
+    fastpath.rewrite_source(buf, proto, l4, conntrack.public_ip_packed, nat_port)
+    return buf
+
+
+def translate_inbound(conntrack, packet_data):
+    """NAT inverse d'un paquet de retour; retourne (session, octets) ou None s'il n'a pas de flux"""
+    if USE_SCAPY_NAT:
+        return translate_inbound_scapy(conntrack, packet_data)
+    buf = bytearray(packet_data)
+    parsed = fastpath.parse_ipv4(buf)
+    if parsed is None or parsed[1] is None:
+        return None
+    if buf[fastpath.IP_DST:fastpath.IP_DST + 4] != conntrack.public_ip_packed:
+        return None
+    proto, l4 = parsed
+    remote = bytes(buf[fastpath.IP_SRC:fastpath.IP_SRC + 4])
+
+    # Vérifier si c'est une réponse à un flux suivi
+    if proto == PROTO_TCP or proto == PROTO_UDP:
+        sport, dport = fastpath.l4_ports(buf, l4)
+        flags = fastpath.tcp_flags(buf, l4) if proto == PROTO_TCP else 0
+        flow = conntrack.lookup_inbound(proto, remote, sport, dport, flags)
+    elif proto == PROTO_ICMP:
+        icmp_type, icmp_id = fastpath.icmp_echo(buf, l4)
+        if icmp_type != ICMP_ECHO_REPLY:
+            return None
+        flow = conntrack.lookup_inbound(PROTO_ICMP, remote, 0, icmp_id)
+    else:
+        return None
+    if flow is None:
+        return None
+
+    # Traduire l'adresse et le port de destination
+    fastpath.rewrite_destination(buf, proto, l4, flow.src, flow.sport)
+    return flow.session, buf
+
+
+def translate_outbound_scapy(conntrack, session, packet_data):
+    """Variante scapy de translate_outbound (débogage et tests différentiels)"""
+    from scapy.all import IP, TCP, UDP, ICMP
+    pkt = IP(bytes(packet_data))
+    src = socket.inet_aton(pkt.src)
+    dst = socket.inet_aton(pkt.dst)
+
+    # Enregistrer le flux pour les réponses (TCP/UDP/ICMP echo)
+    flow = None
+    if TCP in pkt:
+        flow = conntrack.track_outbound(session, PROTO_TCP, src, pkt[TCP].sport, dst, pkt[TCP].dport, int(pkt[TCP].flags))
+        if flow is None:
+            return None
+        pkt[TCP].sport = flow.nat_port
+        del pkt[TCP].chksum
+    elif UDP in pkt:
+        flow = conntrack.track_outbound(session, PROTO_UDP, src, pkt[UDP].sport, dst, pkt[UDP].dport)
+        if flow is None:
+            return None
+        pkt[UDP].sport = flow.nat_port
+        if pkt[UDP].chksum:  # 0: pas de somme de contrôle UDP, à conserver
+            del pkt[UDP].chksum
+    elif ICMP in pkt and pkt[ICMP].type == ICMP_ECHO_REQUEST:
+        flow = conntrack.track_outbound(session, PROTO_ICMP, src, pkt[ICMP].id, dst, 0)
+        if flow is None:
+            return None
+        pkt[ICMP].id = flow.nat_port
+        del pkt[ICMP].chksum
+
+    # NAT: Changer l'IP source pour celle du serveur
+    pkt.src = conntrack.public_ip
+    del pkt.chksum
+    return bytes(pkt)
+
+
+def translate_inbound_scapy(conntrack, packet_data):
+    """Variante scapy de translate_inbound (débogage et tests différentiels)"""
+    from scapy.all import IP, TCP, UDP, ICMP
+    pkt = IP(bytes(packet_data))
+    if pkt.dst != conntrack.public_ip:
+        return None
+    remote = socket.inet_aton(pkt.src)
+
+    # Vérifier si c'est une réponse à un flux suivi
+    if TCP in pkt:
+        flow = conntrack.lookup_inbound(PROTO_TCP, remote, pkt[TCP].sport, pkt[TCP].dport, int(pkt[TCP].flags))
+        if flow is None:
+            return None
+        pkt[TCP].dport = flow.sport
+        del pkt[TCP].chksum
+    elif UDP in pkt:
+        flow = conntrack.lookup_inbound(PROTO_UDP, remote, pkt[UDP].sport, pkt[UDP].dport)
+        if flow is None:
+            return None
+        pkt[UDP].dport = flow.sport
+        if pkt[UDP].chksum:
+            del pkt[UDP].chksum
+    elif ICMP in pkt and pkt[ICMP].type == ICMP_ECHO_REPLY:
+        flow = conntrack.lookup_inbound(PROTO_ICMP, remote, 0, pkt[ICMP].id)
+        if flow is None:
+            return None
+        pkt[ICMP].id = flow.sport
+        del pkt[ICMP].chksum
+    else:
+        return None
+
+    # Traduire l'adresse de destination
+    pkt.dst = socket.inet_ntoa(flow.src)
+    del pkt.chksum
+    return flow.session, bytes(pkt)
+
+
+class ReverseNatEngine:
+    """Chemin retour unique de l'hôte: une seule capture, dispatch vers la session propriétaire"""
+
+    def __init__(self, packet_io, conntrack):
+        self.packet_io = packet_io
+        self.conntrack = conntrack
+        self.running = False
+        self.thread = None
+        self.packets_captured = 0
+        self.packets_dispatched = 0
+        self.latency = PACKET_SECONDS.labels('inbound')
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='reverse_nat', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self):
+        """Capture les réponses et les envoie au client propriétaire via NAT inverse"""
+        while self.running:
+            try:
+                profiling = PROFILER.enabled
+                if profiling:
+                    t0 = clock()
+                packet_data = self.packet_io.read_packet(timeout=1)
+                if packet_data is None:
+                    continue
+                self.packets_captured += 1
+                if profiling:
+                    t1 = clock()
+                    PROFILER.add('capture', t1 - t0)
+                    self.dispatch(packet_data)
+                    PROFILER.add('nat_inbound', clock() - t1)
+                else:
+                    self.dispatch(packet_data)
+            except Exception as e:
+                if self.running and not (hasattr(e, 'errno') and e.errno == errno.EMSGSIZE):
+                    CAPTURE_ERRORS.inc()
+                    logger.error("Erreur reverse NAT: %s", e)
+
+    def dispatch(self, packet_data):
+        """Traduit un paquet de retour et le remet à sa session; retourne False s'il n'a pas de propriétaire"""
+        start = time.perf_counter()
+        result = translate_inbound(self.conntrack, packet_data)
+        if result is None:
+            return False
+        session, packet_data = result
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Reverse NAT: Paquet reçu de %s, envoyé au client %s",
+                         socket.inet_ntoa(packet_data[12:16]), socket.inet_ntoa(packet_data[16:20]))
+        # Envoyer au client
+        session.send_to_peer(packet_data)
+        self.packets_dispatched += 1
+        self.latency.observe(time.perf_counter() - start)
+        return True
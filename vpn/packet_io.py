@@ -0,0 +1,236 @@
+import os
+import sys
+import select
+import socket
+import struct
+import subprocess
+import time
+from .injector import RawInjector
+
+# Constantes Linux pour /dev/net/tun (linux/if_tun.h)
+TUNSETIFF = 0x400454ca
+IFF_TUN = 0x0001
+IFF_NO_PI = 0x1000
+
+DEFAULT_MTU = 1500
+
+
+def client_capture_filter(server_ip, server_port, local_ip=None):
+    """Filtre BPF de capture du client: seuls les paquets à tunneler remontent du noyau.
+
+    Exclut le flux TLS du tunnel lui-même (qui serait sinon ré-encapsulé en
+    boucle), le loopback, la diffusion et le multicast. Avec `local_ip`, seuls
+    les paquets émis par cette machine sont capturés (pas les réponses injectées).
+    """
+    clauses = ["ip"]
+    if local_ip:
+        clauses.append(f"src host {local_ip}")
+    clauses += [
+        f"not (host {server_ip} and tcp port {server_port})",
+        "not net 127.0.0.0/8",
+        "not dst host 255.255.255.255",
+        "not dst net 224.0.0.0/4",
+    ]
+    return " and ".join(clauses)
+
+
+def route_source_address(dest_ip):
+    """Adresse source choisie par le noyau pour joindre `dest_ip` (table de routage courante)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connect() sur UDP n'émet rien: il ne fait que résoudre la route
+        sock.connect((dest_ip, 9))
+        return sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+class ScapyPacketIO:
+    """Backend historique: capture via scapy, injection par un socket brut persistant"""
+
+    def __init__(self, capture_filter="ip", injector=None):
+        self.capture_filter = capture_filter
+        self.pending_filter = None  # Nouveau filtre, appliqué par le thread de capture
+        self.listen_socket = None
+        # L'injecteur peut être partagé entre plusieurs tunnels (un seul socket brut)
+        self.owns_injector = injector is None
+        self.injector = injector or RawInjector()
+
+    def open(self):
+        self.injector.open()
+        if self.listen_socket is None:
+            from scapy.all import conf
+            if self.pending_filter is not None:
+                self.capture_filter, self.pending_filter = self.pending_filter, None
+            # Un seul socket de capture persistant au lieu d'un sniff() par paquet
+            self.listen_socket = conf.L2listen(filter=self.capture_filter)
+
+    def set_capture_filter(self, capture_filter):
+        """Change le filtre BPF; retourne False s'il est inchangé.
+
+        Le socket de capture est rouvert par le thread de capture à sa prochaine
+        lecture, jamais pendant qu'il l'utilise.
+        """
+        if capture_filter == (self.pending_filter or self.capture_filter):
+            return False
+        self.pending_filter = capture_filter
+        return True
+
+    def _apply_pending_filter(self):
+        capture_filter, self.pending_filter = self.pending_filter, None
+        self.capture_filter = capture_filter
+        if self.listen_socket is not None:
+            from scapy.all import conf
+            self.listen_socket.close()
+            self.listen_socket = conf.L2listen(filter=capture_filter)
+
+    def read_packet(self, timeout=1):
+        """Retourne les octets du prochain paquet IP capturé, ou None après `timeout`"""
+        from scapy.all import IP
+        if self.pending_filter is not None:
+            self._apply_pending_filter()
+        ready = self.listen_socket.select([self.listen_socket], timeout)
+        if not ready:
+            return None
+        pkt = self.listen_socket.recv()
+        if pkt is None or IP not in pkt:
+            return None
+        return bytes(pkt[IP])
+
+    def write_packet(self, data):
+        self.injector.inject(data)
+
+    def write_packets(self, packets):
+        self.injector.inject_batch(packets)
+
+    def close(self):
+        if self.listen_socket is not None:
+            self.listen_socket.close()
+            self.listen_socket = None
+        if self.owns_injector:
+            self.injector.close()
+
+
+class TunPacketIO:
+    """Backend Linux: lit et écrit des trames IP brutes sur une interface TUN"""
+
+    def __init__(self, name="tun0", mtu=DEFAULT_MTU):
+        self.name = name
+        self.mtu = mtu
+        self.fd = None
+
+    def open(self):
+        if self.fd is not None:
+            return
+        if not sys.platform.startswith("linux"):
+            raise OSError("Les interfaces TUN ne sont supportées que sous Linux")
+        import fcntl
+        fd = os.open("/dev/net/tun", os.O_RDWR)
+        try:
+            ifr = struct.pack("16sH", self.name.encode(), IFF_TUN | IFF_NO_PI)
+            ifr = fcntl.ioctl(fd, TUNSETIFF, ifr)
+        except OSError:
+            os.close(fd)
+            raise
+        # Le noyau peut attribuer un autre nom (ex: "tun%d")
+        self.name = ifr[:16].rstrip(b"\0").decode()
+        self.fd = fd
+
+    def configure(self, address, prefix_len=24):
+        """Attribue une adresse à l'interface et l'active (nécessite root)"""
+        subprocess.run(["ip", "addr", "add", f"{address}/{prefix_len}", "dev", self.name], check=True)
+        subprocess.run(["ip", "link", "set", "dev", self.name, "mtu", str(self.mtu), "up"], check=True)
+
+    def fileno(self):
+        return self.fd
+
+    def read_packet(self, timeout=1):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+        return os.read(self.fd, self.mtu + 64)
+
+    def write_packet(self, data):
+        os.write(self.fd, data)
+
+    def write_packets(self, packets):
+        for data in packets:
+            os.write(self.fd, data)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SocketPairPacketIO:
+    """Backend en mémoire pour les tests: le « réseau » est l'autre bout d'un socketpair.
+
+    Les paquets écrits dans `peer` sont lus par le tunnel comme s'ils avaient été
+    capturés, et les paquets injectés par le tunnel se lisent sur `peer`.
+    """
+
+    def __init__(self):
+        self.sock, self.peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+    def open(self):
+        pass
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_packet(self, timeout=1):
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return None
+        data = self.sock.recv(65535)
+        return data or None
+
+    def write_packet(self, data):
+        self.sock.send(data)
+
+    def write_packets(self, packets):
+        for data in packets:
+            self.sock.send(data)
+
+    def close(self):
+        self.sock.close()
+        self.peer.close()
+
+
+class NullPacketIO:
+    """Backend qui ignore les paquets écrits et n'en capture aucun (benchmarks)"""
+
+    def __init__(self):
+        self.packets_written = 0
+
+    def open(self):
+        pass
+
+    def read_packet(self, timeout=1):
+        time.sleep(timeout)
+        return None
+
+    def write_packet(self, data):
+        self.packets_written += 1
+
+    def write_packets(self, packets):
+        self.packets_written += len(packets)
+
+    def close(self):
+        pass
+
+
+def create_packet_io(kind="scapy", injector=None, **kwargs):
+    """Crée un backend d'entrée/sortie de paquets: 'scapy', 'tun', 'fake' ou 'null'"""
+    if kind == "scapy":
+        return ScapyPacketIO(injector=injector, **kwargs)
+    if kind == "tun":
+        return TunPacketIO(**kwargs)
+    if kind == "fake":
+        return SocketPairPacketIO(**kwargs)
+    if kind == "null":
+        return NullPacketIO(**kwargs)
+    raise ValueError(f"Backend de paquets inconnu: {kind}")
@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profilage à la demande des threads du tunnel:
+#   - échantillonnage périodique des piles (sys._current_frames), restitué en
+#     piles « repliées » lisibles par flamegraph.pl / speedscope;
+#   - temps CPU par étape du traitement des paquets (décodage, NAT, injection,
+#     chiffrement/envoi...), mesuré par lot avec l'horloge CPU du thread.
+# Désactivé, le coût sur le chemin des paquets se limite au test de
+# PROFILER.enabled.
+
+clock = time.thread_time  # Temps CPU du thread courant: l'attente sur les sockets n'est pas comptée
+
+MAX_DEPTH = 64
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_label(name):
+    """Nom du thread sans le suffixe propre à la session ("server_tunnel-alice" -> "server_tunnel")"""
+    return name.split('-', 1)[0] if name.startswith(('server_tunnel-', 'frame_writer-')) else name
+
+
+class StackSampler:
+    """Échantillonne les piles des threads à intervalle régulier"""
+
+    def __init__(self, rate=100, thread_prefixes=None):
+        self.interval = 1.0 / rate
+        self.thread_prefixes = tuple(thread_prefixes) if thread_prefixes else None
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self):
+        own = threading.get_ident()
+        names = {}
+        next_refresh = 0
+        while self.running:
+            frames = sys._current_frames()
+            now = time.monotonic()
+            if now >= next_refresh or not frames.keys() <= names.keys():
+                # Relire les noms à intervalle régulier ou dès qu'un nouveau thread apparaît
+                names = {t.ident: t.name for t in threading.enumerate()}
+                next_refresh = now + 1.0
+            self.sample(frames, names, own)
+            time.sleep(self.interval)
+
+    def sample(self, frames, names, own=None):
+        collected = []
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            name = names.get(ident, f"thread-{ident}")
+            if self.thread_prefixes and not name.startswith(self.thread_prefixes):
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(_thread_label(name))
+            collected.append(';'.join(reversed(stack)))
+        with self.lock:
+            self.stacks.update(collected)
+            self.samples += 1
+
+    def collapsed(self):
+        """Piles repliées: « thread;fonction;...;fonction nombre », une par ligne"""
+        with self.lock:
+            items = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+
+class Profiler:
+    """Profilage du processus: échantillonneur de piles et temps par étape"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sampler = None
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self, rate=100, thread_prefixes=None):
+        """Remet à zéro et démarre le profilage (`rate` échantillons de piles par seconde)"""
+        self.stop()
+        with self.lock:
+            self.stages = {}
+        self.sampler = StackSampler(rate, thread_prefixes)
+        self.sampler.start()
+        self.started_at = time.time()
+        self.stopped_at = None
+        self.enabled = True
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.stopped_at = time.time()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def add(self, stage, seconds, packets=1):
+        """Ajoute le temps CPU d'une étape pour un lot de `packets` paquets"""
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[1] += packets
+            entry[2] += seconds
+
+    def stage_report(self):
+        """Répartition du temps CPU par étape, de la plus coûteuse à la moins coûteuse"""
+        with self.lock:
+            stages = {name: list(entry) for name, entry in self.stages.items()}
+        total = sum(entry[2] for entry in stages.values()) or 1.0
+        report = []
+        for name, (calls, packets, seconds) in sorted(stages.items(), key=lambda item: -item[1][2]):
+            report.append({
+                'stage': name,
+                'calls': calls,
+                'packets': packets,
+                'cpu_seconds': round(seconds, 6),
+                'share': round(seconds / total, 4),
+                'us_per_packet': round(seconds / packets * 1e6, 3) if packets else None,
+            })
+        return report
+
+    def collapsed(self):
+        return self.sampler.collapsed() if self.sampler is not None else ''
+
+    def status(self):
+        end = self.stopped_at or time.time()
+        return {
+            'enabled': self.enabled,
+            'samples': self.sampler.samples if self.sampler is not None else 0,
+            'duration': round(end - self.started_at, 3) if self.started_at else 0,
+        }
+
+
+PROFILER = Profiler()
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+from .framing import PACKET_HEADER, MAX_PACKETS_PER_FRAME, encode_frame
+from .profiling import PROFILER, clock
+
+# Politiques quand la file d'une session est pleine
+DROP_TAIL = 'tail'      # Le nouveau paquet est abandonné
+DROP_OLDEST = 'oldest'  # Le plus ancien paquet en attente est abandonné (trafic UDP/temps réel)
+DROP_POLICIES = (DROP_TAIL, DROP_OLDEST)
+
+
+class SendQueue:
+    """File bornée des paquets à envoyer à un pair, alimentée sans jamais bloquer.
+
+    Le thread de capture ne fait que déposer les paquets; l'écriture sur le
+    socket (éventuellement lente) est faite par un écrivain dédié à la session.
+    """
+
+    def __init__(self, max_packets=4096, policy=DROP_TAIL, on_ready=None, drop_counter=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Politique de rejet inconnue: {policy} (attendu: {', '.join(DROP_POLICIES)})")
+        self.max_packets = max_packets
+        self.policy = policy
+        self.on_ready = on_ready  # Appelé quand la file passe de vide à non vide
+        self.drop_counter = drop_counter  # Métrique incrémentée à chaque paquet abandonné
+        self.packets = deque()
+        self.queued_bytes = 0  # Taille encodée des paquets en attente (en-têtes compris)
+        self.lingering = None  # (paquets, octets) attendus par un take() qui laisse le lot se remplir
+        self.cond = threading.Condition()
+        self.closed = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.packets)
+
+    def put(self, packet):
+        """Dépose un paquet; retourne False s'il a été abandonné (file pleine ou fermée)"""
+        with self.cond:
+            if self.closed:
+                return False
+            if len(self.packets) >= self.max_packets:
+                self.dropped += 1
+                if self.drop_counter is not None:
+                    self.drop_counter.inc()
+                if self.policy == DROP_TAIL:
+                    return False
+                self.queued_bytes -= PACKET_HEADER.size + len(self.packets.popleft())
+            was_empty = not self.packets
+            self.packets.append(packet)
+            self.queued_bytes += PACKET_HEADER.size + len(packet)
+            self.enqueued += 1
+            if len(self.packets) > self.max_depth:
+                self.max_depth = len(self.packets)
+            if was_empty:
+                self.cond.notify()
+            elif self.lingering is not None:
+                # Lot complet: réveiller l'écrivain sans attendre la fin de son délai
+                max_packets, max_bytes = self.lingering
+                if len(self.packets) >= max_packets or (max_bytes and self.queued_bytes >= max_bytes):
+                    self.lingering = None
+                    self.cond.notify()
+        if was_empty and self.on_ready is not None:
+            self.on_ready()
+        return True
+
+    def take(self, max_packets=MAX_PACKETS_PER_FRAME, max_bytes=None, timeout=None, linger=0):
+        """Retire un lot de paquets, en attendant qu'il y en ait au moins un.
+
+        Avec `linger`, attend encore jusqu'à ce délai que le lot se remplisse.
+        Retourne une liste vide si la file est fermée ou après `timeout`.
+        """
+        with self.cond:
+            if not self.packets and not self.closed:
+                self.cond.wait(timeout)
+            if linger and self.packets and not self.closed:
+                deadline = time.monotonic() + linger
+                while len(self.packets) < max_packets and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (max_bytes and self.queued_bytes >= max_bytes):
+                        break
+                    self.lingering = (max_packets, max_bytes)  # put() réveille dès que le lot est plein
+                    self.cond.wait(remaining)
+                self.lingering = None
+            batch = []
+            size = 0
+            while self.packets and len(batch) < max_packets:
+                length = PACKET_HEADER.size + len(self.packets[0])
+                if batch and max_bytes and size + length > max_bytes:
+                    break
+                batch.append(self.packets.popleft())
+                size += length
+            self.queued_bytes -= size
+            return batch
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        return {
+            'depth': len(self.packets),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+        }
+
+
+class FrameWriter:
+    """Écrivain dédié d'une session: vide sa SendQueue en trames envoyées par `sink`"""
+
+    def __init__(self, queue, sink, max_bytes=32 * 1024, linger=0.0, name='frame_writer'):
+        self.queue = queue
+        self.sink = sink  # Envoie une trame complète (sendall), lève une exception en cas d'échec
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.name = name
+        self.thread = None
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.errors = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Ferme la file et attend l'écrivain (les paquets restants sont encore envoyés)"""
+        self.queue.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            packets = self.queue.take(max_bytes=self.max_bytes, linger=self.linger)
+            if not packets:
+                if self.queue.closed:
+                    return
+                continue
+            try:
+                if PROFILER.enabled:
+                    t0 = clock()
+                    frame = encode_frame(packets)
+                    t1 = clock()
+                    self.sink(frame)
+                    PROFILER.add('encode', t1 - t0, len(packets))
+                    PROFILER.add('encrypt_send', clock() - t1, len(packets))
+                else:
+                    self.sink(encode_frame(packets))
+            except Exception:
+                # L'appelant compte les échecs et décide de la déconnexion dans le sink
+                self.errors += 1
+                continue
+            self.frames_sent += 1
+            self.packets_sent += len(packets)
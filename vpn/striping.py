@@ -0,0 +1,130 @@
+import os
+import threading
+import zlib
+
+# Plusieurs connexions TLS parallèles pour une même session logique: chaque
+# connexion a sa propre fenêtre de congestion TCP et son propre thread de
+# chiffrement. Les paquets sont répartis par flux (hachage du 5-tuple): tous
+# les paquets d'un flux empruntent la même connexion et restent dans l'ordre.
+#
+# Négociation sur le flux TLS (trames de contrôle):
+#   première connexion : client "streams=K"     -> hôte "streams=<jeton>" (vide: refus)
+#   connexions suivantes: client "join=<jeton>" -> hôte "join=ok" (vide: refus)
+
+MAX_STREAMS = 16
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+
+def flow_hash(packet):
+    """Hachage du 5-tuple d'un paquet IPv4 (adresses et protocole seuls hors TCP/UDP)"""
+    ihl = (packet[0] & 0x0F) * 4
+    proto = packet[9]
+    # Protocole puis adresses (la somme de contrôle, entre les deux, change à chaque paquet)
+    flow = zlib.crc32(packet[12:20], proto)
+    if (proto == PROTO_TCP or proto == PROTO_UDP) and len(packet) >= ihl + 4:
+        return zlib.crc32(packet[ihl:ihl + 4], flow)
+    return flow
+
+
+def pick(streams, packet):
+    """Connexion d'un paquet parmi `streams` (liste non vide)"""
+    if len(streams) == 1:
+        return streams[0]
+    return streams[flow_hash(packet) % len(streams)]
+
+
+def encode_request(count):
+    return f"streams={count}".encode()
+
+
+def encode_token(token):
+    return f"streams={token or ''}".encode()
+
+
+def encode_join(token):
+    return f"join={token}".encode()
+
+
+def encode_joined(accepted):
+    return b'join=ok' if accepted else b'join='
+
+
+def decode_message(payload):
+    """(clé, valeur) d'une trame de contrôle 'streams=' ou 'join='; None sinon"""
+    text = bytes(payload).decode('ascii', 'replace')
+    key, sep, value = text.partition('=')
+    if not sep or key not in ('streams', 'join'):
+        return None
+    return key, value
+
+
+class StreamGroup:
+    """Session logique de l'hôte regroupant les connexions parallèles d'un client.
+
+    C'est elle que connaît le suivi de connexions: l'état NAT survit à la
+    perte d'une connexion, et les retours d'un flux sont répartis par
+    hachage sur les connexions restantes.
+    """
+
+    def __init__(self, token, username, conntrack, max_streams):
+        self.token = token
+        self.username = username
+        self.conntrack = conntrack
+        self.max_streams = max_streams
+        self.streams = []
+        self.lock = threading.Lock()
+
+    def add(self, stream):
+        with self.lock:
+            if len(self.streams) >= self.max_streams:
+                return False
+            self.streams = self.streams + [stream]
+            return True
+
+    def remove(self, stream):
+        """Retire une connexion; retourne True si c'était la dernière"""
+        with self.lock:
+            self.streams = [s for s in self.streams if s is not stream]
+            return not self.streams
+
+    def send_to_peer(self, packet_data):
+        streams = self.streams  # Copie sur écriture: lecture sans verrou
+        if not streams:
+            return False
+        return pick(streams, packet_data).send_to_peer(packet_data)
+
+
+class StreamRegistry:
+    """Groupes de connexions de l'hôte, retrouvés par leur jeton"""
+
+    def __init__(self, conntrack, max_streams=MAX_STREAMS):
+        self.conntrack = conntrack
+        self.max_streams = max_streams
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def create(self, username, stream, count):
+        """Nouveau groupe autour de la première connexion; None si le multi-flux est désactivé"""
+        if self.max_streams < 2 or count < 2:
+            return None
+        group = StreamGroup(os.urandom(16).hex(), username, self.conntrack, min(count, self.max_streams))
+        group.add(stream)
+        with self.lock:
+            self.groups[group.token] = group
+        return group
+
+    def join(self, token, username, stream):
+        """Rattache une connexion à un groupe existant du même utilisateur"""
+        with self.lock:
+            group = self.groups.get(token)
+        if group is None or group.username != username or not group.add(stream):
+            return None
+        return group
+
+    def leave(self, group, stream):
+        """Retire une connexion; à la dernière, le groupe et ses flux NAT disparaissent"""
+        if group.remove(stream):
+            with self.lock:
+                self.groups.pop(group.token, None)
+            self.conntrack.remove_session(group)
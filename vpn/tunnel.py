@@ -2,23 +2,46 @@ import os
 import sys
 import threading
 import time
-from scapy.all import IP, TCP, UDP, ICMP, send, sniff, Raw, conf
+from scapy.all import conf
 import socket
 import ssl
 import errno
+import logging
+from .framing import FrameDecoder, FrameError, FRAME_HEADER, PACKET_HEADER, FLAG_CONTROL, encode_control, encode_frame, decode_frame
+from .compression import FrameCompressor, CODECS, offer, choose, encode_offer, decode_offer
+from . import datagram, striping
+from .sendqueue import SendQueue, FrameWriter, DROP_TAIL
+from .packet_io import ScapyPacketIO, TunPacketIO, client_capture_filter, route_source_address
+from .conntrack import ConnTrack
+from .nat import ReverseNatEngine, translate_outbound
+from .metrics import UserSeries, PACKET_SECONDS, FRAME_ERRORS
+from .profiling import PROFILER, clock
+
+logger = logging.getLogger(__name__)
+
+FILTER_CHECK_INTERVAL = 5.0  # Secondes entre deux vérifications du filtre de capture client
 
 # Configurer scapy pour utiliser L3 sockets (évite le besoin de Npcap sur Windows)
 if sys.platform == "win32":
     try:
         from scapy.all import L3RawSocket
         conf.L3socket = L3RawSocket
-        print("Scapy configuré pour utiliser L3 sockets (pas de Npcap requis)")
+        logger.info("Scapy configuré pour utiliser L3 sockets (pas de Npcap requis)")
     except ImportError:
-        print("L3RawSocket non disponible, Npcap recommandé pour Windows")
+        logger.warning("L3RawSocket non disponible, Npcap recommandé pour Windows")
 
 class VpnTunnel:
-    def __init__(self, vpn_socket, is_client=True, server_ip=None):
+    def __init__(self, vpn_socket, is_client=True, server_ip=None, batch_bytes=32 * 1024, batch_delay=0.002, packet_io=None,
+                 conntrack=None, queue_size=4096, drop_policy=DROP_TAIL, username=None,
+                 compression=None, adaptive_compression=True, datagram=False, datagram_server=None,
+                 streams=1, join_token=None, capture=True, stream_registry=None):
         self.vpn_socket = vpn_socket  # The SSL socket for VPN communication
+        self.username = username
+        try:
+            # Les paquets sont déjà regroupés en trames: Nagle n'ajouterait que de la latence
+            vpn_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError):
+            pass
         self.is_client = is_client
         self.running = False
         self.client_packets_sent = 0
@@ -28,195 +51,515 @@ class VpnTunnel:
         self.disconnected = False
         self.send_failures = 0
         self.server_ip = server_ip
-        self.nat_table = {}
+        # Suivi de connexions partagé par l'hôte (qui gère alors le chemin retour
+        # et le backend de paquets), ou propre au tunnel s'il est autonome. Côté
+        # client, pas de NAT: server_ip peut être un nom d'hôte
+        self.owns_packet_io = conntrack is None
+        if conntrack is None and not is_client:
+            conntrack = ConnTrack(server_ip)
+        self.conntrack = conntrack
+        self.reverse_engine = None
+        # File bornée des paquets sortants, vidée en trames par un écrivain dédié:
+        # un pair lent ne bloque jamais le thread de capture
+        user = username or ''
+        # Séries de métriques de la session (rx: reçu du pair, tx: envoyé au pair), libérées par stop_tunnel()
+        self.series = UserSeries(user)
+        self.send_queue = SendQueue(queue_size, drop_policy, drop_counter=self.series.queue_drops)
+        self.writer = FrameWriter(self.send_queue, self._send_frame, max_bytes=batch_bytes, linger=batch_delay,
+                                  name=f"frame_writer-{user}" if user else 'frame_writer')
+        self.decoder = FrameDecoder(vpn_socket)
+        # Compression des trames: côté client l'algorithme demandé ('auto', 'zlib', 'lz4'),
+        # côté hôte ceux qu'il accepte; None pour ne jamais compresser
+        self.compression_offer = offer(compression) if compression else []
+        self.adaptive_compression = adaptive_compression
+        self.compressor = None  # Trames sortantes, une fois la compression négociée
+        self.send_lock = threading.Lock()  # Trames de contrôle et écrivain sur le même socket
+        # Transport datagramme (UDP chiffré): demandé par le client, accordé par le DatagramServer de l'hôte
+        self.datagram_requested = datagram
+        self.datagram_server = datagram_server
+        self.datagram = None  # DatagramChannel une fois négocié; le flux TLS reste le canal de contrôle
+        self.datagram_thread = None
+        # Connexions parallèles: le client demande `streams` connexions (ou rejoint un
+        # groupe avec `join_token`); l'hôte les regroupe dans une session logique
+        self.streams_requested = streams
+        self.join_token = join_token
+        self.capture = capture  # False: connexion secondaire, la capture est faite par la principale
+        self.stream_registry = stream_registry
+        self.stream_group = None
+        self.stream_token = None
+        self.stream_joined = False
+        self.stream_reply = threading.Event()
+        self.stripes = None  # Client: connexions entre lesquelles répartir les flux
+        self.nat_session = self  # Propriétaire des flux NAT (le groupe si la connexion en fait partie)
+        self.cert_fingerprint = None  # Hôte: empreinte du certificat client (révocation des sessions ouvertes)
+        # Backend d'entrée/sortie des paquets IP (scapy par défaut, TUN ou faux backend)
+        self.packet_io = packet_io or ScapyPacketIO()
+        self.capture_available = False
+        self.rx_packets = self.series.rx_packets
+        self.rx_bytes = self.series.rx_bytes
+        self.tx_packets = self.series.tx_packets
+        self.tx_bytes = self.series.tx_bytes
+        self.outbound_latency = PACKET_SECONDS.labels('outbound')
+
+    def _send_frame(self, frame):
+        """Envoie une trame complète sur le socket VPN"""
+        try:
+            _, _, count, size = FRAME_HEADER.unpack_from(frame)
+            compressor = self.compressor
+            if compressor is not None:
+                if PROFILER.enabled:
+                    t0 = clock()
+                    frame = compressor.compress(frame)
+                    PROFILER.add('compress', clock() - t0, count)
+                else:
+                    frame = compressor.compress(frame)
+            channel = self.datagram
+            if channel is not None and channel.peer is not None:
+                try:
+                    channel.send_frame(frame)
+                except OSError:
+                    # Datagramme impossible (réseau, MTU): la trame passe par le flux TLS
+                    with self.send_lock:
+                        self.vpn_socket.sendall(frame)
+            else:
+                with self.send_lock:
+                    self.vpn_socket.sendall(frame)
+            self.send_failures = 0  # reset on success
+            self.tx_packets.inc(count)
+            self.tx_bytes.inc(size - count * PACKET_HEADER.size)
+        except Exception:
+            self.send_failures += 1
+            if self.send_failures > 10:
+                logger.warning("Déconnexion de l'hôte VPN détectée (échecs d'envoi répétés)")
+                self.disconnected = True
+                self.running = False
+                self.send_queue.close()
+            raise
+
+    def _send_control(self, message):
+        with self.send_lock:
+            self.vpn_socket.sendall(encode_control(message))
+
+    def request_compression(self):
+        """Client: propose à l'hôte les algorithmes de compression acceptés"""
+        if not self.compression_offer:
+            return
+        try:
+            self._send_control(encode_offer(self.compression_offer))
+        except OSError as e:
+            logger.warning("Négociation de la compression impossible: %s", e)
+
+    def request_datagram(self):
+        """Client: demande à l'hôte le transport datagramme"""
+        if not self.datagram_requested:
+            return
+        try:
+            self._send_control(datagram.encode_request(list(datagram.CIPHERS)))
+        except OSError as e:
+            logger.warning("Négociation du transport datagramme impossible: %s", e)
+
+    def request_streams(self):
+        """Client: demande un groupe de connexions parallèles, ou rejoint celui de la connexion principale"""
+        try:
+            if self.join_token:
+                self._send_control(striping.encode_join(self.join_token))
+            elif self.streams_requested > 1:
+                self._send_control(striping.encode_request(self.streams_requested))
+        except OSError as e:
+            logger.warning("Négociation des connexions parallèles impossible: %s", e)
+            self.stream_reply.set()
+
+    def negotiate_streams(self, key, value):
+        if self.is_client:
+            if key == 'streams':
+                self.stream_token = value or None
+            else:
+                self.stream_joined = value == 'ok'
+            self.stream_reply.set()
+            return
+        registry = self.stream_registry
+        if key == 'streams':
+            group = None
+            if registry is not None and value.isdigit():
+                group = registry.create(self.username, self, int(value))
+            self._join_group(group)
+            self._send_control(striping.encode_token(group.token if group else None))
+        else:
+            group = registry.join(value, self.username, self) if registry is not None else None
+            self._join_group(group)
+            self._send_control(striping.encode_joined(group is not None))
+
+    def _join_group(self, group):
+        if group is not None:
+            # Avant toute trame de paquets: les flux NAT appartiennent au groupe
+            self.stream_group = group
+            self.nat_session = group
+            logger.info("Connexion %d/%d de %s", len(group.streams), group.max_streams, self.username)
+
+    def handle_control(self, message):
+        """Traite une trame de contrôle reçue du pair (compression, transport datagramme, connexions parallèles)"""
+        codecs = decode_offer(message)
+        if codecs is not None:
+            self.negotiate_compression(codecs)
+            return
+        fields = datagram.decode_message(message)
+        if fields is not None:
+            self.negotiate_datagram(fields)
+            return
+        stream_message = striping.decode_message(message)
+        if stream_message is not None:
+            self.negotiate_streams(*stream_message)
+            return
+        logger.warning("Message de contrôle inconnu ignoré")
+
+    def negotiate_compression(self, codecs):
+        if self.is_client:
+            # Réponse de l'hôte: l'algorithme retenu, ou une liste vide en cas de refus
+            if codecs and codecs[0] in CODECS:
+                self.decoder.compressor = FrameCompressor(codecs[0])
+                self.compressor = FrameCompressor(codecs[0], self.adaptive_compression)
+                logger.info("Compression des trames: %s", codecs[0])
+            else:
+                logger.info("Compression refusée par l'hôte")
+            return
+        codec = choose(codecs, self.compression_offer)
+        if codec is not None:
+            # Le client peut compresser dès qu'il a reçu la réponse
+            self.decoder.compressor = FrameCompressor(codec)
+        self._send_control(encode_offer([codec] if codec else []))
+        if codec is not None:
+            # Après la réponse: aucune trame compressée ne doit la précéder
+            self.compressor = FrameCompressor(codec, self.adaptive_compression)
+            logger.info("Compression des trames pour %s: %s", self.username, codec)
+
+    def negotiate_datagram(self, fields):
+        if self.is_client:
+            grant = datagram.decode_grant(fields)
+            if grant is None:
+                logger.info("Transport datagramme refusé par l'hôte, le flux TLS est conservé")
+                return
+            port, session_id, cipher, secret = grant
+            peer = (self.vpn_socket.getpeername()[0], port)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(peer)
+            sock.settimeout(1)
+            channel = datagram.DatagramChannel(session_id, secret, cipher, is_client=True, sock=sock, peer=peer)
+            channel.session = self
+            self.datagram_thread = threading.Thread(
+                target=datagram.receive_loop, name='datagram_receive',
+                args=(sock, lambda sid: channel if sid == session_id else None, lambda: self.running), daemon=True)
+            self.datagram_thread.start()
+            # Un premier datagramme vide fait connaître notre adresse à l'hôte
+            channel.send_frame(encode_frame([]))
+            self.writer.max_bytes = datagram.DATAGRAM_FRAME_BYTES
+            self.datagram = channel
+            logger.info("Transport datagramme actif vers %s:%d (%s)", peer[0], port, cipher)
+            return
+        server = self.datagram_server
+        if server is None or server.cipher not in fields:
+            self._send_control(datagram.encode_refusal())
+            return
+        channel, grant = server.register(self)
+        self.writer.max_bytes = datagram.DATAGRAM_FRAME_BYTES
+        # Les trames partent en datagrammes dès que le client s'est manifesté (channel.peer)
+        self.datagram = channel
+        self._send_control(grant)
+        logger.info("Transport datagramme pour %s (session %d)", self.username, channel.session_id)
+
+    def datagram_received(self, frame):
+        """Trame déchiffrée reçue par le transport datagramme"""
+        flags, packets = decode_frame(frame, self.decoder.compressor)
+        if flags & FLAG_CONTROL:
+            return  # Le contrôle ne passe que par le flux TLS authentifié
+        if self.is_client:
+            self.deliver_packets(packets)
+        else:
+            self.forward_packets(packets)
+
+    def datagram_stats(self):
+        return self.datagram.stats() if self.datagram is not None else None
+
+    def compression_stats(self):
+        """Octets économisés et CPU de compression de la session, ou None sans compression"""
+        if self.compressor is None:
+            return None
+        stats = self.compressor.stats()
+        stats['cpu_seconds'] = round(self.compressor.cpu_seconds + self.decoder.compressor.cpu_seconds, 6)
+        return stats
 
     def client_receive(self):
         """Reçoit les paquets du serveur et les injecte localement"""
         while self.running:
             try:
-                packet_data = self.vpn_socket.recv(65535)
-                if not packet_data:
+                profiling = PROFILER.enabled
+                if profiling:
+                    t0 = clock()
+                frame = self.decoder.read_frame()
+                if frame is None:
                     break
-                pkt = IP(packet_data)
-                print(f"Client received: {pkt[IP].src} -> {pkt[IP].dst}")
-                self.client_packets_received += 1
-                if self.client_packets_received % 10 == 0:  # Plus fréquent pour debug
-                    print(f"Client: {self.client_packets_received} paquets reçus")
-                # Injecter le paquet réponse dans le réseau local
-                send(pkt, verbose=0)
+                if frame[0] & FLAG_CONTROL:
+                    self.handle_control(frame[1][0])
+                    continue
+                if profiling:
+                    PROFILER.add('decode', clock() - t0, len(frame[1]))
+                self.deliver_packets(frame[1])
             except Exception as e:
-                print(f"Erreur réception client: {e}")
+                if self.running:
+                    logger.error("Erreur réception client: %s", e)
                 break
-        """Sniffer pour les réponses et les envoyer au client via NAT inverse"""
-        while self.running:
-            try:
-                pkts = sniff(count=1, timeout=1, filter=f"ip dst {self.server_ip}")
-                if pkts:
-                    pkt = pkts[0]
-                    if IP in pkt:
-                        # Vérifier si c'est une réponse à NAT
-                        key = None
-                        if TCP in pkt:
-                            key = (self.server_ip, pkt[TCP].sport)
-                        elif UDP in pkt:
-                            key = (self.server_ip, pkt[UDP].sport)
-                        
-                        if key and key in self.nat_table:
-                            print(f"Reverse NAT: Paquet reçu de {pkt[IP].src}, envoyé au client {self.nat_table[key][0]}")
-                            # Traduire l'adresse de destination
-                            pkt[IP].dst = self.nat_table[key][0]
-                            if TCP in pkt:
-                                pkt[TCP].dport = self.nat_table[key][1]
-                            elif UDP in pkt:
-                                pkt[UDP].dport = self.nat_table[key][1]
-                            
-                            # Envoyer au client
-                            packet_data = bytes(pkt)
-                            self.vpn_socket.send(packet_data)
-            except Exception as e:
-                if not (hasattr(e, 'errno') and e.errno == errno.EMSGSIZE):
-                    print(f"Erreur reverse NAT: {e}")
-    def reverse_nat(self):
-        """Sniffer pour les réponses et les envoyer au client via NAT inverse"""
-        while self.running:
-            try:
-                pkts = sniff(count=1, timeout=1, filter="ip")
-                if pkts:
-                    pkt = pkts[0]
-                    if IP in pkt and pkt[IP].dst == self.server_ip:
-                        # Vérifier si c'est une réponse à NAT
-                        key = None
-                        if TCP in pkt:
-                            key = (self.server_ip, pkt[TCP].sport)
-                        elif UDP in pkt:
-                            key = (self.server_ip, pkt[UDP].sport)
-                        
-                        if key and key in self.nat_table:
-                            print(f"Reverse NAT: Paquet reçu de {pkt[IP].src}, envoyé au client {self.nat_table[key][0]}")
-                            # Traduire l'adresse de destination
-                            pkt[IP].dst = self.nat_table[key][0]
-                            if TCP in pkt:
-                                pkt[TCP].dport = self.nat_table[key][1]
-                            elif UDP in pkt:
-                                pkt[UDP].dport = self.nat_table[key][1]
-                            
-                            # Envoyer au client
-                            packet_data = bytes(pkt)
-                            self.vpn_socket.send(packet_data)
-            except Exception as e:
-                if not (hasattr(e, 'errno') and e.errno == errno.EMSGSIZE):
-                    print(f"Erreur reverse NAT: {e}")
+        self.running = False
+
+    def deliver_packets(self, received):
+        """Client: injecte localement les paquets d'une trame reçue de l'hôte (flux TLS ou datagramme)"""
+        profiling = PROFILER.enabled
+        if profiling:
+            t1 = clock()
+        packets = [bytes(packet_data) for packet_data in received]
+        self._count_received(packets)
+        # Rien n'est formaté par paquet hors du niveau debug
+        if logger.isEnabledFor(logging.DEBUG):
+            for packet_data in packets:
+                logger.debug("Client received: %s -> %s",
+                             socket.inet_ntoa(packet_data[12:16]), socket.inet_ntoa(packet_data[16:20]))
+        before = self.client_packets_received
+        self.client_packets_received += len(packets)
+        if self.client_packets_received // 1000 != before // 1000:
+            logger.info("Client: %d paquets reçus", self.client_packets_received)
+        # Injecter les paquets réponse dans le réseau local, en un seul lot
+        self.packet_io.write_packets(packets)
+        if profiling:
+            PROFILER.add('inject', clock() - t1, len(packets))
+
+    def _count_received(self, packets):
+        self.rx_packets.inc(len(packets))
+        self.rx_bytes.inc(sum(len(packet_data) for packet_data in packets))
+
+    def send_to_peer(self, packet_data):
+        """Remet un paquet (déjà traduit) à envoyer à l'autre bout du tunnel, sans bloquer"""
+        stripes = self.stripes
+        if stripes is not None:
+            # Même flux, même connexion: l'ordre des paquets d'un flux est conservé
+            tunnel = striping.pick(stripes, packet_data)
+            if tunnel.running:
+                return tunnel.send_queue.put(packet_data)
+        return self.send_queue.put(packet_data)
+
+    def queue_stats(self):
+        """Profondeur et rejets de la file d'envoi de la session"""
+        stats = self.send_queue.stats()
+        stats['frames_sent'] = self.writer.frames_sent
+        stats['send_errors'] = self.writer.errors
+        return stats
+
+    def client_capture_filter(self):
+        """Filtre de capture du client pour la route et le serveur actuels"""
+        server_ip, server_port = self.vpn_socket.getpeername()[:2]
+        return client_capture_filter(server_ip, server_port, route_source_address(server_ip))
+
+    def refresh_capture_filter(self):
+        """Reconstruit le filtre BPF du client si la route ou le serveur ont changé"""
+        if not self.is_client or not hasattr(self.packet_io, 'set_capture_filter'):
+            return False
+        try:
+            capture_filter = self.client_capture_filter()
+        except OSError:
+            return False
+        if not self.packet_io.set_capture_filter(capture_filter):
+            return False
+        logger.info("Filtre de capture: %s", capture_filter)
+        return True
+
+    def open_packet_io(self):
+        """Ouvre le backend de paquets; retourne False si la capture est impossible"""
+        try:
+            self.packet_io.open()
+            return True
+        except PermissionError:
+            logger.error("Droits administrateur requis pour intercepter les paquets")
+        except Exception as e:
+            logger.warning("Capture de paquets non disponible: %s", e)
+            logger.warning("Le tunneling réseau complet nécessite Npcap sur Windows")
+        return False
+
     def start_tunnel(self):
         """Démarre le tunneling"""
         self.running = True
         if self.is_client:
-            # Client: intercepter les paquets sortants et les envoyer via VPN
-            self.client_send_thread = threading.Thread(target=self.client_tunnel)
-            self.client_send_thread.start()
+            # Avant tout paquet: l'hôte répond dans le flux, avant ses trames compressées
+            self.request_compression()
+            self.request_datagram()
+            self.request_streams()
+        if self.capture:
+            # Le filtre doit être en place avant l'ouverture du socket de capture
+            self.refresh_capture_filter()
+            self.capture_available = self.open_packet_io()
+        self.writer.start()
+        if self.is_client:
+            if self.capture:
+                # Client: intercepter les paquets sortants et les envoyer via VPN
+                self.client_send_thread = threading.Thread(target=self.client_tunnel, name='client_tunnel')
+                self.client_send_thread.start()
             # Recevoir les paquets entrants du VPN
-            self.client_receive_thread = threading.Thread(target=self.client_receive)
+            self.client_receive_thread = threading.Thread(target=self.client_receive, name='client_receive')
             self.client_receive_thread.start()
         else:
             # Serveur: recevoir les paquets et les forwarder
-            # Démarrer le thread reverse NAT
-            self.reverse_thread = threading.Thread(target=self.reverse_nat)
-            self.reverse_thread.start()
+            if self.owns_packet_io and self.capture_available:
+                # Tunnel autonome: démarrer son propre chemin retour
+                self.reverse_engine = ReverseNatEngine(self.packet_io, self.conntrack)
+                self.reverse_engine.start()
             self.server_tunnel()
 
+    def disconnect(self):
+        """Coupe la connexion depuis un autre thread: la boucle de réception se termine"""
+        try:
+            self.vpn_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
     def stop_tunnel(self):
         self.running = False
+        # Laisser l'écrivain vider la file, sans attendre indéfiniment un pair bloqué
+        self.writer.stop(timeout=1)
+        try:
+            # Débloquer les threads en attente sur recv()
+            self.vpn_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self.datagram is not None:
+            if self.is_client:
+                self.datagram.sock.close()
+            else:
+                self.datagram_server.unregister(self.datagram)
+        if self.stream_group is not None:
+            self.stream_registry.leave(self.stream_group, self)
+        elif not self.is_client:
+            self.conntrack.remove_session(self)
+        self.series.release()
+        if self.owns_packet_io and self.capture:
+            if self.reverse_engine is not None:
+                self.reverse_engine.stop()
+            self.packet_io.close()
 
     def client_tunnel(self):
         """Tunneling côté client: intercepter et envoyer les paquets"""
-        print("Tentative de tunneling réseau...")
+        logger.info("Tentative de tunneling réseau...")
         
-        # Vérifier si on peut faire du sniffing
-        try:
-            # Tester si sniff fonctionne
-            test_sniff = sniff(count=1, timeout=1, filter="ip")
-            can_sniff = True
-        except Exception as e:
-            print(f"Sniffing non disponible: {e}")
-            print("Le tunneling réseau complet nécessite Npcap sur Windows")
-            can_sniff = False
-        
-        if not can_sniff:
-            print("Mode dégradé: Seule la connexion SSL VPN est active")
-            print("Pour le tunneling complet, installez Npcap depuis https://npcap.com/")
+        if not self.capture_available:
+            logger.warning("Mode dégradé: Seule la connexion SSL VPN est active")
+            logger.warning("Pour le tunneling complet, installez Npcap depuis https://npcap.com/")
             # Garder le thread actif pour maintenir la connexion SSL
             while self.running:
                 time.sleep(1)
             return
 
-        def packet_handler(pkt):
-            if self.running and IP in pkt:
-                # Sérialiser le paquet
-                packet_data = bytes(pkt)
-                try:
-                    # Envoyer via le VPN
-                    self.vpn_socket.send(packet_data)
-                    self.client_packets_sent += 1
-                    if self.client_packets_sent % 100 == 0:
-                        print(f"Client: {self.client_packets_sent} paquets envoyés")
-                    self.send_failures = 0  # reset on success
-                except:
-                    self.send_failures += 1
-                    if self.send_failures > 10:
-                        print("Déconnexion de l'hôte VPN détectée (échecs d'envoi répétés)")
-                        self.disconnected = True
-                        self.running = False
-
-        # Intercepter tous les paquets IP (nécessite root/admin)
-        try:
-            sniff(prn=packet_handler, filter="ip", store=0)
-        except PermissionError:
-            print("Erreur: Droits administrateur requis pour intercepter les paquets")
-        except Exception as e:
-            print(f"Erreur de tunneling client: {e}")
+        def packet_handler(packet_data):
+            # Déposer le paquet dans la file d'envoi (écrit par l'écrivain de la session)
+            if self.send_to_peer(packet_data):
+                self.client_packets_sent += 1
+                if self.client_packets_sent % 1000 == 0:
+                    logger.info("Client: %d paquets envoyés", self.client_packets_sent)
+
+        # Intercepter les paquets IP à tunneler (nécessite root/admin); le filtre
+        # BPF écarte dans le noyau le trafic du tunnel lui-même
+        next_filter_check = time.monotonic() + FILTER_CHECK_INTERVAL
+        while self.running:
+            if time.monotonic() >= next_filter_check:
+                self.refresh_capture_filter()
+                next_filter_check = time.monotonic() + FILTER_CHECK_INTERVAL
+            try:
+                profiling = PROFILER.enabled
+                if profiling:
+                    t0 = clock()
+                packet_data = self.packet_io.read_packet(timeout=1)
+            except Exception as e:
+                if self.running:
+                    logger.error("Erreur de tunneling client: %s", e)
+                break
+            if packet_data is not None:
+                if profiling:
+                    t1 = clock()
+                    PROFILER.add('capture', t1 - t0)
+                packet_handler(packet_data)
+                if profiling:
+                    PROFILER.add('enqueue', clock() - t1)
 
     def server_tunnel(self):
         """Tunneling côté serveur: recevoir et forwarder les paquets"""
         while self.running:
             try:
-                # Recevoir un paquet via VPN
-                packet_data = self.vpn_socket.recv(65535)
-                if not packet_data:
+                # Recevoir une trame de paquets via VPN
+                profiling = PROFILER.enabled
+                if profiling:
+                    t0 = clock()
+                frame = self.decoder.read_frame()
+                if frame is None:
                     break
-                
-                self.server_packets_received += 1
-                
-                # Désérialiser le paquet
-                pkt = IP(packet_data)
-                
-                # Vérifier la taille du paquet (éviter les erreurs "Message too long")
-                if len(pkt) > 65535:  # Taille max IP
-                    print(f"Paquet trop grand ({len(pkt)} bytes), ignoré")
+                if frame[0] & FLAG_CONTROL:
+                    self.handle_control(frame[1][0])
                     continue
-                
-                # NAT: Changer l'IP source pour celle du serveur
-                if IP in pkt:
-                    original_src = pkt[IP].src
-                    pkt[IP].src = self.server_ip
-                    
-                    # Enregistrer le mapping pour les réponses (TCP/UDP)
-                    if TCP in pkt:
-                        key = (self.server_ip, pkt[TCP].dport)
-                        self.nat_table[key] = (original_src, pkt[TCP].dport)
-                    elif UDP in pkt:
-                        key = (self.server_ip, pkt[UDP].dport)
-                        self.nat_table[key] = (original_src, pkt[UDP].dport)
-                
-                # Forwarder le paquet
-                send(pkt, verbose=0)
-                self.server_packets_sent += 1
-                
+            except FrameError as e:
+                # Flux désynchronisé ou coupé en pleine trame: impossible de continuer sur cette connexion
+                FRAME_ERRORS.inc()
+                logger.warning("Trame invalide, fermeture du tunnel: %s", e)
+                break
             except Exception as e:
-                if hasattr(e, 'errno') and e.errno == errno.EMSGSIZE:
-                    # Paquet trop grand pour l'interface, ignorer silencieusement
-                    continue
-                print(f"Erreur de tunneling serveur: {e}")
+                logger.error("Erreur de tunneling serveur: %s", e)
+                break
+
+            if profiling:
+                PROFILER.add('decode', clock() - t0, len(frame[1]))
+            self.forward_packets(frame[1])
+        self.running = False
+
+    def forward_packets(self, received):
+        """Serveur: NAT et injection des paquets d'une trame reçue du client (flux TLS ou datagramme)"""
+        start = time.perf_counter()
+        profiling = PROFILER.enabled
+        if profiling:
+            t1 = clock()
+        self._count_received(received)
+        packets = []
+        for packet_data in received:
+            try:
+                packet_data = self.forward_packet(packet_data)
+                if packet_data is not None:
+                    packets.append(packet_data)
+            except Exception as e:
+                logger.error("Erreur de tunneling serveur: %s", e)
                 continue  # Continuer au lieu d'arrêter le tunnel
 
+        if profiling:
+            t2 = clock()
+            PROFILER.add('nat_outbound', t2 - t1, len(received))
+
+        # Forwarder les paquets de la trame en un seul lot
+        try:
+            self.packet_io.write_packets(packets)
+            if profiling:
+                PROFILER.add('inject', clock() - t2, len(packets))
+            self.server_packets_sent += len(packets)
+            if received:
+                # Une observation par trame, pondérée par son nombre de paquets
+                self.outbound_latency.observe((time.perf_counter() - start) / len(received), len(received))
+        except Exception as e:
+            if hasattr(e, 'errno') and e.errno == errno.EMSGSIZE:
+                # Paquet trop grand pour l'interface, ignorer silencieusement
+                return
+            logger.error("Erreur de tunneling serveur: %s", e)
+
+    def forward_packet(self, packet_data):
+        """NAT d'un paquet reçu du client; retourne les octets à forwarder ou None"""
+        self.server_packets_received += 1
+
+        # Vérifier la taille du paquet (éviter les erreurs "Message too long")
+        if len(packet_data) > 65535:  # Taille max IP
+            logger.warning("Paquet trop grand (%d bytes), ignoré", len(packet_data))
+            return None
+
+        # NAT source via la table de suivi de connexions
+        return translate_outbound(self.conntrack, self.nat_session, packet_data)
+
 # Fonction pour configurer le routage (nécessite admin)
 def setup_routing(tun_interface, vpn_gateway):
     """Configure le routage pour envoyer tout le trafic via le VPN"""
@@ -227,9 +570,11 @@ def setup_routing(tun_interface, vpn_gateway):
         # Linux/Mac
         os.system(f"ip route add default via {vpn_gateway} dev {tun_interface}")
 
-def create_tun_interface():
-    """Crée une interface TUN/TAP (simplifié, nécessite des bibliothèques spécifiques)"""
-    # Note: Créer une vraie interface TUN nécessite des droits et des libs comme python-tuntap
-    # Pour cette démo, on simule
-    print("Interface TUN simulée créée (remplacer par une vraie implémentation)")
-    return "tun0"
\ No newline at end of file
+def create_tun_interface(name="tun0", address=None, prefix_len=24):
+    """Crée et ouvre une interface TUN Linux (nécessite root), utilisable comme backend de paquets"""
+    tun = TunPacketIO(name)
+    tun.open()
+    if address:
+        tun.configure(address, prefix_len)
+    logger.info("Interface TUN %s créée", tun.name)
+    return tun
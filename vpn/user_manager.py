@@ -1,32 +1,277 @@
 import json
+import logging
 import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou entre processus
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Stockage des utilisateurs: un instantané (users.json, toujours lisible tel
+# quel) et un journal à la suite (users.json.journal), une ligne JSON par
+# modification. Ajouter ou supprimer un utilisateur n'écrit qu'une ligne;
+# le journal est replié dans l'instantané (écrit à côté puis renommé) quand
+# il devient aussi long que la base. Rejouer le journal sur l'instantané est
+# idempotent: un arrêt brutal entre les deux étapes ne perd rien.
+#
+# Chaque instance (hôte, interface d'administration, client) relit les lignes
+# ajoutées par les autres: les changements sont vus sans redémarrage et
+# signalés aux abonnés (subscribe).
+
+COMPACT_MIN_ENTRIES = 1000  # En dessous, le journal n'est jamais replié
+REFRESH_INTERVAL = 1.0  # Fréquence max. de vérification des fichiers par get_user
+
 
 class UserManager:
-    def __init__(self, users_file='users.json'):
+    def __init__(self, users_file='users.json', refresh_interval=REFRESH_INTERVAL):
         self.users_file = users_file
+        self.journal_file = users_file + '.journal'
+        self.lock_file = users_file + '.lock'
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.users = {}
+        self.journal_entries = 0
         self.load_users()
 
     def load_users(self):
-        if os.path.exists(self.users_file):
-            with open(self.users_file, 'r') as f:
-                self.users = json.load(f)
-        else:
-            self.users = {}
+        """Relit instantané et journal en entier"""
+        with self.lock:
+            users = {}
+            if os.path.exists(self.users_file):
+                with open(self.users_file, 'r') as f:
+                    users = json.load(f)
+            self.snapshot_stat = self._stat(self.users_file)
+            self.journal_offset = 0
+            self.journal_entries = 0
+            self.journal_inode = None
+            previous, self.users = self.users, users
+            self._read_journal()
+            self.last_refresh = time.monotonic()
+            for username in previous.keys() - self.users.keys():
+                self._notify('delete', username, None)
+            for username, info in self.users.items():
+                if previous.get(username) != info:
+                    self._notify('add', username, info)
+
+    def refresh(self):
+        """Applique les changements écrits par d'autres instances depuis la dernière lecture"""
+        with self.lock:
+            self.last_refresh = time.monotonic()
+            journal = self._stat(self.journal_file)
+            if self._stat(self.users_file) != self.snapshot_stat or (
+                    journal is not None and self.journal_inode is not None
+                    and (journal[0] != self.journal_inode or journal[1] < self.journal_offset)):
+                # Instantané réécrit ou journal replié: tout relire
+                self.load_users()
+            elif journal is not None and journal[1] > self.journal_offset:
+                self._read_journal()
+
+    def refresh_if_due(self):
+        """Relit les fichiers si la dernière vérification date de plus de refresh_interval"""
+        if time.monotonic() - self.last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _read_journal(self):
+        """Rejoue les lignes complètes du journal à partir de la dernière position lue"""
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            self.journal_inode = os.fstat(f.fileno()).st_ino
+            f.seek(self.journal_offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # Une ligne incomplète (écriture en cours) sera relue plus tard
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                self._apply(entry['op'], entry['username'], entry.get('info'))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Ligne invalide ignorée dans %s", self.journal_file)
+            self.journal_entries += 1
+        self.journal_offset += end
+
+    def _apply(self, op, username, info):
+        if op == 'add':
+            if self.users.get(username) != info:
+                self.users[username] = info
+                self._notify(op, username, info)
+        elif op == 'delete':
+            if self.users.pop(username, None) is not None:
+                self._notify(op, username, None)
+
+    def _append(self, op, username, info=None):
+        with self.lock, self._file_lock():
+            # D'abord les lignes des autres instances, pour que notre position reste juste
+            self.refresh()
+            self._write_entry(op, username, info)
+
+    def _write_entry(self, op, username, info):
+        """Écrit une ligne au journal et l'applique (verrous déjà pris, base à jour)"""
+        self._write_lines(json.dumps({'op': op, 'username': username, 'info': info}, separators=(',', ':')) + '\n')
+
+    def _write_lines(self, lines):
+        data = lines.encode()
+        fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._read_journal()
+        # Premier enregistrement: users.json existe toujours pour les outils qui le lisent directement
+        if self.snapshot_stat is None or self.journal_entries >= max(COMPACT_MIN_ENTRIES, len(self.users)):
+            self._compact()
+
+    def _file_lock(self):
+        return _FileLock(self.lock_file)
+
+    def _compact(self):
+        """Replie le journal dans un nouvel instantané (verrou de fichier déjà pris)"""
+        tmp_file = f"{self.users_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.users, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.users_file)
+        with open(self.journal_file, 'r+b') as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+        self.snapshot_stat = self._stat(self.users_file)
+        self.journal_inode = self._stat(self.journal_file)[0]
+        self.journal_offset = 0
+        self.journal_entries = 0
 
     def save_users(self):
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=4)
+        """Écrit la base complète dans l'instantané et vide le journal"""
+        with self.lock, self._file_lock():
+            self.refresh()
+            if not os.path.exists(self.journal_file):
+                open(self.journal_file, 'ab').close()
+            self._compact()
 
-    def add_user(self, username, folder, cert_file, key_file):
-        self.users[username] = {
+    def add_user(self, username, folder, cert_file, key_file, fingerprint=None):
+        info = {
             'folder': folder,
             'cert_file': cert_file,
             'key_file': key_file
         }
-        self.save_users()
+        if fingerprint:
+            info['fingerprint'] = fingerprint  # Empreinte SHA-256 du certificat délivré
+        self._append('add', username, info)
+
+    def add_users(self, users):
+        """Enregistre d'un coup {utilisateur: fiche}: une seule écriture du journal, un seul fsync"""
+        if not users:
+            return
+        lines = ''.join(json.dumps({'op': 'add', 'username': username, 'info': info}, separators=(',', ':')) + '\n'
+                        for username, info in users.items())
+        with self.lock, self._file_lock():
+            self.refresh()
+            self._write_lines(lines)
+
+    def add_new_user(self, username, info, before_write=None):
+        """Ajoute un utilisateur s'il n'existe pas, vérification et écriture sous les mêmes verrous.
+
+        `before_write()` est appelé sous les verrous juste avant l'écriture. Retourne False si l'utilisateur existait.
+        """
+        with self.lock, self._file_lock():
+            self.refresh()
+            if username in self.users:
+                return False
+            if before_write is not None:
+                before_write()
+            self._write_entry('add', username, info)
+            return True
+
+    def update_user(self, username, **fields):
+        """Modifie des champs d'un utilisateur existant; retourne False s'il n'existe pas"""
+        with self.lock, self._file_lock():
+            self.refresh()
+            info = self.users.get(username)
+            if info is None:
+                return False
+            self._write_entry('add', username, {**info, **fields})
+            return True
+
+    def revoke_certificate(self, username, fingerprint):
+        """Ajoute une empreinte à la liste des certificats révoqués de l'utilisateur"""
+        with self.lock, self._file_lock():
+            self.refresh()
+            info = self.users.get(username)
+            if info is None:
+                return False
+            revoked = info.get('revoked', [])
+            if fingerprint not in revoked:
+                self._write_entry('add', username, {**info, 'revoked': revoked + [fingerprint]})
+            return True
+
+    def remove_user(self, username):
+        """Supprime un utilisateur; retourne False s'il n'existait pas"""
+        with self.lock:
+            if self.get_user(username) is None:
+                return False
+            self._append('delete', username)
+            return True
 
     def get_user(self, username):
+        self.refresh_if_due()
         return self.users.get(username)
 
     def list_users(self):
-        return list(self.users.keys())
\ No newline at end of file
+        self.refresh_if_due()
+        return list(self.users.keys())
+
+    def subscribe(self, callback):
+        """Appelle callback(op, username, info) à chaque ajout ('add') ou suppression ('delete') vu"""
+        self.listeners.append(callback)
+
+    def _notify(self, op, username, info):
+        for callback in self.listeners:
+            try:
+                callback(op, username, info)
+            except Exception as e:
+                logger.error("Erreur dans un abonné aux changements d'utilisateurs: %s", e)
+
+    def watch(self, interval=REFRESH_INTERVAL, running=lambda: True):
+        """Boucle de surveillance des fichiers (thread dédié) pour notifier sans attendre un get_user"""
+        while running():
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except (OSError, ValueError) as e:
+                logger.warning("Relecture de %s impossible: %s", self.users_file, e)
+
+
+class _FileLock:
+    """Verrou exclusif entre processus sur un fichier annexe (sans effet sous Windows)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,129 @@
+import logging
+import multiprocessing
+import time
+from .log import setup_logging
+
+# Mode multi-processus: N workers indépendants écoutent sur le même port
+# (SO_REUSEPORT, le noyau répartit les connexions entrantes). Chaque worker a
+# son propre interpréteur, sa table NAT et sa capture de retour, limitée par
+# filtre BPF à sa tranche de ports NAT: aucun état n'est partagé entre eux.
+
+logger = logging.getLogger(__name__)
+
+
+def worker_port_range(index, count, port_range=(20000, 60000)):
+    """Tranche de ports NAT réservée au worker `index` parmi `count`"""
+    low, high = port_range
+    span = (high - low + 1) // count
+    if span < 1:
+        raise ValueError(f"Plage de ports NAT trop petite pour {count} workers")
+    start = low + index * span
+    end = high if index == count - 1 else start + span - 1
+    return start, end
+
+
+def run_worker(index, count, use_asyncio, port_range, host_kwargs, log_level=None):
+    """Point d'entrée d'un processus worker"""
+    from .core import VPNHost
+    from .aio_host import AsyncVPNHost
+    host_class = AsyncVPNHost if use_asyncio else VPNHost
+    nat_port_range = worker_port_range(index, count, port_range)
+    if log_level is not None:
+        # Interpréteur neuf (spawn): la journalisation du parent n'y est pas installée
+        setup_logging(log_level)
+    logger.info("Worker %d: ports NAT %d-%d", index, *nat_port_range)
+    if host_kwargs.get('udp_port'):
+        # Un port UDP par worker: un datagramme doit arriver au processus qui détient sa session
+        host_kwargs = dict(host_kwargs, udp_port=host_kwargs['udp_port'] + index)
+        if host_kwargs.get('udp_public_port'):
+            host_kwargs['udp_public_port'] += index
+    host = host_class(reuse_port=True, nat_port_range=nat_port_range, **host_kwargs)
+    try:
+        host.start()
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerSupervisor:
+    """Lance et surveille les processus workers; relance ceux qui s'arrêtent"""
+
+    def __init__(self, workers, use_asyncio=False, port_range=(20000, 60000),
+                 restart_delay=1.0, max_restart_delay=30.0, log_level=logging.INFO, **host_kwargs):
+        if host_kwargs.get('packet_backend') == 'tun':
+            # Une interface TUN ne peut pas être partagée entre processus
+            raise ValueError("Le backend TUN n'est pas supporté en mode multi-workers")
+        self.count = workers
+        self.use_asyncio = use_asyncio
+        self.port_range = port_range
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.host_kwargs = host_kwargs
+        self.log_level = log_level
+        self.processes = [None] * workers
+        self.started_at = [0.0] * workers
+        self.delays = [restart_delay] * workers
+        self.restart_at = [None] * workers
+        self.restarts = 0
+        self.running = False
+
+    def _spawn(self, index):
+        # spawn et non fork: le superviseur a déjà des threads (journalisation, administration)
+        # dont un verrou tenu au moment du fork resterait pris à jamais dans le worker
+        process = multiprocessing.get_context('spawn').Process(
+            target=run_worker, name=f"vpn-worker-{index}",
+            args=(index, self.count, self.use_asyncio, self.port_range, self.host_kwargs, self.log_level))
+        process.daemon = True
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        self.restart_at[index] = None
+
+    def start(self):
+        # Valider le découpage des ports avant de lancer quoi que ce soit
+        for index in range(self.count):
+            worker_port_range(index, self.count, self.port_range)
+        self.running = True
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info("%d workers VPN démarrés", self.count)
+
+    def check(self, now=None):
+        """Relance les workers arrêtés, avec un délai croissant s'ils s'arrêtent dès le démarrage"""
+        now = time.monotonic() if now is None else now
+        for index, process in enumerate(self.processes):
+            if process is None or process.is_alive():
+                continue
+            if self.restart_at[index] is None:
+                if now - self.started_at[index] > self.max_restart_delay:
+                    self.delays[index] = self.restart_delay
+                else:
+                    self.delays[index] = min(self.delays[index] * 2, self.max_restart_delay)
+                self.restart_at[index] = now + self.delays[index]
+                logger.warning("Worker %d arrêté (code %s), relance dans %.1fs", index, process.exitcode, self.delays[index])
+            elif now >= self.restart_at[index]:
+                self.restarts += 1
+                self._spawn(index)
+
+    def run(self):
+        """Démarre les workers et les surveille jusqu'à Ctrl+C"""
+        self.start()
+        try:
+            while self.running:
+                time.sleep(0.5)
+                self.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(5)
+
+    def alive(self):
+        return sum(1 for p in self.processes if p is not None and p.is_alive())